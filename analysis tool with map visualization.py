@@ -1,14 +1,3776 @@
-import tkinter as tk
-from tkinter import ttk, messagebox, filedialog
-from matplotlib.figure import Figure
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
+import time
+STARTUP_START = time.perf_counter()   # startup is timed up to the first drawn window
+try:
+    import tkinter as tk
+    from tkinter import ttk, messagebox, filedialog
+except ImportError:
+    # Batch mode also runs on servers without Tk
+    tk = None
+# matplotlib and folium are slow to import; they are imported where first used
 import numpy as np
 import pandas as pd
 import io
-import folium
-from folium import plugins
 import webbrowser
 import os
+import html
+import queue
+import threading
+import hashlib
+import json
+import shutil
+import tempfile
+import sys
+import argparse
+import csv
+import re
+import tracemalloc
+import sqlite3
+import cProfile
+import pstats
+import collections
+import bisect
+from contextlib import contextmanager
+from string import Template
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from pandas.api.types import union_categoricals
+
+# Treeview column ids and headings of the data preview for each analysis type
+TREE_COLUMNS = {
+    "yoy": [('customer', 'Customer'), ('current_cases', 'Current Cases'),
+            ('previous_cases', 'Previous Cases'), ('growth', 'Growth %')],
+    "target": [('customer', 'Customer'), ('current_cases', 'Current Cases'),
+               ('target', 'Target Cases'), ('achievement', 'Achievement %')],
+    "map": [('customer', 'Customer'), ('sales', 'Sales'),
+            ('latitude', 'Latitude'), ('longitude', 'Longitude')],
+    "timeseries": [('customer', 'Customer'), ('date', 'Date'), ('sales', 'Sales')],
+}
+
+# Column order and cell formats of the data preview for each analysis type
+PREVIEW_FORMATS = {
+    "yoy": [('Customer', '{}'), ('Current Sales', '{:,.0f}'),
+            ('Previous Sales', '{:,.0f}'), ('Growth', '{:,.1f}%')],
+    "target": [('Customer', '{}'), ('Current Sales', '{:,.0f}'),
+               ('Target', '{:,.0f}'), ('Achievement', '{:,.1f}%')],
+    "map": [('Customer', '{}'), ('Sales', '{:,.0f}'),
+            ('Latitude', '{:.4f}'), ('Longitude', '{:.4f}')],
+    "timeseries": [('Customer', '{}'), ('Date', '{:%Y-%m-%d}'), ('Sales', '{:,.0f}')],
+}
+
+
+class VirtualTreeview:
+    # Treeview that only holds the visible window of rows (plus a prefetch
+    # margin) and asks a fetch callback for rows as the user scrolls
+    PREFETCH_ROWS = 50
+
+    def __init__(self, master, columns):
+        self.frame = ttk.Frame(master)
+        self.scrollbar = ttk.Scrollbar(self.frame, command=self._on_scrollbar)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree = ttk.Treeview(self.frame, columns=columns, show='headings',
+                                 yscrollcommand=self._on_tree_scrolled)
+        self.tree.pack(fill=tk.BOTH, expand=True)
+        self.tree.bind('<Configure>', self._on_resize)
+
+        self.row_count = 0
+        self.fetch_rows = None
+        self.first = 0            # global index of the top visible row
+        self.visible_rows = 20
+        self.window = (0, 0)      # global rows currently inserted in the tree
+        self._rendering = False
+
+    def pack(self, **kwargs):
+        self.frame.pack(**kwargs)
+
+    def set_source(self, row_count, fetch_rows):
+        # fetch_rows(start, stop) returns a list of value tuples for that range
+        self.clear()
+        self.row_count = row_count
+        self.fetch_rows = fetch_rows
+        self._render()
+
+    def update_source(self, row_count, fetch_rows, changed=()):
+        # New version of the same rows: the scroll position is kept and only
+        # the changed rows (global indices) of the materialized window are
+        # formatted again; rows appended within reach are inserted by _render
+        self.row_count = row_count
+        self.fetch_rows = fetch_rows
+        start, stop = self.window
+        changed = np.asarray(changed, dtype=np.int64)
+        for index in changed[(changed >= start) & (changed < stop)].tolist():
+            self.tree.item(str(index), values=fetch_rows(index, index + 1)[0])
+        self._render()
+
+    def clear(self):
+        # Only the materialized window lives in Tk, so this is independent of
+        # the dataset size
+        children = self.tree.get_children()
+        if children:
+            self.tree.delete(*children)
+        self.row_count = 0
+        self.fetch_rows = None
+        self.first = 0
+        self.window = (0, 0)
+        self.scrollbar.set(0, 1)
+
+    def _margin(self):
+        return max(self.PREFETCH_ROWS, self.visible_rows)
+
+    def _on_resize(self, event):
+        style = ttk.Style()
+        row_height = int(style.lookup('Treeview', 'rowheight') or 20)
+        visible = max(1, (event.height - row_height) // row_height)
+        if visible != self.visible_rows:
+            self.visible_rows = visible
+            self._render()
+
+    def _on_scrollbar(self, action, amount, unit=None):
+        if action == 'moveto':
+            first = int(float(amount) * self.row_count)
+        elif unit == 'pages':
+            first = self.first + int(amount) * self.visible_rows
+        else:
+            first = self.first + int(amount)
+        self.scroll_to(first)
+
+    def scroll_to(self, first):
+        max_first = max(0, self.row_count - self.visible_rows)
+        self.first = min(max(0, first), max_first)
+        self._render()
+
+    def _on_tree_scrolled(self, lo, hi):
+        # The tree scrolled inside the materialized window (mouse wheel,
+        # keyboard navigation); translate back to the global position
+        if self._rendering or self.row_count == 0:
+            return
+        start, stop = self.window
+        self.first = start + int(round(float(lo) * (stop - start)))
+        self._update_scrollbar()
+        margin = self._margin() // 2
+        if ((self.first - start < margin and start > 0) or
+                (stop - (self.first + self.visible_rows) < margin and stop < self.row_count)):
+            self.tree.after_idle(self._render)
+
+    def _update_scrollbar(self):
+        if self.row_count == 0:
+            self.scrollbar.set(0, 1)
+            return
+        lo = self.first / self.row_count
+        hi = min(1.0, (self.first + self.visible_rows) / self.row_count)
+        self.scrollbar.set(lo, hi)
+
+    def _render(self):
+        if self.fetch_rows is None or self.row_count == 0:
+            self._update_scrollbar()
+            return
+
+        margin = self._margin()
+        new_start = max(0, self.first - margin)
+        new_stop = min(self.row_count, self.first + self.visible_rows + margin)
+        old_start, old_stop = self.window
+
+        self._rendering = True
+        try:
+            if new_stop <= old_start or new_start >= old_stop:
+                # No overlap with the current window, replace everything
+                children = self.tree.get_children()
+                if children:
+                    self.tree.delete(*children)
+                self._insert(new_start, new_stop, tk.END)
+            else:
+                # Only format and insert the rows that scrolled into view
+                stale = ([str(i) for i in range(old_start, new_start)] +
+                         [str(i) for i in range(new_stop, old_stop)])
+                if stale:
+                    self.tree.delete(*stale)
+                if new_start < old_start:
+                    self._insert(new_start, old_start, 0)
+                if new_stop > old_stop:
+                    self._insert(old_stop, new_stop, tk.END)
+            self.window = (new_start, new_stop)
+
+            self.tree.yview_moveto((self.first - new_start) / max(1, new_stop - new_start))
+        finally:
+            self._rendering = False
+        self._update_scrollbar()
+
+    def _insert(self, start, stop, index):
+        rows = self.fetch_rows(start, stop)
+        if index == 0:
+            # Insert in reverse so the block keeps its order at the top
+            for offset in range(len(rows) - 1, -1, -1):
+                self.tree.insert('', 0, iid=str(start + offset), values=rows[offset])
+        else:
+            for offset, values in enumerate(rows):
+                self.tree.insert('', tk.END, iid=str(start + offset), values=values)
+
+
+def format_preview_rows(df, formats, start, stop):
+    # Format a block of rows column by column rather than cell by cell
+    block = df.iloc[start:stop]
+    columns = []
+    for column, fmt in formats:
+        values = preview_values(block, column)
+        if fmt == '{}':
+            columns.append([str(v) for v in values])
+        else:
+            columns.append([fmt.format(v) for v in values])
+    return list(zip(*columns))
+
+
+def preview_values(block, column):
+    # Derived metrics are not stored; compute them for the visible rows only
+    for analysis_type, (metric, _, _) in DERIVED_METRICS.items():
+        if column == metric and column not in block:
+            return metric_values(block, analysis_type).tolist()
+    return block[column].tolist()
+
+
+# Standard column names for each analysis type, in import position order
+ANALYSIS_COLUMNS = {
+    "yoy": ['Customer', 'Current Sales', 'Previous Sales'],
+    "target": ['Customer', 'Current Sales', 'Target'],
+    "map": ['Customer', 'Sales', 'Latitude', 'Longitude'],
+    "timeseries": ['Customer', 'Date', 'Sales'],
+}
+ANALYSIS_LABELS = {"yoy": "YoY", "target": "target", "map": "map", "timeseries": "time series"}
+
+# Columns parsed as dates rather than numbers
+DATE_COLUMNS = {'Date'}
+
+# Analysis types whose imports may carry extra dimension columns (region,
+# channel, product, rep...) after the standard ones, used for drill-down
+DIMENSION_TYPES = ("yoy", "target")
+MAX_DIMENSIONS = 4
+# Dimensions with more members stay in the data but are left out of the cube
+MAX_DIMENSION_MEMBERS = 1000
+# Largest dense cube in values (cells including "All" slots x measures);
+# larger cubes only store occupied cells
+MAX_DENSE_CUBE_VALUES = 4000000
+DIMENSION_MISSING = "(blank)"
+
+# Time series granularities: months per period
+GRANULARITIES = {"Monthly": 1, "Quarterly": 3, "Yearly": 12}
+
+# Derived metric of each analysis type: (name, numerator, denominator)
+DERIVED_METRICS = {
+    "yoy": ('Growth', 'Current Sales', 'Previous Sales'),
+    "target": ('Achievement', 'Current Sales', 'Target'),
+}
+
+# Chart types of the Visualizations tab
+CHART_TYPES = ["bar", "line", "scatter", "pie"]
+
+# Pie chart ranges of the derived metric: (inner bin edges, labels, title)
+PIE_RANGES = {
+    "yoy": ([-10, 0, 10],
+            ['High Decline (<-10%)', 'Slight Decline (-10-0%)',
+             'Slight Growth (0-10%)', 'High Growth (>10%)'],
+            'Distribution of Customer Growth'),
+    "target": ([80, 90, 100, 110],
+               ['Below 80%', '80-90%', '90-100%', '100-110%', 'Above 110%'],
+               'Distribution of Target Achievement'),
+    "timeseries": ([-10, 0, 10],
+                   ['High Decline (<-10%)', 'Slight Decline (-10-0%)',
+                    'Slight Growth (0-10%)', 'High Growth (>10%)'],
+                   'Distribution of Customer YoY Growth (Latest Period)'),
+}
+
+# Range of the Top N slider and how long it must rest before redrawing
+TOP_N_SLIDER_MAX = 100
+TOP_N_SLIDER_DELAY_MS = 50
+
+# Import modes: replace the dataset, or merge by Customer replacing or
+# adding to the values of customers that already exist
+IMPORT_MODES = {"Replace": "replace", "Append (upsert)": "upsert", "Append (sum)": "sum"}
+
+# Data quality flags of a row (bit mask, see quality_flags)
+QUALITY_INVALID = 1     # Growth/Achievement cannot be calculated (zero denominator)
+QUALITY_OUTLIER = 2     # Growth/Achievement far outside the bulk of the customers
+QUALITY_DUPLICATE = 4   # customer name occurs more than once (ignoring case and spacing)
+QUALITY_LABELS = {QUALITY_INVALID: "no Growth/Achievement", QUALITY_OUTLIER: "outliers",
+                  QUALITY_DUPLICATE: "duplicate customers"}
+# Robust z-score (distance from the median in MADs) beyond which a value is
+# an outlier; Tukey fences at this multiple of the IQR when the MAD is zero
+QUALITY_Z_LIMIT = 3.5
+QUALITY_IQR_FACTOR = 1.5
+# Rows shown by the Analysis tab
+QUALITY_FILTERS = {"All rows": None, "Exclude flagged": 'exclude', "Flagged only": 'only'}
+
+# Largest series drawn as-is; denser ones are reduced before plotting
+MAX_CHART_BARS = 1000
+MAX_LINE_POINTS = 4000
+MAX_SCATTER_POINTS = 20000
+SCATTER_GRID = 400
+
+# Watch mode: how often the watched file is checked, and the least time
+# between two redraws of the analysis and charts while it keeps changing
+WATCH_POLL_MS = 2000
+WATCH_REDRAW_MS = 5000
+
+# Rows parsed per chunk during import
+CHUNK_ROWS = 50000
+
+# Number of customers above which the map uses a clustered, canvas-rendered layer
+MAP_CLUSTER_THRESHOLD = 2000
+
+# Heat map grid cells along the longer side of the data extent
+HEAT_GRID_CELLS = 200
+
+# Database backend: page cache per connection, resolution (percentage
+# points) of the Growth/Achievement histogram behind the median and sorted
+# charts, and the indexes of each analysis type's tables
+DATABASE_CACHE_MB = 256
+DATABASE_METRIC_STEP = 0.01
+DATABASE_INDEXES = {
+    "yoy": [('Customer',), ('Current Sales',)],
+    "target": [('Customer',), ('Current Sales',)],
+    "map": [('Customer',), ('Latitude', 'Longitude'), ('Sales',)],
+    "timeseries": [('Customer', 'Date'), ('Month',)],
+}
+# UPDATE ... FROM needs SQLite 3.33; older libraries merge with a correlated
+# subquery per column instead
+SQLITE_UPDATE_FROM = sqlite3.sqlite_version_info >= (3, 33, 0)
+# Row positions remembered for paging the preview of a table with gaps
+PREVIEW_MAX_ANCHORS = 10000
+
+# Region (choropleth) maps: boundaries are simplified to this fraction of the
+# regions' extent for display; customers are assigned on the full geometry,
+# testing at most REGION_PAIR_CHUNK point/edge pairs at once
+REGION_SIMPLIFY_FRACTION = 0.0005
+REGION_PAIR_CHUNK = 4000000
+REGION_NAME_PROPERTIES = ('name', 'NAME', 'Name', 'region', 'Region', 'NAME_1', 'state', 'admin')
+REGION_OUTSIDE = "(outside all regions)"
+
+# Builds each clustered marker in the browser from a compact data row:
+# [lat, lon, radius, customer, formatted sales]
+CLUSTER_MARKER_CALLBACK = """
+    var callback = function (row) {
+        var marker = L.circleMarker(new L.LatLng(row[0], row[1]),
+            {radius: row[2], color: 'blue', fill: true, fillOpacity: 0.6});
+        marker.bindTooltip(row[3] + ': ' + row[4]);
+        marker.bindPopup("<div style='width:200px'><b>Customer:</b> " + row[3] +
+            "<br><b>Sales:</b> " + row[4] + "<br><b>Location:</b> " +
+            row[0].toFixed(4) + ", " + row[1].toFixed(4) + "</div>", {maxWidth: 300});
+        return marker;
+    };
+"""
+
+# Tiled map mode: customers are ordered by their Web Mercator tile at
+# TILE_MAX_ZOOM (Morton order, so every coarser tile is one contiguous range).
+# Up to CLUSTER_MAX_ZOOM a tile holding more than TILE_POINT_LIMIT customers
+# is sent as a grid of 2**CLUSTER_CELL_BITS x 2**CLUSTER_CELL_BITS clusters.
+TILE_MAX_ZOOM = 20
+CLUSTER_CELL_BITS = 3
+CLUSTER_MAX_ZOOM = TILE_MAX_ZOOM - CLUSTER_CELL_BITS
+# Only every third cluster level is kept; tiles of the levels in between
+# coarsen their slice of the next finer kept level (at most 4**2 * 64 cells)
+CLUSTER_LEVEL_STRIDE = 3
+TILE_POINT_LIMIT = 500
+MERCATOR_MAX_LAT = 85.05112878
+TILE_PATH = re.compile(r"^/tiles/([0-9a-f]+)/(\d+)/(\d+)/(\d+)\.json$")
+
+# Loads the tiles in view after every pan/zoom and drops the others
+TILED_MAP_SCRIPT = Template("""
+(function () {
+    var map = $map;
+    var renderer = L.canvas();
+    var layers = {};
+    function addTile(key, data) {
+        var group = L.layerGroup();
+        (data.clusters || []).forEach(function (c) {
+            var marker = L.circleMarker([c[0], c[1]], {renderer: renderer,
+                radius: 6 + 3 * Math.log10(c[2]), color: 'darkred', fill: true, fillOpacity: 0.5});
+            marker.bindTooltip(c[2].toLocaleString() + ' customers: ' + c[3]);
+            marker.on('click', function () { map.setView([c[0], c[1]], map.getZoom() + 2); });
+            group.addLayer(marker);
+        });
+        (data.points || []).forEach(function (row) {
+            var marker = L.circleMarker([row[0], row[1]], {renderer: renderer,
+                radius: row[2], color: 'blue', fill: true, fillOpacity: 0.6});
+            marker.bindTooltip(row[3] + ': ' + row[4]);
+            marker.bindPopup("<div style='width:200px'><b>Customer:</b> " + row[3] +
+                "<br><b>Sales:</b> " + row[4] + "<br><b>Location:</b> " +
+                row[0].toFixed(4) + ", " + row[1].toFixed(4) + "</div>", {maxWidth: 300});
+            group.addLayer(marker);
+        });
+        layers[key] = group.addTo(map);
+    }
+    function refresh() {
+        var zoom = map.getZoom(), n = Math.pow(2, zoom);
+        var bounds = map.getPixelBounds();
+        var min = bounds.min.divideBy(256).floor(), max = bounds.max.divideBy(256).floor();
+        var wanted = {};
+        for (var x = min.x; x <= max.x; x++) {
+            for (var y = Math.max(min.y, 0); y <= Math.min(max.y, n - 1); y++) {
+                var key = zoom + '/' + (((x % n) + n) % n) + '/' + y;
+                wanted[key] = true;
+                if (!(key in layers)) {
+                    layers[key] = null;
+                    fetch('/tiles/$version/' + key + '.json').then(function (response) {
+                        return response.json();
+                    }).then(function (key, data) {
+                        if (key in layers) addTile(key, data);  // still in view
+                    }.bind(null, key));
+                }
+            }
+        }
+        for (var old in layers) {
+            if (!wanted[old]) {
+                if (layers[old]) map.removeLayer(layers[old]);
+                delete layers[old];
+            }
+        }
+    }
+    map.on('moveend', refresh);
+    refresh();
+})();
+""")
+
+# Delimited text (pasted data, CSV/TXT files): candidate delimiters in order
+# of preference and how much of the text is sniffed
+TEXT_DELIMITERS = ['\t', ';', ',', '|']
+SNIFF_LINES = 50
+SNIFF_BYTES = 65536
+# Characters around the digits of formatted numbers: currency and percent
+# marks, brackets, grouping spaces and apostrophes (plus signs when sniffing)
+NUMBER_DECORATION = r"[\s\u00a0'()$\u20ac\u00a3\u00a5%+]"
+NUMBER_NOISE = re.compile(r"[\s\u00a0'()$\u20ac\u00a3\u00a5%+\-\u2212]")
+NUMBER_SHAPE = re.compile(r"\d[\d.,]*")
+# Rejected rows kept with the import summary for reporting
+MAX_REJECTED_ROWS = 1000
+
+# Largest change float32 storage may make to a value (default: half a cent)
+FLOAT32_TOLERANCE = {'Latitude': 1e-5, 'Longitude': 1e-5}
+
+
+class DataFormatError(ValueError):
+    # Raised when imported data does not fit the selected analysis type
+    pass
+
+
+class TaskCancelled(Exception):
+    pass
+
+
+class BackgroundTask:
+    # Handle passed to work functions for progress reporting and cancellation
+    def __init__(self, kind, events):
+        self.kind = kind
+        self.events = events
+        self.cancel_event = threading.Event()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise TaskCancelled()
+
+    def report(self, fraction, message=""):
+        self.check_cancelled()
+        if self.events is not None:
+            self.events.put(('progress', self, (fraction, message)))
+
+
+class TaskRunner:
+    # Runs heavy work on a thread pool and marshals results back to the Tk
+    # main loop with root.after, so callbacks always run on the UI thread
+    POLL_MS = 50
+
+    def __init__(self, root, max_workers=2):
+        self.root = root
+        self.executor = ThreadPoolExecutor(max_workers=max_workers,
+                                           thread_name_prefix='sales-worker')
+        self.events = queue.Queue()
+        self.active = {}          # kind -> (task, callbacks)
+        self._polling = False
+
+    def submit(self, kind, fn, *args, on_done=None, on_error=None, on_progress=None):
+        # A new task of the same kind supersedes the running one
+        self.cancel(kind)
+        task = BackgroundTask(kind, self.events)
+        self.active[kind] = (task, on_done, on_error, on_progress)
+        self.executor.submit(self._run, task, fn, args)
+        if not self._polling:
+            self._polling = True
+            self.root.after(self.POLL_MS, self._poll)
+        return task
+
+    def cancel(self, kind=None):
+        kinds = list(self.active) if kind is None else [kind]
+        for k in kinds:
+            if k in self.active:
+                self.active[k][0].cancel()
+
+    def busy(self):
+        return bool(self.active)
+
+    def running(self, kind):
+        return kind in self.active
+
+    def shutdown(self):
+        self.cancel()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, task, fn, args):
+        try:
+            task.check_cancelled()
+            result = DIAGNOSTICS.run(task.kind, fn, task, *args)
+            task.check_cancelled()
+            self.events.put(('done', task, result))
+        except TaskCancelled:
+            self.events.put(('cancelled', task, None))
+        except Exception as e:
+            self.events.put(('error', task, e))
+
+    def _poll(self):
+        pending = []
+        while True:
+            try:
+                pending.append(self.events.get_nowait())
+            except queue.Empty:
+                break
+        
+        # Reschedule before dispatching so results keep flowing while a
+        # callback shows a modal dialog
+        self._polling = bool(self.active)
+        if self._polling:
+            self.root.after(self.POLL_MS, self._poll)
+        
+        for event, task, payload in pending:
+            entry = self.active.get(task.kind)
+            if entry is None or entry[0] is not task:
+                continue  # superseded or cancelled task
+            _, on_done, on_error, on_progress = entry
+            if event == 'progress':
+                if on_progress and not task.cancelled:
+                    on_progress(task, *payload)
+                continue
+            del self.active[task.kind]
+            if event == 'done' and on_done:
+                on_done(payload)
+            elif event == 'error' and on_error:
+                on_error(payload)
+            elif event == 'cancelled' and on_progress:
+                on_progress(task, 0, "Cancelled")
+
+
+def normalize_columns(df, analysis_type, source):
+    # Rename columns based on analysis type and position; extra columns of
+    # dimension types keep their header as dimension name unless it is a
+    # standard column or a calculated metric (Growth/Achievement are not
+    # stored, so a column of that name would be read instead of them)
+    columns = ANALYSIS_COLUMNS[analysis_type]
+    if len(df.columns) < len(columns):
+        raise DataFormatError(f"{source} must have at least {len(columns)} columns "
+                              f"for {ANALYSIS_LABELS[analysis_type]} analysis")
+    width = import_width(analysis_type, len(df.columns))
+    taken = columns + [metric for metric, _, _ in DERIVED_METRICS.values()]
+    names = columns + dimension_names(df.columns[len(columns):width], taken)
+    return df.iloc[:, :width].set_axis(names, axis=1)
+
+
+def import_width(analysis_type, n_columns):
+    # Number of leading source columns to read
+    needed = len(ANALYSIS_COLUMNS[analysis_type])
+    if analysis_type in DIMENSION_TYPES:
+        return min(n_columns, needed + MAX_DIMENSIONS)
+    return needed
+
+
+def dimension_names(headers, taken):
+    names = []
+    for i, header in enumerate(headers, 1):
+        name = str(header).strip()
+        if not name or name.startswith('Unnamed:') or name == 'None' or name in taken or name in names:
+            name = f"Dimension {i}"
+        names.append(name)
+    return names
+
+
+def process_frame(df, analysis_type, number_format=None, rejected=None):
+    # Convert numeric columns to compact dtypes and calculate the derived
+    # metric. Rows that cannot be used are dropped; if a list is given, a
+    # frame describing them (position in df, reason, raw values) is appended.
+    thousands, decimal = number_format or (',', '.')
+    columns = ANALYSIS_COLUMNS[analysis_type]
+    raw = {column: df[column] for column in columns}
+    reasons = np.full(len(df), None, dtype=object)
+
+    def reject(mask, reason):
+        reasons[mask & (reasons == None)] = reason  # keep the first reason
+
+    customers = df['Customer']
+    reject(customers.isna().to_numpy(), "Customer is missing")
+    df['Customer'] = customers.astype(str).astype('category')
+
+    for column in columns[1:]:
+        blank = df[column].isna().to_numpy()
+        reject(blank, f"{column} is missing")
+        if column in DATE_COLUMNS:
+            dates = pd.to_datetime(df[column], errors='coerce').to_numpy(dtype='datetime64[ns]')
+            reject(np.isnat(dates), f"{column} is not a date")
+            df[column] = dates
+            continue
+        values = parse_numbers(df[column], thousands, decimal)
+        reject(np.isnan(values), f"{column} is not a number")
+        df[column] = downcast_float(values, FLOAT32_TOLERANCE.get(column, 0.005))
+
+    for column in df.columns[len(columns):]:
+        # Dimension columns
+        values = df[column]
+        df[column] = values.where(values.notna(), DIMENSION_MISSING).astype(str).astype('category')
+
+    if analysis_type in DERIVED_METRICS:
+        # The metric is not stored, only checked that it can be calculated.
+        # A zero denominator is kept (no Growth/Achievement, flagged by
+        # quality_flags) rather than rejected.
+        metric, _, denominator = DERIVED_METRICS[analysis_type]
+        zero = df[denominator].to_numpy() == 0
+        reject(np.isnan(metric_values(df, analysis_type)) & ~zero, f"{metric} cannot be calculated")
+
+    # Drop (and describe) the rows that failed conversion
+    missing = reasons != None
+    if missing.any():
+        if rejected is not None:
+            positions = np.flatnonzero(missing)
+            rejected.append(pd.DataFrame({
+                'Row': positions, 'Reason': reasons[positions],
+                **{column: raw_text(values.iloc[positions]) for column, values in raw.items()}}))
+        df = df[~missing]
+    return df
+
+
+def raw_text(values):
+    # Source cells as text for error reports; missing cells are blank
+    return np.where(values.notna().to_numpy(), values.astype(str).to_numpy(), '')
+
+
+def metric_from_columns(numerator, denominator, analysis_type):
+    num = np.asarray(numerator, dtype=np.float64)
+    den = np.asarray(denominator, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if analysis_type == "yoy":
+            values = (num - den) / den * 100
+        else:
+            values = num / den * 100
+    # Nothing to compare against: NaN (left out of averages, bins and
+    # charts) rather than an infinite percentage
+    values[den == 0] = np.nan
+    # Percentages are only ever shown to one decimal place
+    return values.astype(np.float32)
+
+
+def metric_values(df, analysis_type):
+    # Growth/Achievement are derived on demand from the stored columns, so the
+    # dataset never holds a column of ratios
+    metric, numerator, denominator = DERIVED_METRICS[analysis_type]
+    return metric_from_columns(df[numerator].to_numpy(), df[denominator].to_numpy(), analysis_type)
+
+
+def memory_footprint(df):
+    # Bytes held per column, including the string tables of categoricals
+    return {column: int(size) for column, size in df.memory_usage(index=False, deep=True).items()}
+
+
+def footprint_text(df):
+    footprint = memory_footprint(df)
+    columns = ", ".join(f"{column} {size / 2 ** 20:,.1f} MB" for column, size in footprint.items())
+    return f"{len(df):,} records in {sum(footprint.values()) / 2 ** 20:,.1f} MB ({columns})"
+
+
+def downcast_float(values, tolerance):
+    # Store as float32 when that changes no value by more than the tolerance
+    compact = values.astype(np.float32)
+    with np.errstate(invalid='ignore'):
+        error = np.abs(compact.astype(np.float64) - values)
+    if not np.any(error > tolerance):
+        return compact
+    return values
+
+
+def sniff_text_format(sample):
+    # (delimiter, thousands, decimal) of delimited text, judged from its
+    # first lines: the delimiter that splits the most lines into the same
+    # number (>1) of fields wins, earlier candidates on ties
+    lines = [line for line in sample.splitlines()[:SNIFF_LINES] if line.strip()]
+    best_sep, best_score, best_rows = '\t', 0.0, []
+    for sep in TEXT_DELIMITERS:
+        rows = list(csv.reader(lines, delimiter=sep))
+        counts = [len(row) for row in rows]
+        width = max(set(counts), key=counts.count) if counts else 0
+        if width < 2:
+            continue
+        score = counts.count(width) / len(counts)
+        if score > best_score:
+            best_sep, best_score, best_rows = sep, score, rows
+    # Numbers are looked for in every field but the first (customer) column
+    fields = [field for row in best_rows[1:] for field in row[1:]]
+    thousands, decimal = sniff_number_format(fields)
+    return best_sep, thousands, decimal
+
+
+def sniff_number_format(fields):
+    # Vote on the decimal separator using only unambiguous numbers: with
+    # both marks the last one is the decimal, a mark used twice separates
+    # thousands, and a single mark not followed by exactly 3 digits is the
+    # decimal. "1,234" on its own proves nothing.
+    votes = {'.': 0, ',': 0}
+    for field in fields:
+        digits = NUMBER_NOISE.sub('', field)
+        if not digits or not NUMBER_SHAPE.fullmatch(digits):
+            continue
+        dot, comma = digits.rfind('.'), digits.rfind(',')
+        if dot >= 0 and comma >= 0:
+            votes['.' if dot > comma else ','] += 1
+            continue
+        mark = '.' if dot >= 0 else ',' if comma >= 0 else None
+        if mark is None:
+            continue
+        if digits.count(mark) > 1:
+            votes[',' if mark == '.' else '.'] += 1
+        elif len(digits) - digits.index(mark) - 1 != 3:
+            votes[mark] += 1
+    decimal = ',' if votes[','] > votes['.'] else '.'
+    return ('.' if decimal == ',' else ','), decimal
+
+
+def parse_numbers(values, thousands=',', decimal='.'):
+    # float64 array of a column. Text such as "1,234", "(500)", "$ 1 200",
+    # "12%", "500-" or "−5" is normalised first; cells that still do not
+    # parse come back as NaN for the caller to report.
+    if pd.api.types.is_numeric_dtype(values.dtype) and not pd.api.types.is_bool_dtype(values.dtype):
+        return values.to_numpy(dtype=np.float64)
+    present = values.notna().to_numpy()
+    if decimal == '.':
+        # Plain numbers (and numeric cells of mixed Excel columns) parse directly
+        numbers = pd.to_numeric(values, errors='coerce').to_numpy(dtype=np.float64)
+        retry = present & np.isnan(numbers)
+    else:
+        numbers = np.full(len(values), np.nan)
+        retry = present
+    if retry.any():
+        text = values[retry].astype(str).str.strip().str.replace('\u2212', '-', regex=False)
+        negative = ((text.str.startswith('(') & text.str.endswith(')')) | text.str.endswith('-')).to_numpy()
+        text = text.str.replace(NUMBER_DECORATION, '', regex=True).str.replace(r'-$', '', regex=True)
+        text = text.str.replace(thousands, '', regex=False)
+        if decimal != '.':
+            text = text.str.replace(decimal, '.', regex=False)
+        cleaned = pd.to_numeric(text, errors='coerce').to_numpy(dtype=np.float64)
+        cleaned[negative] = -np.abs(cleaned[negative])
+        numbers[retry] = cleaned
+    return numbers
+
+
+def iter_csv_chunks(source, analysis_type, label, sep=',', chunk_rows=None, number_format=None):
+    # Yield (chunk, fraction read) from a path or text buffer, parsing only
+    # the columns the analysis needs. Numbers in the given (thousands,
+    # decimal) format are parsed by the C reader; anything else is left as
+    # text for parse_numbers.
+    chunk_rows = chunk_rows or CHUNK_ROWS
+    needed = len(ANALYSIS_COLUMNS[analysis_type])
+    if isinstance(source, str):
+        handle = open(source, 'rb')
+        total = max(1, os.path.getsize(source))
+    else:
+        handle = source
+        total = max(1, len(source.getvalue()))
+    try:
+        header = pd.read_csv(handle, sep=sep, nrows=0).columns
+        if len(header) < needed:
+            raise DataFormatError(f"{label} must have at least {needed} columns "
+                                  f"for {ANALYSIS_LABELS[analysis_type]} analysis")
+        handle.seek(0)
+        width = import_width(analysis_type, len(header))
+        thousands, decimal = number_format or (',', '.')
+        reader = pd.read_csv(handle, sep=sep, usecols=range(width), chunksize=chunk_rows,
+                             thousands=None if thousands == sep else thousands, decimal=decimal)
+        for chunk in reader:
+            yield chunk, min(1.0, handle.tell() / total)
+    finally:
+        if isinstance(source, str):
+            handle.close()
+
+
+def iter_excel_chunks(file_path, analysis_type, chunk_rows=None, sheet=None):
+    # Stream a worksheet (the first one by default) through openpyxl's
+    # read-only row iterator
+    chunk_rows = chunk_rows or CHUNK_ROWS
+    needed = len(ANALYSIS_COLUMNS[analysis_type])
+    if file_path.lower().endswith('.xls'):
+        # Legacy .xls files are not supported by openpyxl and are read whole;
+        # the format itself holds at most 65,536 rows per sheet
+        df = pd.read_excel(file_path, sheet_name=0 if sheet is None else sheet)
+        normalize_columns(df, analysis_type, "Excel file")
+        width = import_width(analysis_type, len(df.columns))
+        for start in range(0, max(1, len(df)), chunk_rows):
+            yield df.iloc[start:start + chunk_rows, :width], min(1.0, (start + chunk_rows) / max(1, len(df)))
+        return
+
+    import openpyxl
+    workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0] if sheet is None else workbook[sheet]
+        rows = sheet.iter_rows(values_only=True)
+        header = next(rows, ())
+        if all(cell is None for cell in header) and len(workbook.sheetnames) > 1:
+            return  # Blank sheet (e.g. a spare tab) in a multi-sheet workbook
+        if len(header) < needed:
+            raise DataFormatError(f"Excel file must have at least {needed} columns "
+                                  f"for {ANALYSIS_LABELS[analysis_type]} analysis")
+        width = import_width(analysis_type, len(header))
+        header = list(header[:width])
+        total = max(1, (sheet.max_row or 0) - 1)
+
+        batch = []
+        read = 0
+        for row in rows:
+            row = row[:width]
+            if len(row) < width:
+                row = row + (None,) * (width - len(row))
+            batch.append(row)
+            if len(batch) == chunk_rows:
+                read += len(batch)
+                yield pd.DataFrame.from_records(batch, columns=header), min(1.0, read / total)
+                batch = []
+        if batch or read == 0:
+            yield pd.DataFrame.from_records(batch, columns=header), 1.0
+    finally:
+        workbook.close()
+
+
+def iter_file_chunks(file_path, analysis_type, sheet=None):
+    # Returns (chunks, number format)
+    if file_path.lower().endswith(('.csv', '.txt')):
+        sep, thousands, decimal = sniff_file_format(file_path)
+        return (iter_csv_chunks(file_path, analysis_type, "CSV file", sep,
+                                number_format=(thousands, decimal)), (thousands, decimal))
+    return iter_excel_chunks(file_path, analysis_type, sheet=sheet), None
+
+
+def import_sheets(file_path):
+    # Worksheets to import from a file; text files have a single part (None)
+    if file_path.lower().endswith(('.csv', '.txt')):
+        return [None]
+    if file_path.lower().endswith('.xls'):
+        with pd.ExcelFile(file_path) as book:
+            return list(book.sheet_names)
+    import openpyxl
+    workbook = openpyxl.load_workbook(file_path, read_only=True)
+    try:
+        return list(workbook.sheetnames)
+    finally:
+        workbook.close()
+
+
+def sniff_file_format(file_path):
+    with open(file_path, 'rb') as f:
+        sample = f.read(SNIFF_BYTES).decode('utf-8', errors='replace')
+    if len(sample) == SNIFF_BYTES:
+        sample = sample[:sample.rfind('\n') + 1] or sample  # drop the cut-off line
+    return sniff_text_format(sample)
+
+
+def ingest_chunks(task, chunks, analysis_type, label, number_format=None):
+    parts, summary = coerce_chunks(task, chunks, analysis_type, label, number_format)
+    task.report(0.95, "Combining chunks...")
+    with DIAGNOSTICS.stage('import.combine', summary.count):
+        df = concat_chunks(parts, analysis_type)
+    return df, summary
+
+
+def coerce_chunks(task, chunks, analysis_type, label, number_format=None, sink=None):
+    # Normalize and coerce each chunk as it arrives and keep only the compact
+    # result, so peak memory follows the chunk size rather than the source.
+    # With a sink (e.g. a database writer) chunks are passed on, not kept.
+    summary = RunningSummary(analysis_type)
+    parts = []
+    read_seconds = coerce_seconds = 0.0
+    raw_rows = 0
+    chunks = iter(chunks)
+    while True:
+        start = time.perf_counter()
+        try:
+            raw, fraction = next(chunks)
+        except StopIteration:
+            break
+        parsed = time.perf_counter()
+        rejected = []
+        chunk = process_frame(normalize_columns(raw, analysis_type, label), analysis_type,
+                              number_format, rejected)
+        summary.update(chunk)
+        for frame in rejected:
+            # Source line numbers: 1-based, after the header line
+            summary.reject(frame.assign(Row=frame['Row'] + raw_rows + 2))
+        if sink is not None:
+            sink(chunk)
+        else:
+            parts.append(chunk)
+        raw_rows += len(raw)
+        read_seconds += parsed - start
+        coerce_seconds += time.perf_counter() - parsed
+        task.report(0.9 * fraction, f"Read {summary.count:,} records...")
+    DIAGNOSTICS.record('import.read', read_seconds, raw_rows)
+    DIAGNOSTICS.record('import.coerce', coerce_seconds, raw_rows)
+    return parts, summary
+
+
+def concat_chunks(parts, analysis_type):
+    if not parts:
+        return pd.DataFrame(columns=ANALYSIS_COLUMNS[analysis_type])
+    if len(parts) == 1:
+        part = parts[0]
+        # reset_index copies every column, which would read a memory-mapped
+        # cached frame fully into memory
+        if part.index.equals(pd.RangeIndex(len(part))):
+            return part
+        return part.reset_index(drop=True)
+    data = {}
+    for column in parts[0].columns:
+        if isinstance(parts[0][column].dtype, pd.CategoricalDtype):
+            data[column] = union_categoricals([part[column] for part in parts])
+        else:
+            data[column] = np.concatenate([part[column].to_numpy() for part in parts])
+    return pd.DataFrame(data)
+
+
+def load_file_task(task, file_path, analysis_type, cache=None, jobs=None):
+    return load_files_task(task, [file_path], analysis_type, cache, jobs)
+
+
+def load_files_task(task, file_paths, analysis_type, cache=None, jobs=None):
+    # Import every worksheet of every file. Sheets are parsed in worker
+    # processes (openpyxl holds the GIL) and their chunks are concatenated
+    # once at the end; jobs=1 reads them in this process.
+    task.report(0.0, "Checking cache..." if cache is not None else "Listing sheets...")
+    parts = {}      # (file, sheet) -> (chunks, summary)
+    sources = {}    # (file, sheet) -> label for messages and rejected rows
+    keys = {}       # file -> cache key of files that were not cached
+    pending = []
+    for i, file_path in enumerate(file_paths):
+        name = os.path.basename(file_path)
+        if cache is not None:
+            try:
+                key = cache.key(file_path, analysis_type)
+                cached = cache.load(key)
+            except OSError:
+                key = cached = None
+            if cached is not None:
+                parts[i, 0] = ([cached[0]], cached[1])
+                sources[i, 0] = name
+                continue
+            keys[i] = key
+        for j, sheet in enumerate(import_sheets(file_path)):
+            sources[i, j] = name if sheet is None else f"{name} [{sheet}]"
+            pending.append(((i, j), file_path, sheet))
+
+    workers = min(len(pending), jobs or os.cpu_count() or 1)
+    if workers > 1:
+        task.report(0.0, f"Reading {len(pending)} sheets...")
+        with DIAGNOSTICS.stage('import.parallel_read'):
+            parts.update(read_parts_parallel(task, pending, sources, analysis_type, workers))
+    else:
+        for slot, file_path, sheet in pending:
+            task.report(0.0, f"Reading {sources[slot]}...")
+            parts[slot] = read_import_part(file_path, sheet, analysis_type, task)
+
+    # Blank sheets add nothing; every other part must share the columns
+    slots = sorted(parts)
+    multiple = len(slots) > 1
+    summary = RunningSummary(analysis_type)
+    chunks = []
+    columns = None
+    for slot in slots:
+        part_chunks, part_summary = parts[slot]
+        if multiple:
+            part_summary.rejected_rows = [{'Source': sources[slot], **row}
+                                          for row in part_summary.rejected_rows]
+        summary.combine(part_summary)
+        if not part_summary.count and not part_summary.rejected:
+            continue
+        if columns is None:
+            columns, first = list(part_chunks[0].columns), sources[slot]
+        elif list(part_chunks[0].columns) != columns:
+            raise DataFormatError(f"{sources[slot]} does not have the same columns as {first}")
+        chunks.extend(part_chunks)
+    if not chunks and slots:
+        chunks = parts[slots[0]][0]
+
+    task.report(0.95, "Combining sheets..." if multiple else "Combining chunks...")
+    with DIAGNOSTICS.stage('import.combine', summary.count):
+        df = concat_chunks(chunks, analysis_type)
+
+    if keys:
+        task.report(0.97, "Writing cache...")
+        store_file_parts(cache, keys, parts, df, analysis_type)
+    task.report(1.0, f"Loaded {len(df):,} records")
+    return df, summary
+
+
+def read_import_part(file_path, sheet, analysis_type, task=None):
+    # Read and coerce one worksheet (or text file); returns (chunks, summary).
+    # Also the entry point of worker processes, which get no task.
+    task = task or BackgroundTask('import', None)
+    chunks, number_format = iter_file_chunks(file_path, analysis_type, sheet)
+    return coerce_chunks(task, chunks, analysis_type, "Excel file", number_format)
+
+
+def read_parts_parallel(task, pending, sources, analysis_type, workers):
+    results = {}
+    calls = [(slot, (file_path, sheet, analysis_type)) for slot, file_path, sheet in pending]
+    for slot, future in iter_process_results(task, read_import_part, calls, workers):
+        try:
+            results[slot] = future.result()
+        except DataFormatError as e:
+            raise DataFormatError(f"{sources[slot]}: {e}") from None
+        task.report(0.9 * len(results) / len(pending),
+                    f"Read {len(results)} of {len(pending)} sheets...")
+    return results
+
+
+def iter_process_results(task, fn, calls, workers):
+    # Run fn(*args) for each (key, args) in worker processes and yield
+    # (key, future) as they finish
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        futures = {executor.submit(fn, *args): key for key, args in calls}
+        running = set(futures)
+        while running:
+            # Wake up regularly so a cancelled task stops waiting
+            task.check_cancelled()
+            done, running = wait(running, timeout=0.2, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield futures[future], future
+    except BaseException:
+        # Cancelled or failed: drop queued calls without waiting for running ones
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    executor.shutdown()
+
+
+def store_file_parts(cache, keys, parts, df, analysis_type):
+    # Cache each newly read file as its own slice of the combined frame
+    start = 0
+    for i in sorted({slot[0] for slot in parts}):
+        file_slots = [slot for slot in sorted(parts) if slot[0] == i]
+        rows = sum(len(chunk) for slot in file_slots for chunk in parts[slot][0])
+        if keys.get(i) is not None:
+            summary = RunningSummary(analysis_type)
+            for slot in file_slots:
+                summary.combine(parts[slot][1])
+            try:
+                cache.store(keys[i], df.iloc[start:start + rows].reset_index(drop=True), summary)
+            except OSError:
+                pass  # The cache is only an accelerator
+        start += rows
+
+
+def load_pasted_task(task, data, analysis_type):
+    task.report(0.0, "Parsing pasted data...")
+    # Delimiter and number format are sniffed once, then parsed in one pass
+    sep, thousands, decimal = sniff_text_format(data[:SNIFF_BYTES])
+    try:
+        chunks = iter_csv_chunks(io.StringIO(data), analysis_type, "Pasted data", sep=sep,
+                                 number_format=(thousands, decimal))
+        df, summary = ingest_chunks(task, chunks, analysis_type, "Pasted data", (thousands, decimal))
+    except (DataFormatError, TaskCancelled):
+        raise
+    except Exception:
+        raise DataFormatError("Could not parse the pasted data. Please check the format.")
+    task.report(1.0, f"Loaded {len(df):,} records")
+    return df, summary
+
+
+class DatasetCache:
+    # Normalized, typed frames stored column by column as .npy files so they
+    # can be memory-mapped back. Entries are keyed by content hash and
+    # analysis type; a fingerprint index maps path + size + mtime to the
+    # content hash so unchanged files are not re-hashed on every open.
+    VERSION = 6
+    MAX_FINGERPRINTS = 1000
+
+    def __init__(self, directory=None, budget_mb=None):
+        self.directory = directory or os.environ.get(
+            'SALES_TOOL_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.sales_tool_cache'))
+        if budget_mb is None:
+            budget_mb = float(os.environ.get('SALES_TOOL_CACHE_MB', 1024))
+        self.budget_bytes = int(budget_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+
+    def key(self, file_path, analysis_type):
+        stat = os.stat(file_path)
+        fingerprint = f"{os.path.abspath(file_path)}|{stat.st_size}|{stat.st_mtime_ns}"
+        index = self._read_index()
+        content_hash = index.get(fingerprint)
+        if content_hash is None:
+            content_hash = file_content_hash(file_path)
+            with self._lock:
+                index = self._read_index()
+                index[fingerprint] = content_hash
+                # Keep only the most recently added fingerprints
+                while len(index) > self.MAX_FINGERPRINTS:
+                    del index[next(iter(index))]
+                self._write_json(os.path.join(self.directory, 'fingerprints.json'), index)
+        return hashlib.sha1(f"{content_hash}|{analysis_type}|{self.VERSION}".encode()).hexdigest()
+
+    def load(self, key):
+        entry = os.path.join(self.directory, key)
+        manifest_path = os.path.join(entry, 'manifest.json')
+        try:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+            data = {}
+            for i, column in enumerate(manifest['columns']):
+                values = np.load(os.path.join(entry, f'col{i}.npy'), mmap_mode='r')
+                if column['kind'] == 'category':
+                    categories = np.load(os.path.join(entry, f'col{i}_categories.npy'))
+                    values = pd.Categorical.from_codes(values, categories=pd.Index(categories, dtype=object))
+                data[column['name']] = values
+            # Mark as recently used for LRU eviction
+            os.utime(manifest_path)
+        except (OSError, ValueError, KeyError):
+            return None
+        return pd.DataFrame(data, copy=False), RunningSummary.from_state(manifest['summary'])
+
+    def store(self, key, df, summary):
+        os.makedirs(self.directory, exist_ok=True)
+        entry = os.path.join(self.directory, key)
+        staging = tempfile.mkdtemp(prefix=key + '.', dir=self.directory)
+        try:
+            columns = []
+            for i, name in enumerate(df.columns):
+                values = df[name]
+                if isinstance(values.dtype, pd.CategoricalDtype):
+                    # Slices of a multi-file import share the combined categories
+                    values = values.cat.remove_unused_categories()
+                    np.save(os.path.join(staging, f'col{i}.npy'), values.cat.codes.to_numpy())
+                    np.save(os.path.join(staging, f'col{i}_categories.npy'),
+                            np.asarray(values.cat.categories, dtype=str))
+                    columns.append({'name': name, 'kind': 'category'})
+                else:
+                    np.save(os.path.join(staging, f'col{i}.npy'), values.to_numpy())
+                    columns.append({'name': name, 'kind': 'array'})
+            self._write_json(os.path.join(staging, 'manifest.json'),
+                             {'columns': columns, 'rows': len(df), 'summary': summary.state()})
+            self._replace_entry(entry, staging)
+        except OSError:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        self.evict()
+
+    def load_arrays(self, key):
+        # Named arrays plus JSON metadata, e.g. region geometry
+        entry = os.path.join(self.directory, key)
+        manifest_path = os.path.join(entry, 'manifest.json')
+        try:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+            arrays = {name: np.load(os.path.join(entry, f'{name}.npy')) for name in manifest['arrays']}
+            os.utime(manifest_path)
+        except (OSError, ValueError, KeyError):
+            return None
+        return arrays, manifest['meta']
+
+    def store_arrays(self, key, arrays, meta=None):
+        os.makedirs(self.directory, exist_ok=True)
+        staging = tempfile.mkdtemp(prefix=key + '.', dir=self.directory)
+        try:
+            for name, values in arrays.items():
+                np.save(os.path.join(staging, f'{name}.npy'), values)
+            self._write_json(os.path.join(staging, 'manifest.json'),
+                             {'arrays': list(arrays), 'meta': meta})
+            self._replace_entry(os.path.join(self.directory, key), staging)
+        except OSError:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        self.evict()
+
+    def _replace_entry(self, entry, staging):
+        if os.path.isdir(entry):
+            shutil.rmtree(entry, ignore_errors=True)
+        os.replace(staging, entry)
+
+    def evict(self):
+        # Drop least recently used entries until the cache fits the budget
+        with self._lock:
+            entries = []
+            total = 0
+            for name in os.listdir(self.directory):
+                path = os.path.join(self.directory, name)
+                manifest = os.path.join(path, 'manifest.json')
+                if not os.path.isfile(manifest):
+                    continue
+                size = sum(e.stat().st_size for e in os.scandir(path) if e.is_file())
+                entries.append((os.path.getmtime(manifest), size, path))
+                total += size
+            for _, size, path in sorted(entries):
+                if total <= self.budget_bytes:
+                    break
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
+
+    def clear(self):
+        with self._lock:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _read_index(self):
+        try:
+            with open(os.path.join(self.directory, 'fingerprints.json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_json(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+
+def file_content_hash(file_path, block_size=1 << 20):
+    digest = hashlib.blake2b(digest_size=20)
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class RunningSummary:
+    # Summary statistics accumulated chunk by chunk during import. Totals are
+    # kept in float64 even when the columns are stored as float32.
+    def __init__(self, analysis_type):
+        self.analysis_type = analysis_type
+        self.count = 0
+        self.sums = {}
+        self.valid = 0      # rows with a Growth/Achievement (non-zero denominator)
+        self.above = 0      # positive growth / at or above target
+        self.below = 0      # negative growth / below target
+        self.rejected = 0   # source rows dropped during import
+        self.rejected_rows = []  # the first MAX_REJECTED_ROWS of them as records
+
+    def update(self, chunk, sign=1):
+        # sign=-1 takes rows back out again (e.g. superseded by an upsert)
+        self.count += sign * len(chunk)
+        if self.analysis_type not in DERIVED_METRICS:
+            return
+        metric = DERIVED_METRICS[self.analysis_type][0]
+        values = metric_values(chunk, self.analysis_type)
+        for column in ANALYSIS_COLUMNS[self.analysis_type][1:]:
+            self.sums[column] = (self.sums.get(column, 0.0) +
+                                 sign * chunk[column].to_numpy(dtype=np.float64).sum())
+        valid = ~np.isnan(values)
+        self.sums[metric] = self.sums.get(metric, 0.0) + sign * values[valid].astype(np.float64).sum()
+        self.valid += sign * int(valid.sum())
+        if self.analysis_type == "yoy":
+            self.above += sign * int((values > 0).sum())
+            self.below += sign * int((values < 0).sum())
+        else:
+            self.above += sign * int((values >= 100).sum())
+            self.below += sign * int((values < 100).sum())
+
+    def reject(self, frame):
+        # Count rows dropped by process_frame and keep the first few
+        self.rejected += len(frame)
+        room = MAX_REJECTED_ROWS - len(self.rejected_rows)
+        if room > 0:
+            self.rejected_rows.extend(frame.head(room).to_dict('records'))
+
+    def combine(self, other):
+        # Add the statistics of other rows (e.g. another sheet) to this summary
+        self.count += other.count
+        for column, total in other.sums.items():
+            self.sums[column] = self.sums.get(column, 0.0) + total
+        self.valid += other.valid
+        self.above += other.above
+        self.below += other.below
+        self.rejected += other.rejected
+        room = MAX_REJECTED_ROWS - len(self.rejected_rows)
+        self.rejected_rows.extend(other.rejected_rows[:max(0, room)])
+
+    def merged(self, added, removed=None):
+        # Copy of this summary with rows added (and optionally removed)
+        summary = RunningSummary.from_state(self.state())
+        summary.update(added)
+        if removed is not None and len(removed):
+            summary.update(removed, sign=-1)
+        return summary
+
+    def state(self):
+        return {'analysis_type': self.analysis_type, 'count': self.count,
+                'sums': {k: float(v) for k, v in self.sums.items()},
+                'valid': self.valid, 'above': self.above, 'below': self.below,
+                'rejected': self.rejected, 'rejected_rows': self.rejected_rows}
+
+    @classmethod
+    def from_state(cls, state):
+        summary = cls(state['analysis_type'])
+        summary.count = state['count']
+        summary.sums = dict(state['sums'])
+        summary.valid = state.get('valid', state['count'])
+        summary.above = state['above']
+        summary.below = state['below']
+        summary.rejected = state.get('rejected', 0)
+        summary.rejected_rows = list(state.get('rejected_rows', []))
+        return summary
+
+    def finalize(self, df):
+        count = self.count
+        # Averages are over the customers that have a Growth/Achievement
+        mean_divisor = self.valid if self.valid else np.nan
+        if self.analysis_type == "yoy":
+            # Year over Year Analysis
+            return {
+                'Total Customers': count,
+                'Total Current Cases': self.sums.get('Current Sales', 0.0),
+                'Total Previous Cases': self.sums.get('Previous Sales', 0.0),
+                'Average Growth': self.sums.get('Growth', 0.0) / mean_divisor,
+                # The median needs every value; take it from the assembled column
+                'Median Growth': pd.Series(metric_values(df, "yoy")).median(),
+                'Customers with Positive Growth': self.above,
+                'Customers with Negative Growth': self.below
+            }
+        elif self.analysis_type == "target":
+            # Target Analysis
+            total_target = self.sums.get('Target', 0.0)
+            return {
+                'Total Customers': count,
+                'Total Current Cases': self.sums.get('Current Sales', 0.0),
+                'Total Target': total_target,
+                'Overall Achievement': (self.sums.get('Current Sales', 0.0) / total_target * 100
+                                        if total_target else np.nan),
+                'Average Achievement': self.sums.get('Achievement', 0.0) / mean_divisor,
+                'Customers Above Target': self.above,
+                'Customers Below Target': self.below
+            }
+        return {}  # No summary stats for map view
+
+
+def format_summary_value(key, value):
+    if isinstance(value, float) and np.isnan(value):
+        return "n/a"
+    elif isinstance(value, (int, np.integer)):
+        return f"{value:,}"  # counts
+    elif 'Cases' in key or 'Target' in key or 'Sales' in key:
+        return f"{value:,.0f}"
+    elif 'Growth' in key or 'Achievement' in key:
+        return f"{value:.1f}%"
+    return str(value)
+
+
+def analysis_chart_data(top_customers, analysis_type, top_n, summary, side="Top"):
+    if analysis_type == "yoy":
+        series = [('Current Year', top_customers['Current Sales'].to_numpy()),
+                  ('Previous Year', top_customers['Previous Sales'].to_numpy())]
+        title = f'{side} {top_n} Customers - Year over Year Comparison'
+    else:
+        # Target comparison - showing Actual vs Target
+        series = [('Actual', top_customers['Current Sales'].to_numpy()),
+                  ('Target', top_customers['Target'].to_numpy())]
+        title = f'{side} {top_n} Customers - Actual vs Target'
+    return {
+        'summary': summary,
+        'labels': top_customers['Customer'].tolist(),
+        'series': series,
+        'title': title,
+    }
+
+
+def draw_analysis_chart(ax, data):
+    x = np.arange(len(data['labels']))
+    width = 0.35
+    (first_label, first), (second_label, second) = data['series']
+
+    ax.bar(x - width/2, first, width, label=first_label)
+    ax.bar(x + width/2, second, width, label=second_label)
+
+    ax.set_ylabel('Number of Cases')
+    ax.set_title(data['title'])
+    ax.set_xticks(x)
+    ax.set_xticklabels(data['labels'], rotation=45, ha='right')
+    ax.legend()
+
+    # Format y-axis to show whole numbers with commas (a format string
+    # rather than a function, so report figures can be pickled)
+    ax.yaxis.set_major_formatter('{x:,.0f}')
+
+
+def sorted_chart(sorted_values, analysis_type, chart_type):
+    metric = DERIVED_METRICS[analysis_type][0]
+    noun = metric.lower()
+    if chart_type == "bar":
+        # Sorted by growth / achievement, largest first
+        return {'kind': 'bar', 'y': sorted_values[::-1],
+                'title': f'Customer {metric} Distribution',
+                'xlabel': f'Customers (sorted by {noun})', 'ylabel': f'{metric} (%)'}
+    # Growth / achievement trend
+    return {'kind': 'line', 'y': sorted_values, 'title': f'{metric} Trend',
+            'xlabel': f'Customers (sorted by {noun})', 'ylabel': f'{metric} (%)'}
+
+
+def scatter_chart(df, analysis_type):
+    reference = 'Previous Sales' if analysis_type == "yoy" else 'Target'
+    chart = {'kind': 'scatter', 'x': df[reference].to_numpy(),
+             'y': df['Current Sales'].to_numpy(),
+             # Diagonal line for reference
+             'max_val': max(df['Current Sales'].max(), df[reference].max())}
+    if analysis_type == "yoy":
+        chart.update(title='Current vs Previous Cases', xlabel='Previous Cases',
+                     ylabel='Current Cases')
+    else:
+        chart.update(title='Actual vs Target Cases', xlabel='Target Cases',
+                     ylabel='Actual Cases')
+    return chart
+
+
+def metric_bin_counts(values, analysis_type):
+    # Customers per pie range; ranges are right-closed like pd.cut
+    edges = PIE_RANGES[analysis_type][0]
+    values = values[~np.isnan(values)]
+    return np.bincount(np.searchsorted(edges, values, side='left'), minlength=len(edges) + 1)
+
+
+def pie_chart(bin_counts, analysis_type):
+    _, labels, title = PIE_RANGES[analysis_type]
+    # Largest share first
+    order = np.argsort(-bin_counts, kind='stable')
+    return {'kind': 'pie', 'y': bin_counts[order], 'labels': [labels[i] for i in order],
+            'title': title}
+
+
+def draw_chart(ax, chart):
+    # Draw a chart from scratch; returns the data artists for later updates
+    kind = chart['kind']
+    artists = {}
+    if kind is None:
+        return artists
+    if kind == 'bar' and 'edges' in chart:
+        # Too many customers for individual bars: one step outline
+        artists['stairs'] = ax.stairs(chart['y'], chart['edges'], fill=True)
+    elif kind == 'bar':
+        # One collection instead of a Rectangle patch per bar, which kept
+        # charts near MAX_CHART_BARS bars from redrawing quickly
+        from matplotlib.collections import PolyCollection
+        verts = bar_polygons(chart['y'])
+        artists['bars'] = bars = PolyCollection(verts, facecolors='C0', edgecolors='none')
+        bars.sticky_edges.y.append(0)
+        ax.add_collection(bars)
+        ax.update_datalim(verts.reshape(-1, 2))
+        ax.autoscale_view()
+    elif kind == 'line':
+        artists['line'], = ax.plot(chart.get('x', np.arange(len(chart['y']))), chart['y'])
+    elif kind == 'scatter':
+        artists['points'] = ax.scatter(chart['x'], chart['y'])
+        max_val = chart['max_val']
+        artists['diagonal'], = ax.plot([0, max_val], [0, max_val], 'r--', alpha=0.5)
+    elif kind == 'pie':
+        ax.pie(chart['y'], labels=chart['labels'], autopct='%1.1f%%')
+
+    ax.set_title(chart['title'])
+    if 'xlabel' in chart:
+        ax.set_xlabel(chart['xlabel'])
+        ax.set_ylabel(chart['ylabel'])
+    if 'xticklabels' in chart:
+        set_period_ticks(ax, chart['xticklabels'])
+    return artists
+
+
+def bar_polygons(heights, width=0.8):
+    # Rectangle vertices of bars at 0, 1, 2... like ax.bar; missing values
+    # get no height
+    heights = np.nan_to_num(np.asarray(heights, dtype=np.float64), nan=0.0, posinf=0.0, neginf=0.0)
+    verts = np.zeros((len(heights), 4, 2))
+    verts[:, :, 0] = (np.arange(len(heights)) - width / 2)[:, None] + np.array([0, 0, width, width])
+    verts[:, 1:3, 1] = heights[:, None]
+    return verts
+
+
+def set_period_ticks(ax, labels, max_ticks=12):
+    step = -(-len(labels) // max_ticks) or 1
+    positions = np.arange(0, len(labels), step)
+    ax.set_xticks(positions)
+    ax.set_xticklabels([labels[i] for i in positions], rotation=45, ha='right')
+
+
+class ChartRenderer:
+    # Draws Visualizations charts into one Figure. When the next chart has the
+    # same shape as the current one the existing artists are updated in
+    # place, skipping figure.clear() and tight_layout().
+    def __init__(self, figure):
+        self.figure = figure
+        self.ax = None
+        self.artists = {}
+        self.signature = None
+
+    def draw(self, chart):
+        # Returns True when the figure was rebuilt
+        signature = chart_signature(chart)
+        if self.ax is not None and signature == self.signature:
+            with DIAGNOSTICS.stage('chart.update'):
+                updated = self._update(chart)
+            if updated:
+                return False
+        with DIAGNOSTICS.stage('chart.rebuild'):
+            self.figure.clear()
+            self.ax = self.figure.add_subplot(111)
+            self.artists = draw_chart(self.ax, chart)
+            self.signature = signature
+        with DIAGNOSTICS.stage('chart.tight_layout'):
+            self.figure.tight_layout()
+        return True
+
+    def _update(self, chart):
+        kind = chart['kind']
+        ax = self.ax
+        if kind == 'bar' and 'edges' in chart:
+            self.artists['stairs'].set_data(chart['y'], chart['edges'])
+        elif kind == 'bar':
+            verts = bar_polygons(chart['y'])
+            self.artists['bars'].set_verts(verts)
+        elif kind == 'line':
+            self.artists['line'].set_data(chart.get('x', np.arange(len(chart['y']))), chart['y'])
+        elif kind == 'scatter':
+            offsets = np.column_stack([chart['x'], chart['y']])
+            self.artists['points'].set_offsets(offsets)
+            max_val = chart['max_val']
+            self.artists['diagonal'].set_data([0, max_val], [0, max_val])
+        else:
+            return False
+
+        ax.set_title(chart['title'])
+        ax.set_xlabel(chart['xlabel'])
+        ax.set_ylabel(chart['ylabel'])
+        ax.relim()
+        # relim() ignores collections
+        if kind == 'scatter':
+            ax.update_datalim(offsets[np.isfinite(offsets).all(axis=1)])
+        elif kind == 'bar' and 'edges' not in chart:
+            ax.update_datalim(verts.reshape(-1, 2))
+        ax.autoscale_view()
+        return True
+
+
+def chart_signature(chart):
+    # Charts with equal signatures can be drawn by updating artists in place
+    kind = chart['kind']
+    labels = tuple(chart.get('xticklabels', ()))
+    if kind == 'bar':
+        return (kind, 'edges' in chart, len(chart['y']), labels)
+    return (kind, labels)
+
+
+def reduce_chart(chart):
+    # Shrink dense series to what can be seen on screen: bars of very many
+    # customers become a step outline of per-bucket extremes, lines keep the
+    # min and max of every bucket and scatter plots one point per grid cell
+    kind = chart['kind']
+    if kind == 'bar' and len(chart['y']) > MAX_CHART_BARS:
+        values, edges = bucket_extremes(chart['y'], MAX_CHART_BARS)
+        return dict(chart, y=values, edges=edges)
+    if kind == 'line' and len(chart['y']) > MAX_LINE_POINTS:
+        index = minmax_downsample(chart['y'], MAX_LINE_POINTS // 2)
+        return dict(chart, x=index, y=np.asarray(chart['y'])[index])
+    if kind == 'scatter' and len(chart['x']) > MAX_SCATTER_POINTS:
+        keep = thin_points(chart['x'], chart['y'], SCATTER_GRID)
+        return dict(chart, x=np.asarray(chart['x'])[keep], y=np.asarray(chart['y'])[keep])
+    return chart
+
+
+def bucket_extremes(values, n_buckets):
+    # Split into contiguous buckets and keep each bucket's value furthest
+    # from zero, which is what the tallest bar in the bucket would show
+    values = np.asarray(values)
+    edges = np.unique(np.linspace(0, len(values), n_buckets + 1).astype(np.int64))
+    starts = edges[:-1]
+    highest = np.maximum.reduceat(values, starts)
+    lowest = np.minimum.reduceat(values, starts)
+    return np.where(np.abs(highest) >= np.abs(lowest), highest, lowest), edges.astype(np.float64)
+
+
+def minmax_downsample(values, n_buckets):
+    # Indices of the minimum and maximum of each bucket (plus both ends),
+    # which preserves the visual envelope of a line
+    values = np.asarray(values)
+    n = len(values)
+    size = -(-n // n_buckets)
+    padded = np.pad(values, (0, size * n_buckets - n), mode='edge').reshape(n_buckets, size)
+    base = np.arange(n_buckets) * size
+    index = np.concatenate([[0, n - 1], base + padded.argmin(axis=1), base + padded.argmax(axis=1)])
+    return np.unique(np.clip(index, 0, n - 1))
+
+
+def thin_points(x, y, grid):
+    # Keep the first point in every occupied cell of a grid x grid raster
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    finite = np.flatnonzero(np.isfinite(x) & np.isfinite(y))
+    xf, yf = x[finite], y[finite]
+    if len(finite) == 0:
+        return finite
+    span_x = (xf.max() - xf.min()) or 1.0
+    span_y = (yf.max() - yf.min()) or 1.0
+    cx = np.minimum(((xf - xf.min()) / span_x * grid).astype(np.int64), grid - 1)
+    cy = np.minimum(((yf - yf.min()) / span_y * grid).astype(np.int64), grid - 1)
+    _, first = np.unique(cx * grid + cy, return_index=True)
+    return finite[np.sort(first)]
+
+
+class Diagnostics:
+    # Thread-safe log of timed processing stages shown in the Diagnostics
+    # tab. Memory deltas are only recorded while tracemalloc is tracing, and
+    # the next background operation can be captured under cProfile.
+    MAX_RECORDS = 1000
+    PROFILE_TOP = 25
+
+    def __init__(self):
+        self.records = collections.deque(maxlen=self.MAX_RECORDS)
+        self.capture = None       # last cProfile/tracemalloc capture
+        self.capture_next = False
+        self.version = 0          # bumped on every change, for UI refreshes
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @contextmanager
+    def operation(self, name):
+        # Label the stages recorded by this thread with an operation name
+        previous = getattr(self._local, 'operation', 'ui')
+        self._local.operation = name
+        try:
+            yield
+        finally:
+            self._local.operation = previous
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        # Time the enclosed block; the yielded record's rows may be set later
+        record = {'stage': name, 'rows': rows}
+        tracing = tracemalloc.is_tracing()
+        before = tracemalloc.get_traced_memory()[0] if tracing else 0
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            seconds = time.perf_counter() - start
+            memory = None
+            if tracing and tracemalloc.is_tracing():
+                memory = (tracemalloc.get_traced_memory()[0] - before) / 2 ** 20
+            self.record(name, seconds, record['rows'], memory)
+
+    def record(self, name, seconds, rows=None, memory_mb=None):
+        with self._lock:
+            self.records.append({'operation': getattr(self._local, 'operation', 'ui'),
+                                 'stage': name, 'seconds': seconds, 'rows': rows,
+                                 'memory_mb': memory_mb, 'time': time.time()})
+            self.version += 1
+
+    def run(self, operation, fn, *args):
+        # Run a whole operation, profiling it when a capture was requested
+        with self._lock:
+            capture, self.capture_next = self.capture_next, False
+        with self.operation(operation):
+            if capture:
+                return self._profile(operation, fn, args)
+            with self.stage('total'):
+                return fn(*args)
+
+    def _profile(self, operation, fn, args):
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            return fn(*args)
+        finally:
+            profiler.disable()
+            seconds = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+            after = tracemalloc.take_snapshot()
+            if started:
+                tracemalloc.stop()
+            stats = io.StringIO()
+            pstats.Stats(profiler, stream=stats).sort_stats('cumulative').print_stats(self.PROFILE_TOP)
+            allocations = [str(stat) for stat in after.compare_to(before, 'lineno')[:self.PROFILE_TOP]]
+            self.record('total (profiled)', seconds, memory_mb=peak)
+            with self._lock:
+                self.capture = {'operation': operation, 'seconds': seconds, 'peak_mb': peak,
+                                'profile': stats.getvalue(), 'allocations': allocations}
+                self.version += 1
+
+    def set_memory_tracking(self, enabled):
+        if enabled and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        elif not enabled and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def clear(self):
+        with self._lock:
+            self.records.clear()
+            self.capture = None
+            self.version += 1
+
+    def export(self, path):
+        with self._lock:
+            data = {'python': sys.version.split()[0], 'pandas': pd.__version__,
+                    'numpy': np.__version__, 'memory_tracking': tracemalloc.is_tracing(),
+                    'records': list(self.records), 'capture': self.capture}
+        with open(path, 'w') as f:
+            json.dump(data, f, indent=2)
+        return path
+
+
+# Stage timings of the running process
+DIAGNOSTICS = Diagnostics()
+
+
+class ComputationGraph:
+    # Memoized values with explicit dependencies. Every input and node result
+    # carries a version; a node is only recomputed when the version of one of
+    # its dependencies changed since it was last computed. Nodes may also
+    # define how to absorb added/removed rows so that merges patch cached
+    # values instead of recomputing them.
+    def __init__(self):
+        self.inputs = {}      # name -> (value, version)
+        self.nodes = {}       # name -> (fn, deps, on_delta)
+        self.cache = {}       # name -> (value, dependency versions, version)
+        self.recomputed = {}  # name -> number of times the node was computed
+        self._lock = threading.RLock()
+        self._versions = 0
+
+    def _next_version(self):
+        with self._lock:
+            self._versions += 1
+            return self._versions
+
+    def define(self, name, fn, deps, on_delta=None):
+        self.nodes[name] = (fn, deps, on_delta)
+
+    def set_input(self, name, value):
+        # Unchanged inputs keep their version, so nothing downstream
+        # recomputes. Locked like get(): inputs are set from the UI thread
+        # while workers evaluate the graph.
+        with self._lock:
+            current = self.inputs.get(name)
+            if current is not None:
+                old = current[0]
+                if old is value or (np.isscalar(value) and np.isscalar(old) and old == value):
+                    return
+                if isinstance(value, tuple) and isinstance(old, tuple) and old == value:
+                    return
+            self.inputs[name] = (value, self._next_version())
+
+    def get(self, name):
+        with self._lock:
+            return self._evaluate(name)[0]
+
+    def seed(self, name, value):
+        # Store a value computed elsewhere (e.g. during import) as current
+        with self._lock:
+            deps = self.nodes[name][1]
+            key = tuple(self._evaluate(dep)[1] for dep in deps)
+            self.cache[name] = (value, key, self._next_version())
+
+    def apply_delta(self, name, value, added, removed=None):
+        # Replace input `name` by `value`, which differs from the old value
+        # by the rows in `added` (new or updated) and `removed` (dropped or
+        # superseded), and patch the cached nodes that support it. A delta
+        # handler may return None when it cannot patch its value.
+        with self._lock:
+            old_version = self.inputs[name][1]
+            self.set_input(name, value)
+            new_version = self.inputs[name][1]
+            for node, (fn, deps, on_delta) in self.nodes.items():
+                cached = self.cache.get(node)
+                if on_delta is None or cached is None or name not in deps:
+                    continue
+                expected = tuple(old_version if dep == name else self._evaluate(dep)[1]
+                                 for dep in deps)
+                if cached[1] != expected:
+                    continue  # stale for another reason; recompute on demand
+                values = [self._evaluate(dep)[0] for dep in deps]
+                patched = on_delta(cached[0], added, removed, *values)
+                if patched is None:
+                    del self.cache[node]
+                    continue
+                key = tuple(new_version if dep == name else v for dep, v in zip(deps, expected))
+                self.cache[node] = (patched, key, self._next_version())
+
+    def _evaluate(self, name):
+        if name in self.inputs:
+            return self.inputs[name]
+        fn, deps, _ = self.nodes[name]
+        evaluated = [self._evaluate(dep) for dep in deps]
+        key = tuple(version for _, version in evaluated)
+        cached = self.cache.get(name)
+        if cached is not None and cached[1] == key:
+            return cached[0], cached[2]
+        with DIAGNOSTICS.stage('graph.' + name):
+            value = fn(*[v for v, _ in evaluated])
+        self.recomputed[name] = self.recomputed.get(name, 0) + 1
+        version = self._next_version()
+        self.cache[name] = (value, key, version)
+        return value, version
+
+
+def collapse_delta(delta, analysis_type, mode):
+    # One row per customer of appended rows: summed in 'sum' mode, the last
+    # one in 'upsert' mode. Also returns the columns that add up.
+    sum_columns = [c for c in ANALYSIS_COLUMNS[analysis_type][1:] if c not in ('Latitude', 'Longitude')]
+    if mode == 'sum':
+        aggregations = {c: ('sum' if c in sum_columns else 'first')
+                        for c in delta.columns if c != 'Customer'}
+        delta = delta.groupby('Customer', observed=True, sort=False).agg(aggregations).reset_index()
+    else:
+        delta = delta[~delta['Customer'].duplicated(keep='last')].reset_index(drop=True)
+    return delta, sum_columns
+
+
+def customer_positions(base_customers, customers):
+    # Hash lookup over the category table: customer -> base category code ->
+    # base row position (the last one if repeated), -1 for unknown customers
+    categories = base_customers.cat.categories
+    codes = base_customers.cat.codes.to_numpy()
+    row_of_code = np.full(len(categories), -1, dtype=np.int64)
+    row_of_code[codes] = np.arange(len(base_customers))
+    delta_codes = categories.get_indexer(customers.astype(str))
+    return np.where(delta_codes >= 0, row_of_code[delta_codes], -1)
+
+
+def merge_datasets(base, delta, analysis_type, mode):
+    # Merge processed rows into the current dataset keyed on Customer.
+    # mode 'upsert' replaces the values of existing customers, 'sum' adds to
+    # them; unknown customers are appended. Returns the merged frame plus the
+    # new and the superseded versions of every touched row, both indexed by
+    # position in the merged frame.
+    if analysis_type == "timeseries":
+        return merge_time_series(base, delta, mode)
+    delta, sum_columns = collapse_delta(delta, analysis_type, mode)
+
+    base_customers = base['Customer'].astype('category')
+    positions = customer_positions(base_customers, delta['Customer'])
+
+    matched = positions >= 0
+    updated_rows = positions[matched]
+    new_rows = delta[~matched]
+    n_base = len(base)
+
+    data = {'Customer': union_categoricals([base_customers, new_rows['Customer'].astype(str).astype('category')])}
+    for column in base.columns:
+        if column == 'Customer':
+            continue
+        old_values = base[column].to_numpy()
+        if column in delta:
+            new_values = delta[column].to_numpy()
+        else:
+            # Dimension missing from the appended rows: existing customers
+            # keep theirs, new ones are blank
+            new_values = np.full(len(delta), DIMENSION_MISSING, dtype=object)
+        values = np.empty(n_base + len(new_rows), dtype=np.result_type(old_values.dtype, new_values.dtype))
+        values[:n_base] = old_values
+        values[n_base:] = new_values[~matched]
+        if mode == 'upsert' and column in delta:
+            values[updated_rows] = new_values[matched]
+        elif column in sum_columns:
+            values[updated_rows] = old_values[updated_rows] + new_values[matched]
+        # otherwise (sum mode coordinates) existing customers keep their values
+        data[column] = pd.Categorical(values) if values.dtype == object else values
+    merged = pd.DataFrame(data)
+
+    touched = np.concatenate([updated_rows, np.arange(n_base, len(merged))])
+    added = merged.iloc[touched]
+    removed = base.iloc[updated_rows].set_axis(updated_rows)
+    return merged, added, removed
+
+
+def row_hashes(df):
+    # 64-bit hash of the values of every row, independent of the storage
+    # types chosen at import (category tables, and float32 or float64: one
+    # new large value turns a whole column float64, so every number is
+    # hashed at float32 precision wherever downcast_float would allow it)
+    values = {column: (hashable_floats(df[column].to_numpy(dtype=np.float64),
+                                       FLOAT32_TOLERANCE.get(column, 0.005))
+                       if df[column].dtype.kind == 'f' else df[column])
+              for column in df.columns}
+    return pd.util.hash_pandas_object(pd.DataFrame(values), index=False).to_numpy()
+
+
+def hashable_floats(values, tolerance):
+    compact = values.astype(np.float32).astype(np.float64)
+    with np.errstate(invalid='ignore'):
+        return np.where(np.abs(compact - values) <= tolerance, compact, values)
+
+
+def watch_delta(base, base_hashes, df, analysis_type):
+    # Rows of a reloaded file that differ from the current dataset, found by
+    # comparing row hashes: (changed rows, their hashes). None when the
+    # change cannot be merged by customer (columns changed, customers removed
+    # or repeated, time series rows edited rather than appended) and the
+    # file has to replace the dataset.
+    if list(df.columns) != list(base.columns):
+        return None
+    hashes = row_hashes(df)
+    if analysis_type == "timeseries":
+        # History only grows at the end
+        n = len(base)
+        if len(df) < n or not np.array_equal(hashes[:n], base_hashes):
+            return None
+        return df.iloc[n:], hashes[n:]
+    if df['Customer'].duplicated().any():
+        return None
+    positions = customer_positions(base['Customer'], df['Customer'])
+    matched = positions >= 0
+    if np.count_nonzero(matched) != len(base):
+        return None
+    changed = ~matched
+    changed[matched] = hashes[matched] != base_hashes[positions[matched]]
+    return df[changed], hashes[changed]
+
+
+def watch_reload_task(task, file_path, analysis_type, base=None, base_hashes=None):
+    # Re-read a watched file and work out what changed since `base` was
+    # loaded. Watched files change every time, so they bypass the cache.
+    df, summary_state = load_file_task(task, file_path, analysis_type)
+    rejected = (summary_state.rejected, summary_state.rejected_rows)
+    task.report(0.95, "Comparing rows...")
+    delta = None if base is None else watch_delta(base, base_hashes, df, analysis_type)
+    if delta is None:
+        return {'df': df, 'summary_state': summary_state, 'hashes': row_hashes(df), 'rejected': rejected}
+    rows, _ = delta
+    if not len(rows):
+        return {'df': base, 'unchanged': True, 'rejected': rejected}
+    mode = 'sum' if analysis_type == "timeseries" else 'upsert'
+    merged, added, removed = merge_datasets(base, rows, analysis_type, mode)
+    # Hashes of untouched rows carry over; touched ones are hashed again
+    hashes = np.empty(len(merged), dtype=np.uint64)
+    hashes[:len(base)] = base_hashes
+    hashes[added.index.to_numpy()] = row_hashes(added)
+    return {'df': merged, 'added': added, 'removed': removed, 'hashes': hashes, 'rejected': rejected}
+
+
+class TimeSeriesCube:
+    # Long-format (Customer, Date, Sales) data pre-aggregated to one total per
+    # customer and month. Quarterly and yearly cubes are rolled up from the
+    # monthly one, so switching granularity never re-scans the raw rows.
+    # Periods are counted from January 1970, so they align with calendar
+    # quarters and years.
+    def __init__(self, df):
+        self.customers = df['Customer'].cat.categories
+        months = df['Date'].to_numpy().astype('datetime64[M]').astype(np.int64)
+        self.cubes = {1: self._aggregate(months, df['Customer'].cat.codes.to_numpy(),
+                                         df['Sales'].to_numpy(dtype=np.float64))}
+
+    @staticmethod
+    def _aggregate(periods, codes, sales):
+        # Sum sales per (period, category code); result sorted by period
+        grouped = pd.DataFrame({'Period': periods, 'Customer': codes, 'Sales': sales}).groupby(
+            ['Period', 'Customer'], sort=True)['Sales'].sum()
+        return (grouped.index.get_level_values(0).to_numpy(),
+                grouped.index.get_level_values(1).to_numpy(), grouped.to_numpy())
+
+    def cube(self, months):
+        if months not in self.cubes:
+            periods, codes, sales = self.cubes[1]
+            self.cubes[months] = self._aggregate(periods // months, codes, sales)
+        return self.cubes[months]
+
+    def view(self, granularity):
+        # Period totals, growth metrics and the per-customer sales of the
+        # latest period and the same period a year earlier
+        months = GRANULARITIES[granularity]
+        per_year = 12 // months
+        periods, codes, sales = self.cube(months)
+        if len(periods) == 0:
+            raise DataFormatError("No dated sales to analyse")
+        last = periods[-1]
+        latest = np.zeros(len(self.customers))
+        previous = np.zeros(len(self.customers))
+        in_latest = periods == last
+        latest[codes[in_latest]] = sales[in_latest]
+        in_previous = periods == last - per_year
+        previous[codes[in_previous]] = sales[in_previous]
+        return period_view(granularity, periods, sales, self.customers, latest, previous)
+
+
+def period_view(granularity, periods, sales, customers, latest, previous):
+    # View of sales by (sorted) period; latest/previous are the sales of each
+    # customer in the last period and the same period a year earlier
+    months = GRANULARITIES[granularity]
+    per_year = 12 // months
+    # Start at a calendar year so year-to-date sums line up
+    first = periods[0] - periods[0] % per_year
+    last = periods[-1]
+    totals = np.bincount(periods - first, weights=sales, minlength=last - first + 1)
+    skip = periods[0] - first
+    rolling = period_growth(trailing_sum(totals, per_year), per_year)
+    ytd = period_growth(year_to_date(totals, first, per_year), per_year)
+    # Windows reaching into the padding would compare with months that were
+    # never recorded: rolling years need two full years of data, YTD growth
+    # a previous year observed from its start
+    rolling[:skip + 2 * per_year - 1] = np.nan
+    index = np.arange(len(totals))
+    ytd[index - index % per_year - per_year < skip] = np.nan
+    metrics = {
+        'Period-over-Period Growth': period_growth(totals, 1),
+        'Seasonal YoY Growth': period_growth(totals, per_year),
+        'Rolling Year Growth': rolling,
+        'YTD Growth': ytd,
+    }
+    # Drop the padding before the first observed period
+    return {
+        'granularity': granularity,
+        'labels': period_labels(periods[0], last, months),
+        'previous_label': period_labels(last - per_year, last - per_year, months)[0],
+        'totals': totals[skip:],
+        'metrics': {name: values[skip:] for name, values in metrics.items()},
+        'customers': customers,
+        'latest': latest,
+        'previous': previous,
+    }
+
+
+def period_growth(values, lag):
+    # Percent change against the value `lag` periods earlier; NaN where the
+    # earlier value is unknown or zero
+    growth = np.full(len(values), np.nan)
+    if lag < len(values):
+        before = values[:-lag]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            growth[lag:] = np.where(before > 0, (values[lag:] - before) / before * 100, np.nan)
+    return growth
+
+
+def trailing_sum(values, window):
+    # Sum of the last `window` periods (NaN until a full window is available)
+    totals = np.full(len(values), np.nan)
+    if window <= len(values):
+        cumulative = np.concatenate([[0.0], np.cumsum(values)])
+        totals[window - 1:] = cumulative[window:] - cumulative[:-window]
+    return totals
+
+
+def year_to_date(values, first, per_year):
+    # Running total that restarts at every calendar year; `first` is the
+    # period of values[0] and must start a year
+    cumulative = np.cumsum(values)
+    year_starts = np.arange(0, len(values), per_year)
+    before = np.concatenate([[0.0], cumulative])[year_starts]
+    return cumulative - np.repeat(before, per_year)[:len(values)]
+
+
+def period_labels(first, last, months):
+    periods = range(first, last + 1)
+    if months == 1:
+        return [f"{1970 + p // 12}-{p % 12 + 1:02d}" for p in periods]
+    if months == 3:
+        return [f"{1970 + p // 4}Q{p % 4 + 1}" for p in periods]
+    return [str(1970 + p) for p in periods]
+
+
+def customer_growth(view):
+    # Growth of every customer active in the latest or the matching period
+    active = (view['latest'] > 0) | (view['previous'] > 0)
+    return metric_from_columns(view['latest'][active], view['previous'][active], "yoy")
+
+
+def time_series_analysis_data(view, top_n):
+    # Summary of the latest period plus its Top N customers against the same
+    # period a year earlier, in the layout of analysis_chart_data
+    latest, previous = view['latest'], view['previous']
+    top_n = min(top_n, len(latest))
+    top = np.argpartition(-latest, top_n - 1)[:top_n] if top_n else np.arange(0)
+    top = top[np.argsort(-latest[top], kind='stable')]
+    last_label = view['labels'][-1]
+
+    summary = {
+        'Total Customers': int(((latest > 0) | (previous > 0)).sum()),
+        'Total Cases': view['totals'].sum(),
+        'Periods': f"{view['labels'][0]} to {last_label} ({len(view['labels'])})",
+        'Latest Period Cases': view['totals'][-1],
+    }
+    for name, values in view['metrics'].items():
+        summary[name] = values[-1]
+    return {
+        'summary': summary,
+        'labels': view['customers'][top].tolist(),
+        'series': [(last_label, latest[top]), (view['previous_label'], previous[top])],
+        'title': f"Top {top_n} Customers - {last_label} vs {view['previous_label']}",
+    }
+
+
+def time_series_chart(view, chart_type):
+    granularity = view['granularity']
+    if chart_type == "line":
+        return {'kind': 'line', 'y': view['totals'], 'xticklabels': view['labels'],
+                'title': f'{granularity} Sales', 'xlabel': 'Period', 'ylabel': 'Cases'}
+    elif chart_type == "bar":
+        return {'kind': 'bar', 'y': view['metrics']['Seasonal YoY Growth'],
+                'xticklabels': view['labels'], 'title': f'{granularity} Seasonal YoY Growth',
+                'xlabel': 'Period', 'ylabel': 'Growth (%)'}
+    elif chart_type == "scatter":
+        active = (view['latest'] > 0) | (view['previous'] > 0)
+        x, y = view['previous'][active], view['latest'][active]
+        return {'kind': 'scatter', 'x': x, 'y': y,
+                'max_val': max(x.max(), y.max()) if len(x) else 0,
+                'title': f"Customer Cases: {view['labels'][-1]} vs {view['previous_label']}",
+                'xlabel': f"{view['previous_label']} Cases", 'ylabel': f"{view['labels'][-1]} Cases"}
+    elif chart_type == "pie":
+        return pie_chart(metric_bin_counts(customer_growth(view), "timeseries"), "timeseries")
+    return {'kind': None}
+
+
+def merge_time_series(base, delta, mode):
+    # Long-format rows are observations, so appending adds rows. In upsert
+    # mode rows of the same customer and date replace the existing ones; in
+    # sum mode they are kept side by side and add up in the cube. Returns the
+    # merged frame, the appended rows and the replaced base rows.
+    base_customers = base['Customer'].astype(str).to_numpy()
+    delta_customers = delta['Customer'].astype(str).to_numpy()
+    removed = base.iloc[:0]
+    if mode == 'upsert':
+        delta = delta[~pd.MultiIndex.from_arrays([delta_customers, delta['Date']]).duplicated(keep='last')]
+        keys = pd.MultiIndex.from_arrays([delta['Customer'].astype(str), delta['Date']])
+        replaced = pd.MultiIndex.from_arrays([base_customers, base['Date']]).isin(keys)
+        removed = base[replaced]
+        base = base[~replaced]
+    merged = concat_chunks([base, delta], "timeseries")
+    added = merged.iloc[len(base):]
+    return merged, added, removed
+
+
+def dimension_columns(df, analysis_type):
+    # Dimension columns of a processed frame, in import order
+    standard = set(ANALYSIS_COLUMNS[analysis_type])
+    return [c for c in df.columns
+            if c not in standard and isinstance(df[c].dtype, pd.CategoricalDtype)]
+
+
+def drill_dimensions(df, analysis_type):
+    # Dimensions small enough to be cubed
+    if analysis_type not in DIMENSION_TYPES:
+        return []
+    return [d for d in dimension_columns(df, analysis_type)
+            if len(df[d].cat.categories) <= MAX_DIMENSION_MEMBERS]
+
+
+class DimensionCube:
+    # Sums of the analysis measures plus customer counts for every
+    # combination of dimension members. Dense cubes carry an extra "All" slot
+    # per dimension holding the roll-up, so any slice is one array lookup and
+    # a drill-down one array row; larger cubes keep only the occupied cells
+    # and sum those (never the raw rows) on demand.
+    def __init__(self, df, analysis_type):
+        _, numerator, denominator = DERIVED_METRICS[analysis_type]
+        self.analysis_type = analysis_type
+        self.dimensions = drill_dimensions(df, analysis_type)
+        self.members = [df[d].cat.categories for d in self.dimensions]
+        self.measures = [numerator, denominator, 'Customers', 'Above']
+
+        # Positive growth / at or above target, as in RunningSummary
+        growth = metric_values(df, analysis_type)
+        above = growth > 0 if analysis_type == "yoy" else growth >= 100
+        values = [df[numerator].to_numpy(dtype=np.float64), df[denominator].to_numpy(dtype=np.float64),
+                  None, above.astype(np.float64)]
+        sizes = [len(m) for m in self.members]
+        key = np.ravel_multi_index([df[d].cat.codes.to_numpy(dtype=np.int64) for d in self.dimensions],
+                                   sizes) if sizes else np.zeros(len(df), dtype=np.int64)
+
+        dense_values = int(np.prod([s + 1 for s in sizes])) * len(self.measures)
+        if dense_values <= MAX_DENSE_CUBE_VALUES:
+            cells = int(np.prod(sizes))
+            cube = np.stack([np.bincount(key, weights=v, minlength=cells) for v in values], axis=-1)
+            cube = cube.reshape(sizes + [len(self.measures)])
+            for axis in range(len(sizes)):
+                cube = np.concatenate([cube, cube.sum(axis=axis, keepdims=True)], axis=axis)
+            self.dense = cube
+        else:
+            occupied, inverse = np.unique(key, return_inverse=True)
+            self.dense = None
+            self.cell_codes = np.stack(np.unravel_index(occupied, sizes), axis=1)
+            self.cell_sums = np.stack([np.bincount(inverse, weights=v, minlength=len(occupied))
+                                       for v in values], axis=-1)
+
+    def _codes(self, selection):
+        # Member code per dimension; None stands for "All"
+        codes = [None] * len(self.dimensions)
+        for dimension, member in selection:
+            i = self.dimensions.index(dimension)
+            codes[i] = self.members[i].get_loc(member)
+        return codes
+
+    def total(self, selection):
+        # Measure totals of a slice: selection is ((dimension, member), ...)
+        codes = self._codes(selection)
+        if self.dense is not None:
+            return self.dense[tuple(len(m) if c is None else c for c, m in zip(codes, self.members))]
+        return self.cell_sums[self._cell_mask(codes)].sum(axis=0)
+
+    def breakdown(self, selection, dimension):
+        # Measure totals of every member of `dimension` within the slice
+        codes = self._codes(selection)
+        axis = self.dimensions.index(dimension)
+        if self.dense is not None:
+            index = [len(m) if c is None else c for c, m in zip(codes, self.members)]
+            index[axis] = slice(0, len(self.members[axis]))
+            return self.members[axis], self.dense[tuple(index)]
+        codes[axis] = None
+        mask = self._cell_mask(codes)
+        sums = np.stack([np.bincount(self.cell_codes[mask, axis], weights=self.cell_sums[mask, i],
+                                     minlength=len(self.members[axis]))
+                         for i in range(len(self.measures))], axis=-1)
+        return self.members[axis], sums
+
+    def _cell_mask(self, codes):
+        mask = np.ones(len(self.cell_codes), dtype=bool)
+        for i, code in enumerate(codes):
+            if code is not None:
+                mask &= self.cell_codes[:, i] == code
+        return mask
+
+
+def drill_analysis_data(cube, drill, top_n):
+    # Summary and comparison chart of one slice of the cube, broken down by a
+    # dimension if one is chosen, in the layout of analysis_chart_data
+    selection, breakdown = drill
+    current, reference, customers, above = cube.total(selection)
+    if cube.analysis_type == "yoy":
+        summary = {
+            'Total Customers': int(customers),
+            'Total Current Cases': current,
+            'Total Previous Cases': reference,
+            'Slice Growth': (current - reference) / reference * 100 if reference else np.nan,
+            'Customers Growing': int(above),
+        }
+        names = ('Current Year', 'Previous Year')
+    else:
+        summary = {
+            'Total Customers': int(customers),
+            'Total Current Cases': current,
+            'Total Target': reference,
+            'Overall Achievement': current / reference * 100 if reference else np.nan,
+            'Customers Above Target': int(above),
+        }
+        names = ('Actual', 'Target')
+
+    scope = ", ".join(f"{d}={m}" for d, m in selection) or "All"
+    if breakdown:
+        members, sums = cube.breakdown(selection, breakdown)
+        # Largest members of the slice first
+        order = np.argsort(-sums[:, 0], kind='stable')
+        order = order[sums[order, 2] > 0][:top_n]
+        labels = [str(members[i]) for i in order]
+        first, second = sums[order, 0], sums[order, 1]
+        title = f"{names[0]} vs {names[1]} by {breakdown} ({scope})"
+    else:
+        labels = [scope]
+        first, second = np.array([current]), np.array([reference])
+        title = f"{names[0]} vs {names[1]} ({scope})"
+    return {
+        'summary': summary,
+        'labels': labels,
+        'series': [(names[0], first), (names[1], second)],
+        'title': title,
+    }
+
+
+def graph_node(analysis_type, name):
+    # Graph node holding `name` (analysis_data, chart_<type>) for the type
+    return 'ts_' + name if analysis_type == "timeseries" else name
+
+
+def ranked_columns(analysis_type):
+    # Columns the rank index orders customers by
+    columns = [c for c in ANALYSIS_COLUMNS[analysis_type][1:]
+               if c not in ('Latitude', 'Longitude') and c not in DATE_COLUMNS]
+    if analysis_type in DERIVED_METRICS:
+        columns.append(DERIVED_METRICS[analysis_type][0])
+    return columns
+
+
+def rank_values(df, column, analysis_type):
+    if column not in df and analysis_type in DERIVED_METRICS and column == DERIVED_METRICS[analysis_type][0]:
+        return metric_values(df, analysis_type).astype(np.float64)
+    return df[column].to_numpy(dtype=np.float64)
+
+
+class RankIndex:
+    # Row positions ordered by each ranked column, largest first (ties in row
+    # order, like nlargest), built on first use of a column. Top/bottom N are
+    # slices of the order and ranks/percentiles binary searches; appended and
+    # updated rows are merged into the order instead of re-sorting it.
+    def __init__(self, df, analysis_type):
+        self.df = df
+        self.analysis_type = analysis_type
+        self.rankings = {}   # column -> (order, sort keys); keys are negated values
+
+    def _ranking(self, column):
+        ranking = self.rankings.get(column)
+        if ranking is None:
+            keys = -rank_values(self.df, column, self.analysis_type)
+            order = np.argsort(keys, kind='stable')
+            ranking = self.rankings[column] = (order, keys[order])
+        return ranking
+
+    def top(self, column, n):
+        return self._ranking(column)[0][:max(0, n)]
+
+    def bottom(self, column, n):
+        # Smallest n rows, ties in row order and NaN last like nsmallest: the
+        # valid part of the order reversed, with the runs of equal values up
+        # to the n-th one put back into row order
+        order, keys = self._ranking(column)
+        valid = len(keys) - np.count_nonzero(np.isnan(keys))
+        ascending, keys = order[:valid][::-1], keys[:valid][::-1]
+        n = max(0, n)
+        if min(n, valid) == 0:
+            return order[valid:valid + n]
+        end = int(np.searchsorted(-keys, -keys[min(n, valid) - 1], side='right'))
+        head = ascending[:end]
+        head = head[np.lexsort((head, -keys[:end]))][:n]
+        return np.concatenate([head, order[valid:valid + n - len(head)]])
+
+    def sorted_values(self, column):
+        # Ascending, as the distribution charts draw them; NaN (sorted last
+        # by rank, so first here) is left out
+        values = -self._ranking(column)[1][::-1]
+        return values[np.count_nonzero(np.isnan(values)):]
+
+    def rank(self, column, position):
+        # 1 = largest; equal values share a rank
+        keys = self._ranking(column)[1]
+        key = -rank_values(self.df.iloc[position:position + 1], column, self.analysis_type)[0]
+        return int(np.searchsorted(keys, key, side='left')) + 1
+
+    def percentile(self, column, rank):
+        # Share of customers ranked below the given rank, in percent
+        return 100.0 * (len(self.df) - rank) / max(1, len(self.df))
+
+    def customer_ranks(self, customer):
+        # (column, rank, percentile, value) of a customer, or None if unknown.
+        # A category can outlive its rows (filtered or merged frames), so an
+        # unused category is unknown too.
+        customers = self.df['Customer']
+        if customer not in customers.cat.categories:
+            return None
+        code = customers.cat.categories.get_loc(customer)
+        matches = np.flatnonzero(customers.cat.codes.to_numpy() == code)
+        if not len(matches):
+            return None
+        position = int(matches[0])
+        ranks = []
+        for column in ranked_columns(self.analysis_type):
+            rank = self.rank(column, position)
+            value = rank_values(self.df.iloc[position:position + 1], column, self.analysis_type)[0]
+            ranks.append((column, rank, self.percentile(column, rank), value))
+        return ranks
+
+    def merged(self, df, added, removed=None):
+        # Index of df, which differs from the indexed frame by `added` (new or
+        # updated rows) and `removed` (superseded rows), both indexed by
+        # position; only the columns ranked so far are carried over
+        index = RankIndex(df, self.analysis_type)
+        positions = added.index.to_numpy()
+        stale = np.zeros(len(df), dtype=bool)
+        if removed is not None and len(removed):
+            stale[removed.index.to_numpy()] = True
+        for column, (order, keys) in self.rankings.items():
+            keep = ~stale[order]
+            order, keys = order[keep], keys[keep]
+            new_keys = -rank_values(added, column, self.analysis_type)
+            new_order = np.argsort(new_keys, kind='stable')
+            slots = np.searchsorted(keys, new_keys[new_order], side='right')
+            index.rankings[column] = (np.insert(order, slots, positions[new_order]),
+                                      np.insert(keys, slots, new_keys[new_order]))
+        return index
+
+
+def ranked_rows(index, df, top_n, side):
+    positions = index.top('Current Sales', top_n) if side == "Top" else index.bottom('Current Sales', top_n)
+    return df.iloc[positions]
+
+
+def robust_outliers(values):
+    # Robust z-score: distance from the median in units of the median
+    # absolute deviation. When over half the values are equal the MAD is zero
+    # and Tukey's IQR fences are used instead. Medians and quartiles are
+    # selections, so this is linear in the values; NaN is never an outlier.
+    values = np.asarray(values, dtype=np.float64)
+    finite = values[~np.isnan(values)]
+    if len(finite) < 3:
+        return np.zeros(len(values), dtype=bool)
+    median = np.median(finite)
+    mad = np.median(np.abs(finite - median))
+    with np.errstate(invalid='ignore'):
+        if mad > 0:
+            return np.abs(values - median) * 0.6745 / mad > QUALITY_Z_LIMIT
+        q1, q3 = np.percentile(finite, [25, 75])
+        fence = QUALITY_IQR_FACTOR * (q3 - q1)
+        return (values < q1 - fence) | (values > q3 + fence) if fence > 0 else np.zeros(len(values), dtype=bool)
+
+
+def duplicate_customers(customers):
+    # Rows whose customer occurs more than once once names are compared
+    # without case and extra spaces. Names are normalised once per distinct
+    # name and grouped with a hash table, then counted per row.
+    if isinstance(customers.dtype, pd.CategoricalDtype):
+        codes, names = customers.cat.codes.to_numpy(), customers.cat.categories
+    else:
+        codes, names = pd.factorize(customers)
+    keys = np.array([' '.join(str(name).casefold().split()) for name in names], dtype=object)
+    groups = pd.factorize(keys)[0][codes]
+    return np.bincount(groups)[groups] > 1
+
+
+def quality_flags(df, analysis_type):
+    # Data quality pass over a processed frame: QUALITY_* flags per row and
+    # the number of rows with each flag. Time series rows are observations,
+    # so repeated customers are expected there and nothing is flagged.
+    flags = np.zeros(len(df), dtype=np.uint8)
+    if analysis_type != "timeseries" and len(df):
+        if analysis_type in DERIVED_METRICS:
+            values = metric_values(df, analysis_type)
+            flags[np.isnan(values)] |= QUALITY_INVALID
+            flags[robust_outliers(values)] |= QUALITY_OUTLIER
+        flags[duplicate_customers(df['Customer'])] |= QUALITY_DUPLICATE
+    counts = {label: int(np.count_nonzero(flags & flag)) for flag, label in QUALITY_LABELS.items()}
+    return {'flags': flags, 'counts': counts, 'flagged': int(np.count_nonzero(flags))}
+
+
+def quality_text(quality):
+    if not quality['flagged']:
+        return "Data quality: no rows flagged"
+    counts = ", ".join(f"{count:,} {label}" for label, count in quality['counts'].items() if count)
+    return f"Data quality: {quality['flagged']:,} rows flagged ({counts})"
+
+
+def quality_analysis_data(df, quality, quality_filter, analysis_type, top_n, side, drill):
+    # Analysis of the rows kept by the Analysis tab's quality filter; the
+    # kept rows are summarised and ranked directly, without the rank index
+    flagged = quality['flags'] != 0
+    rows = df[~flagged] if quality_filter == 'exclude' else df[flagged]
+    scope = "flagged rows excluded" if quality_filter == 'exclude' else "flagged rows only"
+    if drill != ((), None) and len(rows) and drill_dimensions(rows, analysis_type):
+        data = drill_analysis_data(DimensionCube(rows, analysis_type), drill, top_n)
+    else:
+        state = RunningSummary(analysis_type)
+        state.update(rows)
+        ranked = (rows.nlargest(top_n, 'Current Sales') if side == "Top"
+                  else rows.nsmallest(top_n, 'Current Sales'))
+        data = analysis_chart_data(ranked, analysis_type, top_n, state.finalize(rows), side)
+    data['title'] += f" ({scope})"
+    return data
+
+
+def build_analysis_graph():
+    # Dependency graph behind the Analysis and Visualizations tabs. Inputs:
+    # data (processed frame), analysis_type, top_n, granularity (time series
+    # only), drill ((dimension, member) filters, breakdown dimension) and
+    # quality_filter (a QUALITY_FILTERS value).
+    graph = ComputationGraph()
+    for name in ('data', 'analysis_type', 'top_n'):
+        graph.set_input(name, None)
+    graph.set_input('rank_side', "Top")
+    graph.set_input('granularity', "Monthly")
+    graph.set_input('drill', ((), None))
+    graph.set_input('quality_filter', None)
+
+    def summary_state(df, analysis_type):
+        state = RunningSummary(analysis_type)
+        state.update(df)
+        return state
+
+    def merge_bin_counts(old, added, removed, df, t):
+        counts = old + metric_bin_counts(metric_values(added, t), t)
+        if removed is not None and len(removed):
+            counts = counts - metric_bin_counts(metric_values(removed, t), t)
+        return counts
+
+    graph.define('summary_state', summary_state, ['data', 'analysis_type'],
+                 on_delta=lambda state, added, removed, df, t: state.merged(added, removed))
+    graph.define('summary', lambda state, df: state.finalize(df), ['summary_state', 'data'])
+    # Built once per dataset and patched on merges; Top N is then a slice
+    graph.define('rank_index', RankIndex, ['data', 'analysis_type'],
+                 on_delta=lambda index, added, removed, df, t: index.merged(df, added, removed))
+    graph.define('top_customers', ranked_rows, ['rank_index', 'data', 'top_n', 'rank_side'])
+    graph.define('sorted_metric', lambda index, t: index.sorted_values(DERIVED_METRICS[t][0]),
+                 ['rank_index', 'analysis_type'])
+    graph.define('bin_counts', lambda df, t: metric_bin_counts(metric_values(df, t), t),
+                 ['data', 'analysis_type'], on_delta=merge_bin_counts)
+
+    graph.define('analysis_data', analysis_chart_data,
+                 ['top_customers', 'analysis_type', 'top_n', 'summary', 'rank_side'])
+    # Chart nodes hold the screen-sized (reduced) series
+    graph.define('chart_bar', lambda s, t: reduce_chart(sorted_chart(s, t, 'bar')),
+                 ['sorted_metric', 'analysis_type'])
+    graph.define('chart_line', lambda s, t: reduce_chart(sorted_chart(s, t, 'line')),
+                 ['sorted_metric', 'analysis_type'])
+    graph.define('chart_scatter', lambda df, t: reduce_chart(scatter_chart(df, t)),
+                 ['data', 'analysis_type'])
+    graph.define('chart_pie', pie_chart, ['bin_counts', 'analysis_type'])
+
+    # Drill-down over the optional dimension columns
+    graph.define('dimension_cube',
+                 lambda df, t: DimensionCube(df, t) if drill_dimensions(df, t) else None,
+                 ['data', 'analysis_type'])
+    graph.define('drill_data', drill_analysis_data, ['dimension_cube', 'drill', 'top_n'])
+
+    # Data quality flags, recomputed in one pass whenever the data changes
+    graph.define('quality', quality_flags, ['data', 'analysis_type'])
+    graph.define('quality_data', quality_analysis_data,
+                 ['data', 'quality', 'quality_filter', 'analysis_type', 'top_n', 'rank_side', 'drill'])
+
+    # Time series: the cube is built once per dataset, views per granularity
+    graph.define('ts_cube', TimeSeriesCube, ['data'])
+    graph.define('ts_view', lambda cube, g: cube.view(g), ['ts_cube', 'granularity'])
+    graph.define('ts_analysis_data', time_series_analysis_data, ['ts_view', 'top_n'])
+    for chart_type in CHART_TYPES:
+        graph.define('ts_chart_' + chart_type,
+                     lambda view, c=chart_type: reduce_chart(time_series_chart(view, c)), ['ts_view'])
+    return graph
+
+
+def sql_name(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def sql_metric(analysis_type):
+    # Growth / Achievement as a SQL expression, NULL where it cannot be calculated
+    _, numerator, denominator = DERIVED_METRICS[analysis_type]
+    num, den = sql_name(numerator), sql_name(denominator)
+    if analysis_type == "yoy":
+        return f"(({num} - {den}) / NULLIF({den}, 0) * 100)"
+    return f"({num} / NULLIF({den}, 0) * 100)"
+
+
+def sql_value(analysis_type, column):
+    # Ranked column (stored or derived) as a SQL expression
+    if analysis_type in DERIVED_METRICS and column == DERIVED_METRICS[analysis_type][0]:
+        return sql_metric(analysis_type)
+    return sql_name(column)
+
+
+class SalesDatabase:
+    # Datasets kept in a local SQLite file instead of memory, for histories
+    # larger than RAM. Every dataset is one table; imports are bulk-inserted
+    # chunk by chunk and the analyses run as SQL aggregations, so only their
+    # results are loaded. Each thread gets its own connection (WAL mode lets
+    # the preview read while an import or a query runs).
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self._local = threading.local()
+        self.connection().execute("""CREATE TABLE IF NOT EXISTS datasets (
+            id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL, analysis_type TEXT NOT NULL,
+            columns TEXT NOT NULL, updated REAL NOT NULL)""")
+
+    def connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(f"PRAGMA cache_size=-{DATABASE_CACHE_MB * 1024}")
+            self._local.connection = connection
+        return connection
+
+    def datasets(self):
+        return [name for name, in self.connection().execute("SELECT name FROM datasets ORDER BY name")]
+
+    def dataset(self, name):
+        row = self.connection().execute(
+            "SELECT id, analysis_type, columns FROM datasets WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            raise DataFormatError(f"There is no dataset '{name}' in {os.path.basename(self.path)}")
+        return DatabaseDataset(self, name, row[0], row[1], json.loads(row[2]))
+
+    def size_bytes(self):
+        return sum(os.path.getsize(path) for path in (self.path, self.path + '-wal')
+                   if os.path.exists(path))
+
+
+class DatabaseWriter:
+    # Bulk-inserts coerced import chunks into a dataset inside one
+    # transaction. Replace imports fill a new table and index it at the end;
+    # appends merge every chunk into the existing rows like merge_datasets:
+    # by Customer (time series: by Customer and Date in upsert mode).
+    def __init__(self, database, name, analysis_type, mode):
+        self.database = database
+        self.connection = database.connection()
+        self.name = name
+        self.analysis_type = analysis_type
+        self.mode = mode
+        self.table = None
+        self.merge = False
+        self.staged = False
+        self.rows = 0
+
+    def write(self, chunk):
+        if self.table is None:
+            self._start(list(chunk.columns))
+        if not self.merge:
+            self._insert(self.table, chunk)
+        elif self.analysis_type == "timeseries":
+            self._merge_time_series(chunk)
+        else:
+            self._merge(chunk)
+        self.rows += len(chunk)
+
+    def _start(self, columns):
+        self.connection.execute("BEGIN IMMEDIATE")
+        existing = self.connection.execute(
+            "SELECT id, analysis_type, columns FROM datasets WHERE name = ?", (self.name,)).fetchone()
+        if existing is not None and self.mode != 'replace':
+            if existing[1] != self.analysis_type:
+                raise DataFormatError(f"Dataset '{self.name}' holds {ANALYSIS_LABELS[existing[1]]} "
+                                      f"data; choose another dataset name")
+            self.table, self.columns, self.merge = f"rows_{existing[0]}", json.loads(existing[2]), True
+            return
+        if existing is not None:
+            self.connection.execute(f"DROP TABLE IF EXISTS rows_{existing[0]}")
+            self.connection.execute("DELETE FROM datasets WHERE id = ?", (existing[0],))
+        cursor = self.connection.execute(
+            "INSERT INTO datasets (name, analysis_type, columns, updated) VALUES (?, ?, ?, ?)",
+            (self.name, self.analysis_type, json.dumps(columns), time.time()))
+        self.table, self.columns = f"rows_{cursor.lastrowid}", columns
+        self._create(self.table)
+
+    def _create(self, table, temporary=False):
+        definitions = [f"{sql_name(column)} {self._type(column)}" for column in self.columns]
+        if self.analysis_type == "timeseries":
+            definitions.append('"Month" INTEGER')   # months since 1970, for period queries
+        self.connection.execute(f"CREATE {'TEMP ' if temporary else ''}TABLE {table} "
+                                f"({', '.join(definitions)})")
+
+    def _type(self, column):
+        if column in DATE_COLUMNS:
+            return "INTEGER"   # days since 1970
+        if column in ANALYSIS_COLUMNS[self.analysis_type][1:]:
+            return "REAL"
+        return "TEXT"
+
+    def _insert(self, table, chunk):
+        values = []
+        for column in self.columns:
+            if column not in chunk:
+                values.append([DIMENSION_MISSING] * len(chunk))
+            elif column in DATE_COLUMNS:
+                values.append(chunk[column].to_numpy().astype('datetime64[D]').astype(np.int64).tolist())
+            elif self._type(column) == "REAL":
+                values.append(chunk[column].to_numpy(dtype=np.float64).tolist())
+            else:
+                values.append(chunk[column].astype(str).tolist())
+        names = [sql_name(column) for column in self.columns]
+        if self.analysis_type == "timeseries":
+            values.append(chunk['Date'].to_numpy().astype('datetime64[M]').astype(np.int64).tolist())
+            names.append('"Month"')
+        self.connection.executemany(
+            f"INSERT INTO {table} ({', '.join(names)}) VALUES ({', '.join('?' * len(names))})",
+            zip(*values))
+
+    def _staging(self, chunk):
+        if not self.staged:
+            # Connections are per thread, so an earlier import may have left one
+            self.connection.execute("DROP TABLE IF EXISTS temp.staging")
+            self._create('staging', temporary=True)
+            self.staged = True
+        self.connection.execute("DELETE FROM staging")
+        self._insert('staging', chunk)
+
+    def _merge(self, chunk):
+        delta, sum_columns = collapse_delta(chunk, self.analysis_type, self.mode)
+        self._staging(delta)
+        table = self.table
+        if SQLITE_UPDATE_FROM:
+            source = f"FROM staging AS s WHERE {table}.Customer = s.Customer"
+
+            def value(column):
+                return f"s.{column}"
+        else:
+            source = "WHERE Customer IN (SELECT Customer FROM staging)"
+
+            def value(column):
+                return f"(SELECT s.{column} FROM staging AS s WHERE s.Customer = {table}.Customer)"
+        if self.mode == 'upsert':
+            updates = [f"{sql_name(c)} = {value(sql_name(c))}" for c in self.columns
+                       if c != 'Customer' and c in delta]
+        else:
+            updates = [f"{sql_name(c)} = {table}.{sql_name(c)} + {value(sql_name(c))}"
+                       for c in sum_columns]
+        self.connection.execute(f"UPDATE {self.table} SET {', '.join(updates)} {source}")
+        names = ', '.join(sql_name(c) for c in self.columns)
+        self.connection.execute(f"INSERT INTO {self.table} ({names}) SELECT {names} FROM staging AS s "
+                                f"WHERE NOT EXISTS (SELECT 1 FROM {self.table} AS t "
+                                f"WHERE t.Customer = s.Customer)")
+
+    def _merge_time_series(self, chunk):
+        # Rows are observations: sum mode appends them, upsert mode first
+        # drops the existing rows of the same customer and date
+        if self.mode == 'upsert':
+            chunk = chunk[~pd.MultiIndex.from_arrays(
+                [chunk['Customer'].astype(str), chunk['Date']]).duplicated(keep='last')]
+            self._staging(chunk)
+            self.connection.execute(
+                f'DELETE FROM {self.table} WHERE rowid IN (SELECT t.rowid FROM staging AS s '
+                f'JOIN {self.table} AS t ON t.Customer = s.Customer AND t."Date" = s."Date")')
+        self._insert(self.table, chunk)
+
+    def finish(self):
+        if self.table is None:
+            return None
+        if not self.merge:
+            # Indexed after the bulk load, which is much faster than before
+            for i, columns in enumerate(DATABASE_INDEXES[self.analysis_type]):
+                self.connection.execute(f"CREATE INDEX {self.table}_{i} ON {self.table} "
+                                        f"({', '.join(sql_name(c) for c in columns)})")
+        self.connection.execute("UPDATE datasets SET updated = ? WHERE name = ?", (time.time(), self.name))
+        self.connection.execute("COMMIT")
+        return self.database.dataset(self.name)
+
+    def abort(self):
+        if self.connection.in_transaction:
+            self.connection.execute("ROLLBACK")
+
+
+class DatabaseDataset:
+    # One dataset of a SalesDatabase. Every method is a query pushed down to
+    # SQLite that returns what the in-memory path computes from the frame:
+    # summary, Top N rows, metric distribution, pie bins, thinned scatter
+    # points, time series views, ranks and map aggregates.
+    def __init__(self, database, name, table_id, analysis_type, columns):
+        self.database = database
+        self.name = name
+        self.table = f"rows_{table_id}"
+        self.analysis_type = analysis_type
+        self.columns = columns
+        self.rows = self._scalar(f"SELECT COUNT(*) FROM {self.table}")
+        # Preview paging: first rowid, whether rowids run without gaps, and
+        # (row position, rowid) pairs of the windows read so far
+        first, last = self._execute(f"SELECT MIN(rowid), MAX(rowid) FROM {self.table}").fetchone()
+        self._first_rowid = first or 1
+        self._contiguous = (last or 0) - self._first_rowid + 1 == self.rows
+        self._anchors = []
+
+    def _execute(self, sql, params=()):
+        return self.database.connection().execute(sql, params)
+
+    def _scalar(self, sql, params=()):
+        return self._execute(sql, params).fetchone()[0]
+
+    def _frame(self, sql, params=()):
+        cursor = self._execute(sql, params)
+        df = pd.DataFrame.from_records(cursor.fetchall(), columns=[d[0] for d in cursor.description])
+        if 'Date' in df:
+            df['Date'] = df['Date'].to_numpy(dtype=np.int64).astype('datetime64[D]').astype('datetime64[ns]')
+        return df
+
+    def _select(self):
+        return ', '.join(sql_name(c) for c in self.columns)
+
+    def preview(self, start, stop):
+        # Seek by rowid instead of an OFFSET that steps over every earlier
+        # row: positions are rowids while the table has no gaps (nothing
+        # deleted), otherwise the scan starts at the nearest window read before
+        if self._contiguous:
+            position, rowid = start, self._first_rowid + start
+        else:
+            i = bisect.bisect_right(self._anchors, (start, float('inf'))) - 1
+            position, rowid = self._anchors[i] if i >= 0 else (0, self._first_rowid)
+        df = self._frame(f"SELECT rowid AS _rowid, {self._select()} FROM {self.table} "
+                         f"WHERE rowid >= ? ORDER BY rowid LIMIT ? OFFSET ?",
+                         (rowid, stop - start, start - position))
+        if len(df) and not self._contiguous and len(self._anchors) < PREVIEW_MAX_ANCHORS:
+            anchor = (start, int(df['_rowid'].iloc[0]))
+            if anchor not in self._anchors:
+                bisect.insort(self._anchors, anchor)
+        return df.drop(columns='_rowid')
+
+    def footprint_text(self):
+        return (f"{self.rows:,} records in dataset '{self.name}' of {os.path.basename(self.database.path)} "
+                f"({self.database.size_bytes() / 2 ** 20:,.1f} MB on disk)")
+
+    def summary(self, distribution=None):
+        # distribution: metric_distribution(), if already queried
+        t = self.analysis_type
+        if t not in DERIVED_METRICS:
+            return {}
+        metric = sql_metric(t)
+        if t == "yoy":
+            count, current, previous, average, above, below = self._execute(
+                f'SELECT COUNT(*), TOTAL("Current Sales"), TOTAL("Previous Sales"), AVG({metric}), '
+                f'TOTAL({metric} > 0), TOTAL({metric} < 0) FROM {self.table}').fetchone()
+            values, counts = distribution or self.metric_distribution()
+            return {
+                'Total Customers': count,
+                'Total Current Cases': current,
+                'Total Previous Cases': previous,
+                'Average Growth': np.nan if average is None else average,
+                'Median Growth': distribution_median(values, counts),
+                'Customers with Positive Growth': int(above),
+                'Customers with Negative Growth': int(below)
+            }
+        count, current, target, average, above, below = self._execute(
+            f'SELECT COUNT(*), TOTAL("Current Sales"), TOTAL("Target"), AVG({metric}), '
+            f'TOTAL({metric} >= 100), TOTAL({metric} < 100) FROM {self.table}').fetchone()
+        return {
+            'Total Customers': count,
+            'Total Current Cases': current,
+            'Total Target': target,
+            'Overall Achievement': current / target * 100 if target else np.nan,
+            'Average Achievement': np.nan if average is None else average,
+            'Customers Above Target': int(above),
+            'Customers Below Target': int(below)
+        }
+
+    def ranked(self, column, n, side="Top"):
+        # Largest (or smallest) n rows by a column, ties in row order and
+        # missing values last like nlargest (nsmallest)
+        value = sql_value(self.analysis_type, column)
+        direction = "DESC" if side == "Top" else "ASC"
+        return self._frame(f"SELECT {self._select()} FROM {self.table} "
+                           f"ORDER BY {value} IS NULL, {value} {direction}, rowid LIMIT ?", (max(0, n),))
+
+    def metric_distribution(self):
+        # (value, count) histogram of Growth/Achievement at DATABASE_METRIC_STEP
+        # resolution; enough for the median and the sorted charts
+        rows = self._execute(
+            f"SELECT ROUND(m / {DATABASE_METRIC_STEP}) AS bucket, COUNT(*) FROM "
+            f"(SELECT {sql_metric(self.analysis_type)} AS m FROM {self.table}) "
+            f"WHERE m IS NOT NULL GROUP BY bucket ORDER BY bucket").fetchall()
+        if not rows:
+            return np.empty(0), np.empty(0, dtype=np.int64)
+        buckets, counts = zip(*rows)
+        return np.asarray(buckets) * DATABASE_METRIC_STEP, np.asarray(counts, dtype=np.int64)
+
+    def bin_counts(self):
+        # Customers per pie range (right-closed, like metric_bin_counts)
+        edges = PIE_RANGES[self.analysis_type][0]
+        bins = " + ".join(f"(m > {edge})" for edge in edges)
+        counts = np.zeros(len(edges) + 1, dtype=np.int64)
+        for index, count in self._execute(
+                f"SELECT {bins} AS bin, COUNT(*) FROM (SELECT {sql_metric(self.analysis_type)} AS m "
+                f"FROM {self.table}) WHERE m IS NOT NULL GROUP BY bin"):
+            counts[index] = count
+        return counts
+
+    def scatter_chart(self):
+        # First point of every SCATTER_GRID cell, as thin_points keeps
+        reference = 'Previous Sales' if self.analysis_type == "yoy" else 'Target'
+        x, y = sql_name(reference), '"Current Sales"'
+        x0, x1, y0, y1 = self._execute(f"SELECT MIN({x}), MAX({x}), MIN({y}), MAX({y}) "
+                                       f"FROM {self.table}").fetchone()
+        if x0 is None:
+            return scatter_chart(pd.DataFrame({reference: [], 'Current Sales': []}), self.analysis_type)
+        span_x, span_y = (x1 - x0) or 1.0, (y1 - y0) or 1.0
+        # SQLite takes the bare columns from the row holding MIN(rowid)
+        points = self._frame(
+            f"SELECT {x}, {y}, MIN(rowid) FROM {self.table} "
+            f"GROUP BY MIN(CAST(({x} - ?) / ? * {SCATTER_GRID} AS INTEGER), {SCATTER_GRID - 1}), "
+            f"MIN(CAST(({y} - ?) / ? * {SCATTER_GRID} AS INTEGER), {SCATTER_GRID - 1})",
+            (x0, span_x, y0, span_y))
+        chart = scatter_chart(points, self.analysis_type)
+        chart['max_val'] = max(x1, y1)
+        return chart
+
+    def time_series_view(self, granularity):
+        months = GRANULARITIES[granularity]
+        per_year = 12 // months
+        # Shifted so that integer division rounds down for dates before 1970
+        period = f'(("Month" + {months * 10000}) / {months} - 10000)'
+        rows = self._execute(f'SELECT {period} AS p, TOTAL("Sales") FROM {self.table} '
+                             f'GROUP BY p ORDER BY p').fetchall()
+        if not rows:
+            raise DataFormatError("No dated sales to analyse")
+        periods, totals = (np.asarray(values) for values in zip(*rows))
+        last = int(periods[-1])
+        previous = last - per_year
+        customers = self._execute(
+            f'SELECT Customer, TOTAL(CASE WHEN p = ? THEN "Sales" END), '
+            f'TOTAL(CASE WHEN p = ? THEN "Sales" END) FROM (SELECT Customer, "Sales", {period} AS p '
+            f'FROM {self.table} WHERE "Month" BETWEEN ? AND ? OR "Month" BETWEEN ? AND ?) '
+            f'GROUP BY Customer',
+            (last, previous, last * months, (last + 1) * months - 1,
+             previous * months, (previous + 1) * months - 1)).fetchall()
+        names, latest, before = zip(*customers) if customers else ((), (), ())
+        return period_view(granularity, periods.astype(np.int64), totals, pd.Index(names, dtype=object),
+                           np.asarray(latest, dtype=np.float64), np.asarray(before, dtype=np.float64))
+
+    def customer_ranks(self, customer):
+        # (column, rank, percentile, value) of a customer, or None if unknown
+        t = self.analysis_type
+        columns = ranked_columns(t)
+        row = self._execute(f"SELECT {', '.join(sql_value(t, c) for c in columns)} FROM {self.table} "
+                            f"WHERE Customer = ? ORDER BY rowid LIMIT 1", (customer,)).fetchone()
+        if row is None:
+            return None
+        ranks = []
+        for column, value in zip(columns, row):
+            if value is None:
+                ranks.append((column, self.rows, 0.0, np.nan))
+                continue
+            rank = self._scalar(f"SELECT COUNT(*) FROM {self.table} WHERE {sql_value(t, column)} > ?",
+                                (value,)) + 1
+            ranks.append((column, rank, 100.0 * (self.rows - rank) / max(1, self.rows), value))
+        return ranks
+
+    def heat_data(self, cell_size=None):
+        # bin_heat_data as one GROUP BY over grid cells
+        lat0, lat1, lon0, lon1 = self._execute(
+            f'SELECT MIN("Latitude"), MAX("Latitude"), MIN("Longitude"), MAX("Longitude") '
+            f'FROM {self.table}').fetchone()
+        if lat0 is None:
+            return []
+        if not cell_size:
+            cell_size = max(lat1 - lat0, lon1 - lon0) / HEAT_GRID_CELLS or 0.01
+        rows = self._execute(
+            f'SELECT TOTAL(w), COUNT(*), TOTAL(lat * w), TOTAL(lon * w), TOTAL(lat), TOTAL(lon) FROM '
+            f'(SELECT "Latitude" AS lat, "Longitude" AS lon, MAX(COALESCE("Sales", 0), 0) AS w, '
+            f'CAST(("Latitude" - ?) / ? AS INTEGER) AS r, CAST(("Longitude" - ?) / ? AS INTEGER) AS c '
+            f'FROM {self.table}) GROUP BY r, c', (lat0, cell_size, lon0, cell_size)).fetchall()
+        return heat_points(*(np.asarray(values, dtype=np.float64) for values in zip(*rows)))
+
+    def bbox(self, south, west, north, east):
+        # Customers in a box through the coordinate index; boxes that cross
+        # the antimeridian become two longitude ranges, like SpatialIndex
+        ranges = longitude_ranges(west, east)
+        where = ' OR '.join(['"Longitude" BETWEEN ? AND ?'] * len(ranges))
+        params = tuple(bound for lon_range in ranges for bound in lon_range)
+        rows = self._frame(f'SELECT {self._select()} FROM {self.table} WHERE "Latitude" BETWEEN ? AND ? '
+                           f'AND ({where})', (south, north) + params)
+        return {'rows': rows, 'count': len(rows), 'total_sales': float(rows['Sales'].sum())}
+
+    def radius(self, lat, lon, radius_km):
+        # Box through the index, then exact great-circle distances, nearest first
+        dlat = radius_km / KM_PER_DEGREE
+        dlon = min(360.0, dlat / max(np.cos(np.radians(min(89.9, abs(lat) + dlat))), 1e-6))
+        rows = self.bbox(lat - dlat, lon - dlon, lat + dlat, lon + dlon)['rows']
+        distances = haversine_km(lat, lon, rows['Latitude'].to_numpy(dtype=np.float64),
+                                 rows['Longitude'].to_numpy(dtype=np.float64))
+        inside = np.flatnonzero(distances <= radius_km)
+        order = inside[np.argsort(distances[inside], kind='stable')]
+        rows = rows.iloc[order].reset_index(drop=True)
+        return {'rows': rows, 'count': len(rows), 'total_sales': float(rows['Sales'].sum()),
+                'distances_km': distances[order]}
+
+
+def distribution_median(values, counts):
+    n = int(counts.sum())
+    if n == 0:
+        return np.nan
+    cumulative = np.cumsum(counts)
+    lower, upper = np.searchsorted(cumulative, [(n - 1) // 2, n // 2], side='right')
+    return float(values[lower] + values[upper]) / 2
+
+
+def distribution_chart(values, counts, analysis_type, chart_type):
+    # Sorted Growth/Achievement chart from a (value, count) histogram: the
+    # value at evenly spaced customer ranks, already screen-sized
+    n = int(counts.sum())
+    points = MAX_CHART_BARS if chart_type == "bar" else MAX_LINE_POINTS
+    ranks = np.unique(np.linspace(0, n - 1, min(n, points)).astype(np.int64)) if n else np.arange(0)
+    sampled = values[np.searchsorted(np.cumsum(counts), ranks, side='right')] if n else np.empty(0)
+    chart = sorted_chart(sampled, analysis_type, chart_type)
+    if len(ranks) < n:
+        if chart_type == "bar":
+            chart['edges'] = np.linspace(0, n, len(ranks) + 1)
+        else:
+            chart['x'] = ranks
+    return chart
+
+
+def build_database_graph():
+    # Counterpart of build_analysis_graph for a DatabaseDataset: same node
+    # names and results, computed by pushed-down queries. Inputs: dataset,
+    # analysis_type, top_n, rank_side, granularity.
+    graph = ComputationGraph()
+    for name in ('dataset', 'analysis_type', 'top_n'):
+        graph.set_input(name, None)
+    graph.set_input('rank_side', "Top")
+    graph.set_input('granularity', "Monthly")
+    graph.define('distribution', lambda dataset: dataset.metric_distribution(), ['dataset'])
+    graph.define('summary', lambda dataset, d: dataset.summary(d), ['dataset', 'distribution'])
+    graph.define('rank_index', lambda dataset: dataset, ['dataset'])
+    graph.define('top_customers', lambda dataset, n, side: dataset.ranked('Current Sales', n, side),
+                 ['dataset', 'top_n', 'rank_side'])
+    graph.define('analysis_data', analysis_chart_data,
+                 ['top_customers', 'analysis_type', 'top_n', 'summary', 'rank_side'])
+    for chart_type in ("bar", "line"):
+        graph.define('chart_' + chart_type,
+                     lambda d, t, c=chart_type: distribution_chart(d[0], d[1], t, c),
+                     ['distribution', 'analysis_type'])
+    graph.define('chart_scatter', lambda dataset: dataset.scatter_chart(), ['dataset'])
+    graph.define('bin_counts', lambda dataset: dataset.bin_counts(), ['dataset'])
+    graph.define('chart_pie', pie_chart, ['bin_counts', 'analysis_type'])
+
+    graph.define('ts_view', lambda dataset, g: dataset.time_series_view(g), ['dataset', 'granularity'])
+    graph.define('ts_analysis_data', time_series_analysis_data, ['ts_view', 'top_n'])
+    for chart_type in CHART_TYPES:
+        graph.define('ts_chart_' + chart_type,
+                     lambda view, c=chart_type: reduce_chart(time_series_chart(view, c)), ['ts_view'])
+    return graph
+
+
+def database_import_task(task, database, name, analysis_type, mode, read):
+    # read(task, sink) runs one of the import readers with the writer as sink
+    writer = DatabaseWriter(database, name, analysis_type, mode)
+    try:
+        summary = read(task, writer.write)
+        task.report(0.95, "Indexing..." if not writer.merge else "Committing...")
+        with DIAGNOSTICS.stage('database.commit', writer.rows):
+            dataset = writer.finish()
+    except BaseException:
+        writer.abort()
+        raise
+    if dataset is None:
+        raise DataFormatError("No records to import")
+    task.report(1.0, f"Stored {writer.rows:,} records in '{name}'")
+    return {'dataset': dataset, 'rejected': (summary.rejected, summary.rejected_rows),
+            'imported': writer.rows}
+
+
+def database_files_task(task, database, name, file_paths, analysis_type, mode):
+    # Sheets are read in turn (one writer) and streamed into the database
+    def read(task, sink):
+        summary = RunningSummary(analysis_type)
+        sheets = [(file_path, sheet) for file_path in file_paths for sheet in import_sheets(file_path)]
+        for file_path, sheet in sheets:
+            label = os.path.basename(file_path) + ("" if sheet is None else f" [{sheet}]")
+            task.report(0.0, f"Reading {label}...")
+            chunks, number_format = iter_file_chunks(file_path, analysis_type, sheet)
+            _, part = coerce_chunks(task, chunks, analysis_type, label, number_format, sink)
+            if len(sheets) > 1:
+                part.rejected_rows = [{'Source': label, **row} for row in part.rejected_rows]
+            summary.combine(part)
+        return summary
+    return database_import_task(task, database, name, analysis_type, mode, read)
+
+
+def database_pasted_task(task, database, name, data, analysis_type, mode):
+    def read(task, sink):
+        sep, thousands, decimal = sniff_text_format(data[:SNIFF_BYTES])
+        chunks = iter_csv_chunks(io.StringIO(data), analysis_type, "Pasted data", sep=sep,
+                                 number_format=(thousands, decimal))
+        return coerce_chunks(task, chunks, analysis_type, "Pasted data", (thousands, decimal), sink)[1]
+    return database_import_task(task, database, name, analysis_type, mode, read)
+
+
+def database_map_task(task, dataset, map_path, cluster_threshold=MAP_CLUSTER_THRESHOLD, heat_cell_size=None):
+    # Heat layer aggregated over every customer in SQL; markers for the
+    # largest customers only
+    task.report(0.1, "Aggregating heat grid...")
+    with DIAGNOSTICS.stage('map.heat_query', dataset.rows):
+        heat_data = dataset.heat_data(heat_cell_size)
+    task.report(0.4, "Loading the largest customers...")
+    largest = dataset.ranked('Sales', cluster_threshold)
+    m = build_sales_map(largest, task, cluster_threshold, heat_cell_size, heat_data)
+    task.report(0.9, "Writing map file...")
+    with DIAGNOSTICS.stage('map.serialize', len(largest)):
+        m.save(map_path)
+    return map_path, (f"Largest {len(largest):,} of {dataset.rows:,} customers as markers, "
+                      f"heat layer of {len(heat_data):,} grid cells")
+
+
+def build_sales_map(df, task=None, cluster_threshold=MAP_CLUSTER_THRESHOLD, heat_cell_size=None,
+                    heat_data=None):
+    import folium
+    from folium import plugins
+
+    lat = df['Latitude'].to_numpy(dtype=np.float64)
+    lon = df['Longitude'].to_numpy(dtype=np.float64)
+    sales = df['Sales'].to_numpy(dtype=np.float64)
+
+    # Create map centered on the mean of coordinates
+    clustered = len(df) > cluster_threshold
+    m = folium.Map(location=[lat.mean(), lon.mean()], zoom_start=4, prefer_canvas=clustered)
+
+    # Tooltip/popup text for every row in one pass over the columns
+    customers = df['Customer'].map(lambda c: html.escape(str(c))).tolist()
+    sales_text = [f"{v:,.0f}" for v in sales.tolist()]
+    radii = np.sqrt(np.clip(sales, 0, None)) / 100  # Size based on sales
+
+    start = time.perf_counter()
+    if clustered:
+        # Ship the points as one compact array and build markers in the browser
+        if task is not None:
+            task.report(0.2, f"Clustering {len(df):,} markers...")
+        rows = [list(row) for row in zip(lat.round(6).tolist(), lon.round(6).tolist(),
+                                         radii.round(2).tolist(), customers, sales_text)]
+        plugins.FastMarkerCluster(rows, callback=CLUSTER_MARKER_CALLBACK,
+                                  name='Customers').add_to(m)
+    else:
+        # Add markers for each point
+        total = max(1, len(df))
+        for i, (la, lo, radius, customer, sales_str) in enumerate(
+                zip(lat.tolist(), lon.tolist(), radii.tolist(), customers, sales_text)):
+            if task is not None and i % 500 == 0:
+                task.report(0.8 * i / total, f"Adding markers ({i:,}/{total:,})...")
+            popup_content = f"""
+                <div style='width:200px'>
+                    <b>Customer:</b> {customer}<br>
+                    <b>Sales:</b> {sales_str}<br>
+                    <b>Location:</b> {la:.4f}, {lo:.4f}
+                </div>
+            """
+
+            folium.CircleMarker(
+                location=[la, lo],
+                radius=radius,
+                popup=folium.Popup(popup_content, max_width=300),
+                tooltip=f"{customer}: {sales_str}",
+                color='blue',
+                fill=True,
+                fill_opacity=0.6
+            ).add_to(m)
+
+    DIAGNOSTICS.record('map.markers', time.perf_counter() - start, len(df))
+
+    # Add heatmap layer, pre-aggregated on a grid
+    with DIAGNOSTICS.stage('map.heat', len(df)):
+        if heat_data is None:
+            heat_data = bin_heat_data(lat, lon, sales, heat_cell_size)
+        plugins.HeatMap(heat_data, name='Sales Heat').add_to(m)
+    folium.LayerControl().add_to(m)
+
+    m.map_summary = (f"{len(df):,} customers "
+                     f"({'clustered' if clustered else 'individual markers'}), "
+                     f"heat layer of {len(heat_data):,} grid cells")
+    return m
+
+
+def bin_heat_data(lat, lon, weight, cell_size=None):
+    # Aggregate points into square grid cells (in degrees); each cell becomes
+    # one heat point at the sales-weighted centre of its customers
+    if len(lat) == 0:
+        return []
+    weight = np.clip(np.nan_to_num(weight), 0, None)
+    if not cell_size:
+        extent = max(lat.max() - lat.min(), lon.max() - lon.min())
+        cell_size = extent / HEAT_GRID_CELLS or 0.01
+
+    rows = ((lat - lat.min()) // cell_size).astype(np.int64)
+    cols = ((lon - lon.min()) // cell_size).astype(np.int64)
+    _, cell = np.unique(rows * (cols.max() + 1) + cols, return_inverse=True)
+    return heat_points(np.bincount(cell, weights=weight), np.bincount(cell),
+                       np.bincount(cell, weights=lat * weight), np.bincount(cell, weights=lon * weight),
+                       np.bincount(cell, weights=lat), np.bincount(cell, weights=lon))
+
+
+def heat_points(totals, counts, weighted_lat, weighted_lon, lat_sums, lon_sums):
+    # [lat, lon, intensity] of each grid cell from its sums
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cell_lat = np.where(totals > 0, weighted_lat / totals, lat_sums / counts)
+        cell_lon = np.where(totals > 0, weighted_lon / totals, lon_sums / counts)
+    intensity = totals / totals.max() if totals.max() > 0 else np.ones_like(totals)
+    return np.column_stack([cell_lat.round(5), cell_lon.round(5), intensity.round(4)]).tolist()
+
+
+def save_map_task(task, df, map_path, cluster_threshold=MAP_CLUSTER_THRESHOLD, heat_cell_size=None):
+    m = build_sales_map(df, task, cluster_threshold, heat_cell_size)
+    task.report(0.9, "Writing map file...")
+    with DIAGNOSTICS.stage('map.serialize', len(df)):
+        m.save(map_path)
+    return map_path, m.map_summary
+
+
+def mercator_tiles(lat, lon, zoom):
+    # Web Mercator tile column/row of each point at the given zoom
+    n = 2 ** zoom
+    lat = np.radians(np.clip(np.asarray(lat, dtype=np.float64), -MERCATOR_MAX_LAT, MERCATOR_MAX_LAT))
+    x = (np.asarray(lon, dtype=np.float64) + 180) / 360 * n
+    y = (1 - np.log(np.tan(lat) + 1 / np.cos(lat)) / np.pi) / 2 * n
+    return (np.clip(x, 0, n - 1).astype(np.uint64), np.clip(y, 0, n - 1).astype(np.uint64))
+
+
+def morton_codes(x, y):
+    # Interleave the bits of tile column and row (quadkey order)
+    def spread(v):
+        v = np.asarray(v, dtype=np.uint64)
+        for shift, mask in ((16, 0x0000FFFF0000FFFF), (8, 0x00FF00FF00FF00FF),
+                            (4, 0x0F0F0F0F0F0F0F0F), (2, 0x3333333333333333),
+                            (1, 0x5555555555555555)):
+            v = (v | (v << np.uint64(shift))) & np.uint64(mask)
+        return v
+    return (spread(y) << np.uint64(1)) | spread(x)
+
+
+class TilePyramid:
+    # Customers sorted by Morton code plus pre-aggregated cluster levels, so
+    # any tile at any zoom is answered with two binary searches and at most
+    # a small aggregation
+    def __init__(self, lat, lon, sales, customers):
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        codes = morton_codes(*mercator_tiles(lat, lon, TILE_MAX_ZOOM))
+        order = np.argsort(codes, kind='stable')
+        self.codes = codes[order]
+        self.lat, self.lon = lat[order], lon[order]
+        self.sales = np.asarray(sales, dtype=np.float64)[order]
+        customers = pd.Categorical(customers)
+        self.customer_codes = customers.codes[order]
+        self.customer_names = np.asarray(customers.categories, dtype=object)
+        self.size = len(order)
+        if self.size == 0:
+            raise ValueError("Cannot build map tiles without coordinates")
+
+        # Cluster cells of every CLUSTER_LEVEL_STRIDE-th level from
+        # CLUSTER_CELL_BITS up: (codes, count, sales, sum of lat, sum of lon),
+        # each coarser level built from the previous one. Level TILE_MAX_ZOOM
+        # is the customers themselves.
+        self.levels = {}
+        level = (self.codes, np.ones(self.size), self.sales, self.lat, self.lon)
+        for zoom in range(TILE_MAX_ZOOM - 1, CLUSTER_CELL_BITS - 1, -1):
+            level = self._coarsen(level, 1)
+            if (zoom - CLUSTER_CELL_BITS) % CLUSTER_LEVEL_STRIDE == 0:
+                self.levels[zoom] = level
+
+    @staticmethod
+    def _coarsen(level, steps):
+        codes = level[0] >> np.uint64(2 * steps)
+        if not len(codes):
+            return level
+        starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+        return (codes[starts],) + tuple(np.add.reduceat(v, starts) for v in level[1:])
+
+    def _cluster_level(self, code, zoom, start, stop):
+        # Cluster cells of tile `code` at level `zoom`: its slice of the next
+        # finer kept level (or of the customers), coarsened to `zoom`
+        finer = min((z for z in self.levels if z >= zoom), default=TILE_MAX_ZOOM)
+        if finer == TILE_MAX_ZOOM:
+            part = slice(start, stop)
+            level = (self.codes[part], np.ones(stop - start), self.sales[part],
+                     self.lat[part], self.lon[part])
+        else:
+            level = self.levels[finer]
+            shift = 2 * (finer - zoom + CLUSTER_CELL_BITS)
+            lo, hi = np.searchsorted(level[0], np.array([code << shift, (code + 1) << shift],
+                                                        dtype=np.uint64))
+            level = tuple(v[lo:hi] for v in level)
+        return self._coarsen(level, finer - zoom) if finer > zoom else level
+
+    @classmethod
+    def from_frame(cls, df):
+        return cls(df['Latitude'].to_numpy(), df['Longitude'].to_numpy(),
+                   df['Sales'].to_numpy(), df['Customer'])
+
+    def tile(self, zoom, x, y):
+        code = int(morton_codes(x, y))
+        shift = 2 * (TILE_MAX_ZOOM - zoom)
+        start, stop = np.searchsorted(self.codes, np.array([code << shift, (code + 1) << shift],
+                                                           dtype=np.uint64))
+        if stop - start <= TILE_POINT_LIMIT or zoom > CLUSTER_MAX_ZOOM:
+            # Same marker rows as the clustered map file
+            part = slice(start, stop)
+            radii = np.sqrt(np.clip(self.sales[part], 0, None)) / 100
+            names = self.customer_names[self.customer_codes[part]]
+            return {'points': [[la, ln, r, html.escape(str(c)), f"{v:,.0f}"] for la, ln, r, c, v in
+                               zip(self.lat[part].round(6).tolist(), self.lon[part].round(6).tolist(),
+                                   radii.round(2).tolist(), names, self.sales[part].tolist())]}
+        _, count, total, sum_lat, sum_lon = self._cluster_level(code, zoom + CLUSTER_CELL_BITS, start, stop)
+        return {'clusters': [[la, ln, n, f"{v:,.0f}"] for la, ln, n, v in
+                             zip((sum_lat / count).round(6).tolist(), (sum_lon / count).round(6).tolist(),
+                                 count.astype(np.int64).tolist(), total.tolist())]}
+
+
+def build_tiled_map_task(task, df):
+    # Pyramid and base page for the map server; the page holds no data
+    task.report(0.1, f"Indexing {len(df):,} customers into map tiles...")
+    with DIAGNOSTICS.stage('map.pyramid', len(df)):
+        pyramid = TilePyramid.from_frame(df)
+    task.report(0.9, "Building map page...")
+    import folium
+    version = f"{time.monotonic_ns():x}"   # tile URLs change with the data
+    m = folium.Map(location=[float(pyramid.lat.mean()), float(pyramid.lon.mean())],
+                   zoom_start=4, prefer_canvas=True)
+    m.fit_bounds([[float(pyramid.lat.min()), float(pyramid.lon.min())],
+                  [float(pyramid.lat.max()), float(pyramid.lon.max())]])
+    m.get_root().script.add_child(folium.Element(
+        TILED_MAP_SCRIPT.substitute(map=m.get_name(), version=version)))
+    return pyramid, version, m.get_root().render()
+
+
+class MapTileServer:
+    # Loopback HTTP server for the tiled map: the page once, then one small
+    # JSON document per tile in view
+    def __init__(self, pyramid, version, page):
+        self.update(pyramid, version, page)
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server._handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.httpd.server_port}/"
+
+    def update(self, pyramid, version, page):
+        # Swap in new data; pages of the old version get no more tiles
+        self.pyramid, self.version, self.page = pyramid, version, page.encode('utf-8')
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _handle(self, request):
+        pyramid, version = self.pyramid, self.version
+        match = TILE_PATH.match(request.path)
+        if request.path == '/':
+            body, content_type = self.page, 'text/html; charset=utf-8'
+        elif match and match.group(1) == version:
+            zoom, x, y = (int(v) for v in match.groups()[1:])
+            if zoom > TILE_MAX_ZOOM or x >= 2 ** zoom or y >= 2 ** zoom:
+                request.send_error(404)
+                return
+            body = json.dumps(pyramid.tile(zoom, x, y), separators=(',', ':')).encode('utf-8')
+            content_type = 'application/json'
+        else:
+            request.send_error(404)
+            return
+        request.send_response(200)
+        request.send_header('Content-Type', content_type)
+        request.send_header('Content-Length', str(len(body)))
+        request.send_header('Cache-Control', 'no-cache' if request.path == '/' else 'max-age=3600')
+        request.end_headers()
+        request.wfile.write(body)
+
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = EARTH_RADIUS_KM * np.pi / 180
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = (np.radians(v) for v in (lat1, lon1, lat2, lon2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2 +
+         np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def longitude_ranges(west, east):
+    # [west, east] as one or two ranges within -180..180. Boxes crossing the
+    # antimeridian come as west > east or with a bound beyond +-180.
+    if west > east:
+        east += 360
+    if east - west >= 360:
+        return [(-180.0, 180.0)]
+    while west < -180:
+        west, east = west + 360, east + 360
+    while west > 180:
+        west, east = west - 360, east - 360
+    if east > 180:
+        return [(west, 180.0), (-180.0, east - 360)]
+    return [(west, east)]
+
+
+class SpatialIndex:
+    # Uniform lat/lon grid over customer coordinates. Points are sorted by
+    # cell so that each grid row of a query box is one contiguous slice,
+    # which keeps box, radius and nearest-customer queries local.
+    POINTS_PER_CELL = 16
+
+    def __init__(self, lat, lon, sales):
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        self.size = len(lat)
+        if self.size == 0:
+            raise ValueError("Cannot build a spatial index without coordinates")
+
+        self.lat0, self.lon0 = lat.min(), lon.min()
+        area = max(lat.max() - self.lat0, 1e-6) * max(lon.max() - self.lon0, 1e-6)
+        self.cell_size = max(np.sqrt(area * self.POINTS_PER_CELL / self.size), 1e-5)
+        self.n_rows = int((lat.max() - self.lat0) // self.cell_size) + 1
+        self.n_cols = int((lon.max() - self.lon0) // self.cell_size) + 1
+
+        cells = self._row(lat) * self.n_cols + self._col(lon)
+        self.order = np.argsort(cells, kind='stable')   # sorted slot -> row position
+        self.lat = lat[self.order]
+        self.lon = lon[self.order]
+        self.sales = np.asarray(sales, dtype=np.float64)[self.order]
+        self.cell_start = np.searchsorted(cells[self.order],
+                                          np.arange(self.n_rows * self.n_cols + 1))
+
+    @classmethod
+    def from_frame(cls, df):
+        return cls(df['Latitude'].to_numpy(), df['Longitude'].to_numpy(), df['Sales'].to_numpy())
+
+    def _row(self, lat):
+        return np.clip((np.asarray(lat) - self.lat0) // self.cell_size, 0, self.n_rows - 1).astype(np.int64)
+
+    def _col(self, lon):
+        return np.clip((np.asarray(lon) - self.lon0) // self.cell_size, 0, self.n_cols - 1).astype(np.int64)
+
+    def _candidates(self, south, west, north, east):
+        # Sorted slots of all points in the grid cells overlapping the box;
+        # boxes that cross the antimeridian are split in two
+        ranges = longitude_ranges(west, east)
+        if len(ranges) > 1:
+            return np.concatenate([self._candidates(south, w, north, e) for w, e in ranges])
+        west, east = ranges[0]
+        if (north < self.lat0 or east < self.lon0 or
+                south > self.lat0 + self.n_rows * self.cell_size or
+                west > self.lon0 + self.n_cols * self.cell_size):
+            return np.empty(0, dtype=np.int64)
+        r0, r1 = self._row(south), self._row(north)
+        c0, c1 = self._col(west), self._col(east)
+        starts = self.cell_start[np.arange(r0, r1 + 1) * self.n_cols + c0]
+        stops = self.cell_start[np.arange(r0, r1 + 1) * self.n_cols + c1 + 1]
+        # Expand the per-row slices into slot numbers without a Python loop
+        lengths = stops - starts
+        offsets = np.cumsum(lengths) - lengths
+        return np.repeat(starts - offsets, lengths) + np.arange(lengths.sum())
+
+    def _result(self, slots, distances=None):
+        result = {'positions': self.order[slots], 'sales': self.sales[slots],
+                  'count': len(slots), 'total_sales': float(self.sales[slots].sum())}
+        if distances is not None:
+            result['distances_km'] = distances
+        return result
+
+    def bbox(self, south, west, north, east):
+        slots = self._candidates(south, west, north, east)
+        lat, lon = self.lat[slots], self.lon[slots]
+        in_lon = np.zeros(len(slots), dtype=bool)
+        for w, e in longitude_ranges(west, east):
+            in_lon |= (lon >= w) & (lon <= e)
+        return self._result(slots[(lat >= south) & (lat <= north) & in_lon])
+
+    def _radius_box(self, lat, lon, radius_km):
+        dlat = radius_km / KM_PER_DEGREE
+        cos_lat = np.cos(np.radians(min(89.9, abs(lat) + dlat)))
+        dlon = min(360.0, dlat / max(cos_lat, 1e-6))
+        return lat - dlat, lon - dlon, lat + dlat, lon + dlon
+
+    def radius(self, lat, lon, radius_km):
+        # Customers within radius_km (great-circle distance), nearest first
+        slots = self._candidates(*self._radius_box(lat, lon, radius_km))
+        distances = haversine_km(lat, lon, self.lat[slots], self.lon[slots])
+        inside = distances <= radius_km
+        slots, distances = slots[inside], distances[inside]
+        order = np.argsort(distances, kind='stable')
+        return self._result(slots[order], distances[order])
+
+    def nearest(self, lat, lon, k):
+        k = min(int(k), self.size)
+        if k <= 0:
+            return self._result(np.empty(0, dtype=np.int64), np.empty(0))
+        # Grow a box around the point until it holds k candidates ...
+        half = self.cell_size
+        while True:
+            slots = self._candidates(lat - half, lon - half, lat + half, lon + half)
+            if len(slots) >= k or half > 360:
+                break
+            half *= 2
+        # ... then search the circle through the k-th candidate, which may
+        # reach beyond the box
+        distances = haversine_km(lat, lon, self.lat[slots], self.lon[slots])
+        reach = np.partition(distances, k - 1)[k - 1]
+        slots = self._candidates(*self._radius_box(lat, lon, reach))
+        distances = haversine_km(lat, lon, self.lat[slots], self.lon[slots])
+        nearest = np.argpartition(distances, k - 1)[:k] if len(slots) > k else np.arange(len(slots))
+        nearest = nearest[np.argsort(distances[nearest], kind='stable')]
+        return self._result(slots[nearest], distances[nearest])
+
+
+def read_geojson_regions(path):
+    # Region names and boundary rings (lon, lat arrays) of the Polygon and
+    # MultiPolygon features of a GeoJSON file; holes and the parts of
+    # multi-polygons are kept as further rings of the same region
+    try:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+    except ValueError as e:
+        raise DataFormatError(f"{os.path.basename(path)} is not valid GeoJSON: {e}")
+    if not isinstance(data, dict):
+        data = {}
+    features = data.get('features', []) if data.get('type') == 'FeatureCollection' else [data]
+    names, regions = [], []
+    for i, feature in enumerate(features):
+        geometry = feature.get('geometry') or {}
+        if geometry.get('type') == 'Polygon':
+            polygons = [geometry['coordinates']]
+        elif geometry.get('type') == 'MultiPolygon':
+            polygons = geometry['coordinates']
+        else:
+            continue
+        rings = [np.asarray(ring, dtype=np.float64)[:, :2] for polygon in polygons
+                 for ring in polygon if len(ring) >= 4]
+        if not rings:
+            continue
+        properties = feature.get('properties') or {}
+        name = next((properties[key] for key in REGION_NAME_PROPERTIES if properties.get(key)),
+                    feature.get('id', f"Region {i + 1}"))
+        names.append(str(name))
+        regions.append(rings)
+    if not regions:
+        raise DataFormatError(f"{os.path.basename(path)} contains no Polygon or MultiPolygon features")
+    return names, regions
+
+
+def simplify_ring(ring, tolerance):
+    # Douglas-Peucker simplification of a closed ring (first point == last)
+    n = len(ring)
+    if n <= 4 or tolerance <= 0:
+        return ring
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    # Split at the point farthest from the start so both halves have distinct ends
+    far = int(np.argmax(((ring - ring[0]) ** 2).sum(axis=1)))
+    keep[far] = True
+    stack = [(0, far), (far, n - 1)]
+    while stack:
+        a, b = stack.pop()
+        if b - a < 2:
+            continue
+        start, (dx, dy) = ring[a], ring[b] - ring[a]
+        inner = ring[a + 1:b] - start
+        length = np.hypot(dx, dy)
+        if length == 0:
+            distance = np.hypot(inner[:, 0], inner[:, 1])
+        else:
+            distance = np.abs(dx * inner[:, 1] - dy * inner[:, 0]) / length
+        i = int(np.argmax(distance))
+        if distance[i] > tolerance:
+            keep[a + 1 + i] = True
+            stack.extend([(a, a + 1 + i), (a + 1 + i, b)])
+    return ring[keep] if keep.sum() >= 4 else ring
+
+
+def pack_rings(regions):
+    # Flatten per-region ring lists into coordinates plus ring / region offsets
+    rings = [ring for region in regions for ring in region]
+    ring_starts = np.cumsum([0] + [len(ring) for ring in rings])
+    region_starts = np.cumsum([0] + [len(region) for region in regions])
+    return np.concatenate(rings), ring_starts, region_starts
+
+
+class RegionIndex:
+    # Point-in-polygon index over region boundaries. The edges of every
+    # region are bucketed into horizontal bands; a point is only tested by
+    # ray casting (even-odd over all rings, so holes and multi-polygons work)
+    # against the edges in its band, and only for the regions whose bounding
+    # box holds it. The simplified rings are kept for drawing.
+    EDGES_PER_BAND = 8
+    MAX_BANDS = 4096
+
+    def __init__(self, names, coords, ring_starts, region_starts, simplified):
+        self.names = list(names)
+        self.coords, self.ring_starts, self.region_starts = coords, ring_starts, region_starts
+        self.simplified = simplified   # (coords, ring_starts, region_starts)
+        self.key = None
+        n_regions = len(self.names)
+
+        # Edges between consecutive points of each ring
+        is_edge = np.ones(len(coords), dtype=bool)
+        is_edge[ring_starts[1:] - 1] = False
+        starts = np.flatnonzero(is_edge)
+        self.x1, self.y1 = coords[starts, 0], coords[starts, 1]
+        self.x2, self.y2 = coords[starts + 1, 0], coords[starts + 1, 1]
+        ring_of_point = np.repeat(np.arange(len(ring_starts) - 1), np.diff(ring_starts))
+        region_of_ring = np.repeat(np.arange(n_regions), np.diff(region_starts))
+        edge_region = region_of_ring[ring_of_point[starts]]
+
+        # Bounding box of each region
+        region_of_point = region_of_ring[ring_of_point]
+        self.west = np.full(n_regions, np.inf)
+        self.east = np.full(n_regions, -np.inf)
+        self.south = np.full(n_regions, np.inf)
+        self.north = np.full(n_regions, -np.inf)
+        np.minimum.at(self.west, region_of_point, coords[:, 0])
+        np.maximum.at(self.east, region_of_point, coords[:, 0])
+        np.minimum.at(self.south, region_of_point, coords[:, 1])
+        np.maximum.at(self.north, region_of_point, coords[:, 1])
+
+        # Bands of each region and the band range spanned by each edge
+        edge_counts = np.bincount(edge_region, minlength=n_regions)
+        self.bands = np.clip(edge_counts // self.EDGES_PER_BAND, 1, self.MAX_BANDS)
+        self.band_offset = np.concatenate([[0], np.cumsum(self.bands)])
+        self.band_height = np.maximum(self.north - self.south, 1e-12) / self.bands
+        low = self._band(edge_region, np.minimum(self.y1, self.y2))
+        high = self._band(edge_region, np.maximum(self.y1, self.y2))
+        lengths = high - low + 1
+        offsets = np.cumsum(lengths) - lengths
+        edge_bands = np.repeat(low - offsets, lengths) + np.arange(lengths.sum())
+        band_edges = np.repeat(np.arange(len(starts)), lengths)
+        order = np.argsort(edge_bands, kind='stable')
+        self.band_edges = band_edges[order]
+        self.band_start = np.searchsorted(edge_bands[order], np.arange(self.band_offset[-1] + 1))
+
+    def _band(self, region, y):
+        local = ((y - self.south[region]) / self.band_height[region]).astype(np.int64)
+        return self.band_offset[region] + np.clip(local, 0, self.bands[region] - 1)
+
+    @classmethod
+    def from_geojson(cls, path, cache=None):
+        # Parsing and simplifying large boundary files is slow; both are cached
+        key = cache.key(path, f"regions|{REGION_SIMPLIFY_FRACTION}") if cache is not None else None
+        stored = cache.load_arrays(key) if key is not None else None
+        if stored is not None:
+            arrays, names = stored
+            index = cls(names, arrays['coords'], arrays['ring_starts'], arrays['region_starts'],
+                        (arrays['simple_coords'], arrays['simple_ring_starts'],
+                         arrays['simple_region_starts']))
+        else:
+            names, regions = read_geojson_regions(path)
+            coords, ring_starts, region_starts = pack_rings(regions)
+            extent = max(np.ptp(coords[:, 0]), np.ptp(coords[:, 1]))
+            tolerance = extent * REGION_SIMPLIFY_FRACTION
+            simplified = pack_rings([[simplify_ring(ring, tolerance) for ring in region]
+                                     for region in regions])
+            index = cls(names, coords, ring_starts, region_starts, simplified)
+            if key is not None:
+                cache.store_arrays(key, {'coords': coords, 'ring_starts': ring_starts,
+                                         'region_starts': region_starts,
+                                         'simple_coords': simplified[0],
+                                         'simple_ring_starts': simplified[1],
+                                         'simple_region_starts': simplified[2]}, names)
+        index.key = key
+        return index
+
+    def assign(self, lat, lon):
+        # Region number of each point, -1 outside all regions (the first
+        # matching region wins where regions overlap)
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        result = np.full(len(lat), -1, dtype=np.int64)
+        order = np.argsort(lon, kind='stable')
+        sorted_lon = lon[order]
+        for region in range(len(self.names)):
+            lo = np.searchsorted(sorted_lon, self.west[region], side='left')
+            hi = np.searchsorted(sorted_lon, self.east[region], side='right')
+            candidates = order[lo:hi]
+            candidates = candidates[(lat[candidates] >= self.south[region]) &
+                                    (lat[candidates] <= self.north[region]) &
+                                    (result[candidates] < 0)]
+            if len(candidates):
+                inside = self._contains(region, lon[candidates], lat[candidates])
+                result[candidates[inside]] = region
+        return result
+
+    def _contains(self, region, x, y):
+        band = self._band(np.full(len(y), region), y)
+        starts = self.band_start[band]
+        lengths = self.band_start[band + 1] - starts
+        crossings = np.zeros(len(y), dtype=np.int64)
+        # Expand to (point, edge) pairs a chunk of points at a time
+        ends = np.cumsum(lengths)
+        i = 0
+        while i < len(y):
+            j = max(i + 1, int(np.searchsorted(ends, ends[i] - lengths[i] + REGION_PAIR_CHUNK, side='right')))
+            n = lengths[i:j]
+            point = np.repeat(np.arange(i, j), n)
+            offsets = np.cumsum(n) - n
+            edge = self.band_edges[np.repeat(starts[i:j] - offsets, n) + np.arange(n.sum())]
+            px, py = x[point], y[point]
+            y1, y2 = self.y1[edge], self.y2[edge]
+            cross = (y1 > py) != (y2 > py)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                x_at = self.x1[edge] + (py - y1) * (self.x2[edge] - self.x1[edge]) / (y2 - y1)
+            cross &= px < x_at
+            crossings[i:j] += np.bincount(point[cross] - i, minlength=j - i)
+            i = j
+        return crossings % 2 == 1
+
+    def cached_assign(self, lat, lon, cache=None):
+        # Assignments depend only on the geometry and the coordinates
+        if cache is None or self.key is None:
+            return self.assign(lat, lon)
+        lat = np.ascontiguousarray(lat, dtype=np.float64)
+        lon = np.ascontiguousarray(lon, dtype=np.float64)
+        digest = hashlib.blake2b(self.key.encode(), digest_size=20)
+        digest.update(lat.tobytes())
+        digest.update(lon.tobytes())
+        key = digest.hexdigest()
+        stored = cache.load_arrays(key)
+        if stored is not None:
+            return stored[0]['region']
+        result = self.assign(lat, lon)
+        cache.store_arrays(key, {'region': result})
+        return result
+
+    def geometry(self, region):
+        # Simplified rings as one GeoJSON polygon; Leaflet fills with the
+        # even-odd rule, so holes and separate parts both draw correctly
+        coords, ring_starts, region_starts = self.simplified
+        rings = [coords[ring_starts[r]:ring_starts[r + 1]].round(5).tolist()
+                 for r in range(region_starts[region], region_starts[region + 1])]
+        return {'type': 'Polygon', 'coordinates': rings}
+
+
+def region_table(index, assignment, sales):
+    # Customers and sales per region, plus a row for customers outside all regions
+    n_regions = len(index.names)
+    codes = np.where(assignment < 0, n_regions, assignment)
+    counts = np.bincount(codes, minlength=n_regions + 1)
+    totals = np.bincount(codes, weights=np.nan_to_num(sales), minlength=n_regions + 1)
+    grand_total = totals.sum()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        average = np.where(counts > 0, totals / counts, np.nan)
+        share = totals / grand_total * 100 if grand_total else np.zeros_like(totals)
+    return pd.DataFrame({'Region': index.names + [REGION_OUTSIDE], 'Customers': counts,
+                         'Sales': totals, 'Average Sales': average, 'Share %': share})
+
+
+def build_region_map(index, table):
+    import folium
+
+    regions = table.iloc[:len(index.names)].assign(id=[str(r) for r in range(len(index.names))])
+    features = []
+    for region, (name, customers, sales, share) in enumerate(zip(
+            regions['Region'], regions['Customers'], regions['Sales'], regions['Share %'])):
+        features.append({'type': 'Feature', 'id': str(region), 'geometry': index.geometry(region),
+                         'properties': {'name': name, 'customers': f"{customers:,}",
+                                        'sales': f"{sales:,.0f}", 'share': f"{share:.1f}%"}})
+    geo_data = {'type': 'FeatureCollection', 'features': features}
+
+    m = folium.Map(location=[float(index.south.min() + index.north.max()) / 2,
+                             float(index.west.min() + index.east.max()) / 2], zoom_start=4)
+    m.fit_bounds([[float(index.south.min()), float(index.west.min())],
+                  [float(index.north.max()), float(index.east.max())]])
+    choropleth = folium.Choropleth(geo_data=geo_data, data=regions, columns=['id', 'Sales'],
+                                   key_on='feature.id', fill_color='YlOrRd', fill_opacity=0.7,
+                                   line_weight=1, nan_fill_color='white', legend_name='Sales',
+                                   name='Sales by Region').add_to(m)
+    choropleth.geojson.add_child(folium.GeoJsonTooltip(
+        fields=['name', 'customers', 'sales', 'share'],
+        aliases=['Region:', 'Customers:', 'Sales:', 'Share:']))
+    folium.LayerControl().add_to(m)
+
+    outside = int(table['Customers'].iloc[-1])
+    m.map_summary = (f"{len(index.names):,} regions, {int(table['Customers'].sum()) - outside:,} "
+                     f"customers assigned, {outside:,} outside all regions "
+                     f"({len(index.simplified[0]):,} of {len(index.coords):,} boundary points drawn)")
+    return m
+
+
+def save_region_map_task(task, df, regions_path, map_path, cache=None):
+    task.report(0.05, "Loading region boundaries...")
+    with DIAGNOSTICS.stage('regions.load'):
+        index = RegionIndex.from_geojson(regions_path, cache)
+    task.check_cancelled()
+    task.report(0.3, f"Assigning {len(df):,} customers to {len(index.names):,} regions...")
+    with DIAGNOSTICS.stage('regions.assign', len(df)):
+        assignment = index.cached_assign(df['Latitude'].to_numpy(), df['Longitude'].to_numpy(), cache)
+    with DIAGNOSTICS.stage('regions.aggregate', len(df)):
+        table = region_table(index, assignment, df['Sales'].to_numpy(dtype=np.float64))
+    task.check_cancelled()
+    task.report(0.7, "Building region map...")
+    m = build_region_map(index, table)
+    task.report(0.9, "Writing map file...")
+    with DIAGNOSTICS.stage('map.serialize', len(index.names)):
+        m.save(map_path)
+    return map_path, m.map_summary, table
+
 
 class SalesVisualizationTool:
     def __init__(self, root):
@@ -18,6 +3780,29 @@ class SalesVisualizationTool:
         
         # Store the full dataset
         self.df = pd.DataFrame()
+        self.graph = build_analysis_graph()
+        # Database dataset in place of self.df while one is open
+        self.database = None
+        self.dataset = None
+        self.spatial_index = None
+        self.map_server = None
+        self.export_queue = collections.deque()   # report jobs, the first one running
+        # Watch mode: watched file, (mtime, size) of the loaded and the last
+        # polled version, row hashes of the loaded version
+        self.watch_path = None
+        self.watch_loaded = None
+        self.watch_seen = None
+        self.watch_hashes = None
+        self.watch_job = None
+        self.redraw_job = None
+        self.redraw_full = False
+        self.last_redraw = 0.0
+        
+        # Heavy work runs off the UI thread
+        self.tasks = TaskRunner(root)
+        self.cache = DatasetCache()
+        self.root.protocol("WM_DELETE_WINDOW", self._on_close)
+        self._create_status_bar()
         
         # Create main container
         self.main_container = ttk.Notebook(root)
@@ -33,11 +3818,90 @@ class SalesVisualizationTool:
         self.main_container.add(self.analysis_tab, text='Analysis')
         self.main_container.add(self.visualization_tab, text='Visualizations')
         self.main_container.add(self.map_tab, text='Map View')
+        self.diagnostics_tab = ttk.Frame(self.main_container)
+        self.main_container.add(self.diagnostics_tab, text='Diagnostics')
+        
+        # Analysis settings read by more than one tab
+        self.top_n_var = tk.StringVar(value="10")
+        self.rank_side_var = tk.StringVar(value="Top")
+        self.granularity_var = tk.StringVar(value="Monthly")
         
+        # Only the Data Import tab is built up front; the others (and their
+        # matplotlib canvases) are built when first shown
+        self.lazy_tabs = {
+            str(self.analysis_tab): ('analysis', self._create_analysis_tab, self._refresh_analysis_tab),
+            str(self.visualization_tab): ('visualization', self._create_visualization_tab,
+                                          self._refresh_visualization_tab),
+            str(self.map_tab): ('map', self._create_map_tab, None),
+        }
+        self.main_container.bind('<<NotebookTabChanged>>', self._on_tab_changed)
         self._create_data_tab()
-        self._create_analysis_tab()
-        self._create_visualization_tab()
-        self._create_map_tab()
+        self._create_diagnostics_tab()
+
+    def _on_tab_changed(self, event=None):
+        name, build, refresh = self.lazy_tabs.pop(self.main_container.select(), (None, None, None))
+        if build is not None:
+            with DIAGNOSTICS.operation('startup'), DIAGNOSTICS.stage('tab.' + name):
+                build()
+            if refresh is not None and self._has_data():
+                refresh()
+        self._refresh_diagnostics(False)
+
+    def _tab_built(self, tab):
+        return str(tab) not in self.lazy_tabs
+
+    def _has_data(self):
+        return self.dataset is not None or len(self.df) > 0
+
+    def _row_count(self):
+        return self.dataset.rows if self.dataset is not None else len(self.df)
+
+    def _create_status_bar(self):
+        status_frame = ttk.Frame(self.root)
+        status_frame.pack(side=tk.BOTTOM, fill=tk.X, padx=10, pady=(0, 5))
+        
+        self.status_var = tk.StringVar(value="Ready")
+        ttk.Label(status_frame, textvariable=self.status_var).pack(side=tk.LEFT, padx=5)
+        
+        self.cancel_button = ttk.Button(status_frame, text="Cancel", state=tk.DISABLED,
+                                        command=self._cancel_tasks)
+        self.cancel_button.pack(side=tk.RIGHT, padx=5)
+        
+        self.progress = ttk.Progressbar(status_frame, mode='determinate', maximum=1.0, length=200)
+        self.progress.pack(side=tk.RIGHT, padx=5)
+
+    def _run_task(self, kind, fn, *args, on_done=None, on_failed=None, error_message="Error"):
+        def on_error(e):
+            self._on_task_progress(None, 0, "Ready")
+            if isinstance(e, DataFormatError):
+                messagebox.showerror("Error", str(e))
+            else:
+                messagebox.showerror("Error", f"{error_message}: {str(e)}")
+            if on_failed:
+                on_failed(e)
+        
+        self.cancel_button.config(state=tk.NORMAL)
+        return self.tasks.submit(kind, fn, *args, on_done=on_done, on_error=on_error,
+                                 on_progress=self._on_task_progress)
+
+    def _on_task_progress(self, task, fraction, message):
+        self.progress['value'] = fraction
+        self.status_var.set(message)
+        if not self.tasks.busy():
+            self.cancel_button.config(state=tk.DISABLED)
+
+    def _cancel_tasks(self):
+        self.tasks.cancel()
+        self.export_queue.clear()
+        self._update_export_status()
+        self.status_var.set("Cancelling...")
+
+    def _on_close(self):
+        self._stop_watching()
+        self.tasks.shutdown()
+        if self.map_server is not None:
+            self.map_server.stop()
+        self.root.destroy()
 
     def _create_data_tab(self):
         # Analysis Type Selection Frame
@@ -55,14 +3919,26 @@ class SalesVisualizationTool:
         ttk.Radiobutton(analysis_frame, text="Map Analysis", 
                        variable=self.analysis_type, value="map",
                        command=self._update_help_text).pack(side=tk.LEFT, padx=20)
+        ttk.Radiobutton(analysis_frame, text="Time Series Analysis", 
+                       variable=self.analysis_type, value="timeseries",
+                       command=self._update_help_text).pack(side=tk.LEFT, padx=20)
         
         # Import frame
         import_frame = ttk.LabelFrame(self.data_tab, text="Import Data", padding="10")
         import_frame.pack(fill=tk.X, padx=5, pady=5)
         
-        ttk.Button(import_frame, text="Import Excel File", 
+        ttk.Button(import_frame, text="Import Excel Files", 
                   command=self._import_excel_file).pack(side=tk.LEFT, padx=5)
         
+        self.use_cache = tk.BooleanVar(value=True)
+        ttk.Checkbutton(import_frame, text="Use cache", 
+                       variable=self.use_cache).pack(side=tk.LEFT, padx=5)
+        
+        # Replace the dataset or merge new rows into it by customer
+        self.import_mode = tk.StringVar(value="Replace")
+        ttk.Combobox(import_frame, textvariable=self.import_mode, values=list(IMPORT_MODES),
+                    state='readonly', width=15).pack(side=tk.LEFT, padx=5)
+        
         ttk.Label(import_frame, text="Or paste Excel data:").pack(side=tk.LEFT, padx=5)
         self.paste_area = tk.Text(import_frame, height=4, width=50)
         self.paste_area.pack(side=tk.LEFT, padx=5)
@@ -70,34 +3946,64 @@ class SalesVisualizationTool:
         ttk.Button(import_frame, text="Import Pasted Data", 
                   command=self._import_pasted_data).pack(side=tk.LEFT, padx=5)
         
+        # Large copies go straight from the clipboard, not through the text box
+        ttk.Button(import_frame, text="Import from Clipboard", 
+                  command=self._import_clipboard).pack(side=tk.LEFT, padx=5)
+        
+        # Re-import an exported file whenever it is rewritten
+        self.watch_button = ttk.Button(import_frame, text="Watch File...", 
+                                       command=self._toggle_watch)
+        self.watch_button.pack(side=tk.LEFT, padx=5)
+        
         # Dynamic help text based on analysis type
         self.help_label = ttk.Label(import_frame, foreground="gray")
         self.help_label.pack(side=tk.LEFT, padx=5)
         
+        # Imports can go to a SQLite file instead of memory, for datasets
+        # larger than RAM; analyses then run as queries on the file
+        storage_frame = ttk.LabelFrame(self.data_tab, text="Storage", padding="10")
+        storage_frame.pack(fill=tk.X, padx=5, pady=5)
+        
+        self.use_database = tk.BooleanVar(value=False)
+        ttk.Checkbutton(storage_frame, text="Import into database", 
+                       variable=self.use_database).pack(side=tk.LEFT, padx=5)
+        
+        self.database_path_var = tk.StringVar(value="sales.db")
+        ttk.Entry(storage_frame, textvariable=self.database_path_var, width=40).pack(side=tk.LEFT, padx=5)
+        ttk.Button(storage_frame, text="Browse...", 
+                  command=self._browse_database).pack(side=tk.LEFT, padx=5)
+        
+        ttk.Label(storage_frame, text="Dataset:").pack(side=tk.LEFT, padx=5)
+        self.dataset_name_var = tk.StringVar(value="sales")
+        self.dataset_combo = ttk.Combobox(storage_frame, textvariable=self.dataset_name_var, width=20,
+                                          postcommand=self._update_dataset_names)
+        self.dataset_combo.pack(side=tk.LEFT, padx=5)
+        
+        ttk.Button(storage_frame, text="Open Dataset", 
+                  command=self._open_dataset).pack(side=tk.LEFT, padx=5)
+        
         # Table frame
         table_frame = ttk.LabelFrame(self.data_tab, text="Data Preview", padding="10")
         table_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
         
-        # Create Treeview with scrollbar
-        self.tree_scroll = ttk.Scrollbar(table_frame)
-        self.tree_scroll.pack(side=tk.RIGHT, fill=tk.Y)
-        
-        # Create Treeview with initial columns
-        if self.analysis_type.get() == "yoy":
-            columns = ('customer', 'current_cases', 'previous_cases', 'growth')
-        elif self.analysis_type.get() == "target":
-            columns = ('customer', 'current_cases', 'target', 'achievement')
-        else:  # map analysis
-            columns = ('customer', 'sales', 'latitude', 'longitude')
-            
-        self.tree = ttk.Treeview(table_frame, columns=columns, show='headings',
-                                yscrollcommand=self.tree_scroll.set)
+        # Virtual preview: only the visible rows are inserted into the Treeview
+        self.tree_view = VirtualTreeview(table_frame, [column for column, _ in
+                                                       TREE_COLUMNS[self.analysis_type.get()]])
+        self.tree = self.tree_view.tree
+        self.tree_scroll = self.tree_view.scrollbar
         
         # Set initial column headings
         self._update_tree_columns()
         
-        self.tree.pack(fill=tk.BOTH, expand=True)
-        self.tree_scroll.config(command=self.tree.yview)
+        # Memory held by the loaded dataset, per column
+        self.footprint_label = ttk.Label(table_frame, foreground="gray")
+        self.footprint_label.pack(side=tk.BOTTOM, anchor=tk.W)
+        
+        # Rows flagged by the data quality pass after every import
+        self.quality_label = ttk.Label(table_frame, foreground="gray")
+        self.quality_label.pack(side=tk.BOTTOM, anchor=tk.W)
+        
+        self.tree_view.pack(fill=tk.BOTH, expand=True)
         
         # Update help text
         self._update_help_text()
@@ -107,64 +4013,224 @@ class SalesVisualizationTool:
         control_frame = ttk.LabelFrame(self.map_tab, text="Map Controls", padding="10")
         control_frame.pack(fill=tk.X, padx=5, pady=5)
         
-        ttk.Button(control_frame, text="Generate Map", 
-                  command=self._generate_map).pack(side=tk.LEFT, padx=5)
+        ttk.Button(control_frame, text="Generate Map", 
+                  command=self._generate_map).pack(side=tk.LEFT, padx=5)
+        
+        ttk.Button(control_frame, text="Open in Browser", 
+                  command=self._open_map_in_browser).pack(side=tk.LEFT, padx=5)
+        
+        # Streams only the tiles in view from a local server; for very large datasets
+        ttk.Button(control_frame, text="Serve Tiled Map", 
+                  command=self._serve_tiled_map).pack(side=tk.LEFT, padx=5)
+        
+        # Rendering options for large customer lists
+        ttk.Label(control_frame, text="Cluster above:").pack(side=tk.LEFT, padx=5)
+        self.cluster_threshold_var = tk.StringVar(value=str(MAP_CLUSTER_THRESHOLD))
+        ttk.Entry(control_frame, textvariable=self.cluster_threshold_var, width=8).pack(side=tk.LEFT, padx=5)
+        
+        ttk.Label(control_frame, text="Heat cell (deg, blank=auto):").pack(side=tk.LEFT, padx=5)
+        self.heat_cell_var = tk.StringVar(value="")
+        ttk.Entry(control_frame, textvariable=self.heat_cell_var, width=8).pack(side=tk.LEFT, padx=5)
+        
+        # Choropleth of customers aggregated into the regions of a GeoJSON file
+        region_frame = ttk.LabelFrame(self.map_tab, text="Region Map", padding="10")
+        region_frame.pack(fill=tk.X, padx=5, pady=5)
+        ttk.Label(region_frame, text="Boundaries (GeoJSON):").pack(side=tk.LEFT, padx=5)
+        self.regions_path_var = tk.StringVar()
+        ttk.Entry(region_frame, textvariable=self.regions_path_var, width=60).pack(side=tk.LEFT, padx=5)
+        ttk.Button(region_frame, text="Browse...", 
+                  command=self._browse_regions).pack(side=tk.LEFT, padx=5)
+        ttk.Button(region_frame, text="Generate Region Map", 
+                  command=self._generate_region_map).pack(side=tk.LEFT, padx=5)
+        
+        # Map info frame
+        self.map_info_frame = ttk.LabelFrame(self.map_tab, text="Map Information", padding="10")
+        self.map_info_frame.pack(fill=tk.X, padx=5, pady=5)
+        
+        ttk.Label(self.map_info_frame, 
+                 text="Hover over points to see customer and sales information").pack()
+        self.map_summary_label = ttk.Label(self.map_info_frame, foreground="gray")
+        self.map_summary_label.pack()
+        
+        self._create_spatial_query_frame()
+
+    def _create_spatial_query_frame(self):
+        query_frame = ttk.LabelFrame(self.map_tab, text="Spatial Query", padding="10")
+        query_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        
+        # Point queries: radius and nearest customers
+        point_frame = ttk.Frame(query_frame)
+        point_frame.pack(fill=tk.X, pady=2)
+        self.query_vars = {}
+        for label, key, default in [("Latitude:", 'lat', ""), ("Longitude:", 'lon', ""),
+                                    ("Radius (km):", 'radius', "50"), ("K:", 'k', "20")]:
+            ttk.Label(point_frame, text=label).pack(side=tk.LEFT, padx=5)
+            self.query_vars[key] = tk.StringVar(value=default)
+            ttk.Entry(point_frame, textvariable=self.query_vars[key], width=10).pack(side=tk.LEFT, padx=5)
+        ttk.Button(point_frame, text="Within Radius", 
+                  command=lambda: self._run_spatial_query('radius')).pack(side=tk.LEFT, padx=5)
+        ttk.Button(point_frame, text="Nearest K", 
+                  command=lambda: self._run_spatial_query('nearest')).pack(side=tk.LEFT, padx=5)
+        
+        # Bounding box query
+        box_frame = ttk.Frame(query_frame)
+        box_frame.pack(fill=tk.X, pady=2)
+        for label, key in [("South:", 'south'), ("West:", 'west'), ("North:", 'north'), ("East:", 'east')]:
+            ttk.Label(box_frame, text=label).pack(side=tk.LEFT, padx=5)
+            self.query_vars[key] = tk.StringVar()
+            ttk.Entry(box_frame, textvariable=self.query_vars[key], width=10).pack(side=tk.LEFT, padx=5)
+        ttk.Button(box_frame, text="In Box", 
+                  command=lambda: self._run_spatial_query('bbox')).pack(side=tk.LEFT, padx=5)
+        
+        self.query_summary_label = ttk.Label(query_frame, text="")
+        self.query_summary_label.pack(fill=tk.X, pady=2)
+        
+        columns = ('customer', 'sales', 'latitude', 'longitude', 'distance')
+        self.query_results = VirtualTreeview(query_frame, columns)
+        for col, heading in zip(columns, ['Customer', 'Sales', 'Latitude', 'Longitude', 'Distance (km)']):
+            self.query_results.tree.heading(col, text=heading)
+            self.query_results.tree.column(col, width=150)
+        self.query_results.pack(fill=tk.BOTH, expand=True)
+
+    def _build_spatial_index(self):
+        self.spatial_index = None
+        if self.analysis_type.get() != "map" or not self._has_data():
+            return
+        if self.dataset is not None:
+            # Box and radius queries go through the coordinate index of the table
+            self.spatial_index = self.dataset
+            return
+        
+        def on_done(index):
+            self.spatial_index = index
+            self._on_task_progress(None, 1.0, f"Spatial index ready ({index.size:,} customers)")
+        
+        self._run_task('spatial', lambda task, df: SpatialIndex.from_frame(df), self.df,
+                       on_done=on_done, error_message="Error building spatial index")
+
+    def _run_spatial_query(self, kind):
+        if self.spatial_index is None:
+            messagebox.showwarning("Warning", "Please import map data first!")
+            return
+        try:
+            values = {key: float(var.get()) for key, var in self.query_vars.items()
+                      if var.get().strip()}
+            start = time.perf_counter()
+            if kind == 'radius':
+                result = self.spatial_index.radius(values['lat'], values['lon'], values['radius'])
+                description = f"within {values['radius']:,.1f} km"
+            elif kind == 'nearest' and self.dataset is not None:
+                messagebox.showwarning("Warning", "Nearest customers are not available for database datasets; "
+                                                  "use a radius query instead")
+                return
+            elif kind == 'nearest':
+                result = self.spatial_index.nearest(values['lat'], values['lon'], int(values['k']))
+                description = f"nearest {int(values['k'])}"
+            else:
+                result = self.spatial_index.bbox(values['south'], values['west'],
+                                                 values['north'], values['east'])
+                description = "in box"
+            elapsed = (time.perf_counter() - start) * 1000
+        except KeyError:
+            messagebox.showwarning("Warning", "Please fill in the query coordinates first!")
+            return
+        except ValueError as e:
+            messagebox.showerror("Error", f"Invalid query: {str(e)}")
+            return
+        
+        self.query_summary_label.config(
+            text=f"{result['count']:,} customers {description}, total sales "
+                 f"{result['total_sales']:,.0f} ({elapsed:.2f} ms)")
         
-        ttk.Button(control_frame, text="Open in Browser", 
-                  command=self._open_map_in_browser).pack(side=tk.LEFT, padx=5)
+        rows = result['rows'] if 'rows' in result else self.df.iloc[result['positions']]
+        distances = result.get('distances_km')
+        formats = PREVIEW_FORMATS['map']
         
-        # Map info frame
-        self.map_info_frame = ttk.LabelFrame(self.map_tab, text="Map Information", padding="10")
-        self.map_info_frame.pack(fill=tk.X, padx=5, pady=5)
+        def fetch(start, stop):
+            block = format_preview_rows(rows, formats, start, stop)
+            if distances is None:
+                return [cells + ('',) for cells in block]
+            return [cells + (f"{d:,.2f}",) for cells, d in zip(block, distances[start:stop].tolist())]
         
-        ttk.Label(self.map_info_frame, 
-                 text="Hover over points to see customer and sales information").pack()
+        self.query_results.set_source(len(rows), fetch)
 
     def _generate_map(self):
+        if not self._has_data():
+            messagebox.showwarning("Warning", "Please import data first!")
+            return
+        
         try:
-            if len(self.df) == 0:
-                messagebox.showwarning("Warning", "Please import data first!")
-                return
-                
-            # Create map centered on the mean of coordinates
-            center_lat = self.df['Latitude'].mean()
-            center_lon = self.df['Longitude'].mean()
-            m = folium.Map(location=[center_lat, center_lon], zoom_start=4)
-            
-            # Add markers for each point
-            for idx, row in self.df.iterrows():
-                popup_content = f"""
-                    <div style='width:200px'>
-                        <b>Customer:</b> {row['Customer']}<br>
-                        <b>Sales:</b> {row['Sales']:,.0f}<br>
-                        <b>Location:</b> {row['Latitude']:.4f}, {row['Longitude']:.4f}
-                    </div>
-                """
-                
-                folium.CircleMarker(
-                    location=[row['Latitude'], row['Longitude']],
-                    radius=np.sqrt(row['Sales'])/100,  # Size based on sales
-                    popup=folium.Popup(popup_content, max_width=300),
-                    tooltip=f"{row['Customer']}: {row['Sales']:,.0f}",
-                    color='blue',
-                    fill=True,
-                    fill_opacity=0.6
-                ).add_to(m)
-            
-            # Add heatmap layer
-            heat_data = [[row['Latitude'], row['Longitude'], row['Sales']] 
-                        for idx, row in self.df.iterrows()]
-            plugins.HeatMap(heat_data).add_to(m)
-            
-            # Save map
-            self.map_path = "sales_map.html"
-            m.save(self.map_path)
-            
+            cluster_threshold = int(self.cluster_threshold_var.get())
+        except ValueError:
+            cluster_threshold = MAP_CLUSTER_THRESHOLD
+        try:
+            heat_cell_size = float(self.heat_cell_var.get()) if self.heat_cell_var.get().strip() else None
+        except ValueError:
+            heat_cell_size = None
+        
+        def on_done(result):
+            self.map_path, summary = result
+            self.map_summary_label.config(text=summary)
+            self._on_task_progress(None, 1.0, "Map saved to " + self.map_path)
             # Open in default browser
             webbrowser.open(self.map_path)
-            
-        except Exception as e:
-            messagebox.showerror("Error", f"Error generating map: {str(e)}")
+        
+        if self.dataset is not None:
+            self._run_task('map', database_map_task, self.dataset, "sales_map.html",
+                           cluster_threshold, heat_cell_size,
+                           on_done=on_done, error_message="Error generating map")
+            return
+        self._run_task('map', save_map_task, self.df, "sales_map.html",
+                       cluster_threshold, heat_cell_size,
+                       on_done=on_done, error_message="Error generating map")
+
+    def _browse_regions(self):
+        path = filedialog.askopenfilename(
+            filetypes=[("GeoJSON files", "*.geojson *.json"), ("All files", "*.*")])
+        if path:
+            self.regions_path_var.set(path)
+        return path
+
+    def _generate_region_map(self):
+        if self._database_unsupported("Region maps"):
+            return
+        if 'Latitude' not in self.df:
+            messagebox.showwarning("Warning", "Please import map data first!")
+            return
+        regions_path = self.regions_path_var.get().strip() or self._browse_regions()
+        if not regions_path:
+            return
+        
+        def on_done(result):
+            self.map_path, summary, _ = result
+            self.map_summary_label.config(text=summary)
+            self._on_task_progress(None, 1.0, "Region map saved to " + self.map_path)
+            webbrowser.open(self.map_path)
+        
+        cache = self.cache if self.use_cache.get() else None
+        self._run_task('map', save_region_map_task, self.df, regions_path, "sales_regions.html", cache,
+                       on_done=on_done, error_message="Error generating region map")
+
+    def _serve_tiled_map(self):
+        if self._database_unsupported("Tiled maps"):
+            return
+        if len(self.df) == 0:
+            messagebox.showwarning("Warning", "Please import data first!")
+            return
+        
+        def on_done(result):
+            if self.map_server is None:
+                self.map_server = MapTileServer(*result)
+            else:
+                self.map_server.update(*result)
+            pyramid = result[0]
+            self.map_summary_label.config(
+                text=f"{pyramid.size:,} customers served as tiles at {self.map_server.url}")
+            self._on_task_progress(None, 1.0, "Serving map at " + self.map_server.url)
+            webbrowser.open(self.map_server.url)
+        
+        self._run_task('map', build_tiled_map_task, self.df,
+                       on_done=on_done, error_message="Error building tiled map")
 
     def _open_map_in_browser(self):
         if hasattr(self, 'map_path') and os.path.exists(self.map_path):
@@ -177,55 +4243,76 @@ class SalesVisualizationTool:
             help_text = "Column order: 1st=Customer, 2nd=Current Sales, 3rd=Previous Sales"
         elif self.analysis_type.get() == "target":
             help_text = "Column order: 1st=Customer, 2nd=Current Sales, 3rd=Target"
+        elif self.analysis_type.get() == "timeseries":
+            help_text = "Column order: 1st=Customer, 2nd=Date, 3rd=Sales (one row per sale)"
         else:  # map analysis
             help_text = "Column order: 1st=Customer, 2nd=Sales, 3rd=Latitude, 4th=Longitude"
         self.help_label.config(text=help_text)
         self._update_tree_columns()
 
     def _update_tree_columns(self):
-        if self.analysis_type.get() == "yoy":
-            columns = ('customer', 'current_cases', 'previous_cases', 'growth')
-            self.tree['columns'] = columns
-            
-            self.tree.heading('customer', text='Customer')
-            self.tree.heading('current_cases', text='Current Cases')
-            self.tree.heading('previous_cases', text='Previous Cases')
-            self.tree.heading('growth', text='Growth %')
-        elif self.analysis_type.get() == "target":
-            columns = ('customer', 'current_cases', 'target', 'achievement')
-            self.tree['columns'] = columns
-            
-            self.tree.heading('customer', text='Customer')
-            self.tree.heading('current_cases', text='Current Cases')
-            self.tree.heading('target', text='Target Cases')
-            self.tree.heading('achievement', text='Achievement %')
-        else:  # map analysis
-            columns = ('customer', 'sales', 'latitude', 'longitude')
-            self.tree['columns'] = columns
-            
-            self.tree.heading('customer', text='Customer')
-            self.tree.heading('sales', text='Sales')
-            self.tree.heading('latitude', text='Latitude')
-            self.tree.heading('longitude', text='Longitude')
-        
-        # Set column widths
-        for col in columns:
-            self.tree.column(col, width=150)
+        columns = TREE_COLUMNS[self.analysis_type.get()]
+        self.tree['columns'] = [column for column, _ in columns]
+        for column, heading in columns:
+            self.tree.heading(column, text=heading)
+            self.tree.column(column, width=150)
 
     def _create_analysis_tab(self):
         # Control Frame
         control_frame = ttk.LabelFrame(self.analysis_tab, text="Analysis Controls", padding="10")
         control_frame.pack(fill=tk.X, padx=5, pady=5)
+        self.analysis_control_frame = control_frame
         
-        # Top N control
-        ttk.Label(control_frame, text="Show Top N:").pack(side=tk.LEFT, padx=5)
-        self.top_n_var = tk.StringVar(value="10")
+        # Top/Bottom N control; the slider redraws as it moves
+        ttk.Label(control_frame, text="Show:").pack(side=tk.LEFT, padx=5)
+        side_combo = ttk.Combobox(control_frame, textvariable=self.rank_side_var,
+                                  values=["Top", "Bottom"], state='readonly', width=7)
+        side_combo.pack(side=tk.LEFT, padx=5)
+        side_combo.bind('<<ComboboxSelected>>', lambda e: self._update_analysis())
         top_n_entry = ttk.Entry(control_frame, textvariable=self.top_n_var, width=5)
         top_n_entry.pack(side=tk.LEFT, padx=5)
+        self.top_n_job = None
+        self.top_n_slider = ttk.Scale(control_frame, from_=1, to=TOP_N_SLIDER_MAX, length=150,
+                                      orient=tk.HORIZONTAL, command=self._on_top_n_slider)
+        self.top_n_slider.set(int(self.top_n_var.get()))
+        self.top_n_slider.pack(side=tk.LEFT, padx=5)
         
         ttk.Button(control_frame, text="Update Analysis", 
                   command=self._update_analysis).pack(side=tk.LEFT, padx=5)
         
+        # Period length of time series analysis
+        ttk.Label(control_frame, text="Granularity:").pack(side=tk.LEFT, padx=5)
+        granularity_combo = ttk.Combobox(control_frame, textvariable=self.granularity_var,
+                                         values=list(GRANULARITIES), state='readonly', width=10)
+        granularity_combo.pack(side=tk.LEFT, padx=5)
+        granularity_combo.bind('<<ComboboxSelected>>', self._on_granularity_changed)
+        
+        # Rows flagged by the data quality pass can be left out or inspected
+        ttk.Label(control_frame, text="Rows:").pack(side=tk.LEFT, padx=5)
+        self.quality_filter_var = tk.StringVar(value="All rows")
+        quality_combo = ttk.Combobox(control_frame, textvariable=self.quality_filter_var,
+                                     values=list(QUALITY_FILTERS), state='readonly', width=14)
+        quality_combo.pack(side=tk.LEFT, padx=5)
+        quality_combo.bind('<<ComboboxSelected>>', lambda e: self._update_analysis())
+        
+        # Rank of a single customer by every ranked column
+        rank_frame = ttk.LabelFrame(self.analysis_tab, text="Customer Rank", padding="10")
+        rank_frame.pack(fill=tk.X, padx=5, pady=5)
+        ttk.Label(rank_frame, text="Customer:").pack(side=tk.LEFT, padx=5)
+        self.rank_customer_var = tk.StringVar()
+        rank_entry = ttk.Entry(rank_frame, textvariable=self.rank_customer_var, width=25)
+        rank_entry.pack(side=tk.LEFT, padx=5)
+        rank_entry.bind('<Return>', lambda e: self._find_customer_rank())
+        ttk.Button(rank_frame, text="Find Rank", 
+                  command=self._find_customer_rank).pack(side=tk.LEFT, padx=5)
+        self.rank_result_label = ttk.Label(rank_frame)
+        self.rank_result_label.pack(side=tk.LEFT, padx=5)
+        
+        # Drill-down controls, filled in when the data has dimension columns
+        self.drill_frame = ttk.LabelFrame(self.analysis_tab, text="Drill Down", padding="10")
+        self.drill_vars = []
+        self.breakdown_var = tk.StringVar(value="(none)")
+        
         # Summary Frame
         self.summary_frame = ttk.LabelFrame(self.analysis_tab, text="Summary Statistics", padding="10")
         self.summary_frame.pack(fill=tk.X, padx=5, pady=5)
@@ -235,6 +4322,8 @@ class SalesVisualizationTool:
         self.analysis_plot_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
         
         # Create figure and canvas for analysis
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
+        from matplotlib.figure import Figure
         self.analysis_fig = Figure(figsize=(10, 6))
         self.analysis_canvas = FigureCanvasTkAgg(self.analysis_fig, master=self.analysis_plot_frame)
         self.analysis_canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
@@ -252,18 +4341,33 @@ class SalesVisualizationTool:
         ttk.Label(control_frame, text="Chart Type:").pack(side=tk.LEFT, padx=5)
         self.chart_type = tk.StringVar(value="bar")
         chart_combo = ttk.Combobox(control_frame, textvariable=self.chart_type,
-                                 values=["bar", "line", "scatter", "pie"])
+                                 values=CHART_TYPES)
         chart_combo.pack(side=tk.LEFT, padx=5)
         
         ttk.Button(control_frame, text="Update Visualization", 
                   command=self._update_visualization).pack(side=tk.LEFT, padx=5)
         
+        # Reports are rendered in the background; further exports are queued
+        ttk.Separator(control_frame, orient=tk.VERTICAL).pack(side=tk.LEFT, fill=tk.Y, padx=10)
+        ttk.Label(control_frame, text="Report per:").pack(side=tk.LEFT, padx=5)
+        self.export_split_var = tk.StringVar(value="(none)")
+        self.export_split_combo = ttk.Combobox(control_frame, textvariable=self.export_split_var,
+                                               values=["(none)"], state='readonly', width=12)
+        self.export_split_combo.pack(side=tk.LEFT, padx=5)
+        ttk.Button(control_frame, text="Export Report...", 
+                  command=self._export_report).pack(side=tk.LEFT, padx=5)
+        self.export_status_label = ttk.Label(control_frame, foreground="gray")
+        self.export_status_label.pack(side=tk.LEFT, padx=5)
+        
         # Visualization Plot Frame
         self.viz_plot_frame = ttk.Frame(self.visualization_tab)
         self.viz_plot_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
         
         # Create figure and canvas for visualization
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
+        from matplotlib.figure import Figure
         self.viz_fig = Figure(figsize=(10, 6))
+        self.viz_renderer = ChartRenderer(self.viz_fig)
         self.viz_canvas = FigureCanvasTkAgg(self.viz_fig, master=self.viz_plot_frame)
         self.viz_canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
         
@@ -271,370 +4375,1281 @@ class SalesVisualizationTool:
         self.viz_toolbar = NavigationToolbar2Tk(self.viz_canvas, self.viz_plot_frame)
         self.viz_toolbar.update()
 
-    def _import_excel_file(self):
-        file_path = filedialog.askopenfilename(
-            filetypes=[("Excel files", "*.xlsx *.xls"), ("All files", "*.*")])
-        if file_path:
+    def _create_diagnostics_tab(self):
+        control_frame = ttk.Frame(self.diagnostics_tab)
+        control_frame.pack(fill=tk.X, padx=5, pady=5)
+        
+        self.track_memory = tk.BooleanVar(value=False)
+        ttk.Checkbutton(control_frame, text="Track memory (slower)", variable=self.track_memory,
+                        command=lambda: DIAGNOSTICS.set_memory_tracking(self.track_memory.get())
+                        ).pack(side=tk.LEFT, padx=5)
+        ttk.Button(control_frame, text="Profile Next Operation",
+                   command=self._arm_profile_capture).pack(side=tk.LEFT, padx=5)
+        ttk.Button(control_frame, text="Clear",
+                   command=DIAGNOSTICS.clear).pack(side=tk.LEFT, padx=5)
+        ttk.Button(control_frame, text="Export JSON...",
+                   command=self._export_diagnostics).pack(side=tk.LEFT, padx=5)
+        
+        # Stage log, newest first
+        columns = ('Operation', 'Stage', 'Time (ms)', 'Rows', 'Memory (MB)')
+        log_frame = ttk.LabelFrame(self.diagnostics_tab, text="Stage Timings", padding="5")
+        log_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        self.diagnostics_tree = ttk.Treeview(log_frame, columns=columns, show='headings', height=12)
+        for col in columns:
+            self.diagnostics_tree.heading(col, text=col)
+            self.diagnostics_tree.column(col, width=120)
+        scrollbar = ttk.Scrollbar(log_frame, command=self.diagnostics_tree.yview)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.diagnostics_tree.configure(yscrollcommand=scrollbar.set)
+        self.diagnostics_tree.pack(fill=tk.BOTH, expand=True)
+        
+        # Output of the last profiled operation
+        capture_frame = ttk.LabelFrame(self.diagnostics_tab, text="Profile Capture", padding="5")
+        capture_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        self.capture_text = tk.Text(capture_frame, height=12, wrap=tk.NONE, font=('Courier', 9))
+        self.capture_text.pack(fill=tk.BOTH, expand=True)
+        
+        self._diagnostics_version = -1
+        self._refresh_diagnostics()
+
+    def _refresh_diagnostics(self, reschedule=True):
+        # Redraw only while the tab is visible and something was recorded
+        if reschedule:
+            self.root.after(1000, self._refresh_diagnostics)
+        visible = self.main_container.select() == str(self.diagnostics_tab)
+        if not visible or DIAGNOSTICS.version == self._diagnostics_version:
+            return
+        self._diagnostics_version = DIAGNOSTICS.version
+        
+        self.diagnostics_tree.delete(*self.diagnostics_tree.get_children())
+        for record in reversed(list(DIAGNOSTICS.records)):
+            self.diagnostics_tree.insert('', tk.END, values=(
+                record['operation'], record['stage'], f"{record['seconds'] * 1000:,.1f}",
+                '' if record['rows'] is None else f"{record['rows']:,}",
+                '' if record['memory_mb'] is None else f"{record['memory_mb']:+,.1f}"))
+        
+        self.capture_text.delete("1.0", tk.END)
+        capture = DIAGNOSTICS.capture
+        if capture:
+            self.capture_text.insert(tk.END, (
+                f"{capture['operation']}: {capture['seconds']:.3f} s, "
+                f"peak {capture['peak_mb']:,.1f} MB\n\n{capture['profile']}\n"
+                "Allocations by line:\n" + "\n".join(capture['allocations'])))
+
+    def _arm_profile_capture(self):
+        DIAGNOSTICS.capture_next = True
+        self.status_var.set("The next background operation will be profiled")
+
+    def _export_diagnostics(self):
+        path = filedialog.asksaveasfilename(defaultextension=".json",
+                                            filetypes=[("JSON files", "*.json")])
+        if path:
             try:
-                self.df = pd.read_excel(file_path)
-                
-                # Rename columns based on analysis type and position
-                if self.analysis_type.get() == "map":
-                    if len(self.df.columns) >= 4:
-                        new_columns = {
-                            self.df.columns[0]: 'Customer',
-                            self.df.columns[1]: 'Sales',
-                            self.df.columns[2]: 'Latitude',
-                            self.df.columns[3]: 'Longitude'
-                        }
-                        self.df = self.df.rename(columns=new_columns)
-                        self.df = self.df[['Customer', 'Sales', 'Latitude', 'Longitude']]
-                    else:
-                        messagebox.showerror("Error", "Excel file must have at least 4 columns for map analysis")
-                        return
-                elif self.analysis_type.get() == "yoy":
-                    if len(self.df.columns) >= 3:
-                        new_columns = {
-                            self.df.columns[0]: 'Customer',
-                            self.df.columns[1]: 'Current Sales',
-                            self.df.columns[2]: 'Previous Sales'
-                        }
-                        self.df = self.df.rename(columns=new_columns)
-                        self.df = self.df[['Customer', 'Current Sales', 'Previous Sales']]
-                    else:
-                        messagebox.showerror("Error", "Excel file must have at least 3 columns for YoY analysis")
-                        return
-                else:  # target analysis
-                    if len(self.df.columns) >= 3:
-                        new_columns = {
-                            self.df.columns[0]: 'Customer',
-                            self.df.columns[1]: 'Current Sales',
-                            self.df.columns[2]: 'Target'
-                        }
-                        self.df = self.df.rename(columns=new_columns)
-                        self.df = self.df[['Customer', 'Current Sales', 'Target']]
-                    else:
-                        messagebox.showerror("Error", "Excel file must have at least 3 columns for target analysis")
-                        return
-                
-                self._process_data()
-            except Exception as e:
-                messagebox.showerror("Error", f"Error importing Excel file: {str(e)}")
+                DIAGNOSTICS.export(path)
+            except OSError as e:
+                messagebox.showerror("Error", f"Error exporting diagnostics: {str(e)}")
+
+    def _import_excel_file(self):
+        # Every sheet of every selected workbook is imported as one dataset
+        file_paths = filedialog.askopenfilenames(
+            filetypes=[("Excel files", "*.xlsx *.xls"), ("CSV files", "*.csv *.txt"),
+                       ("All files", "*.*")])
+        if file_paths:
+            cache = self.cache if self.use_cache.get() else None
+            self._start_import(load_files_task, list(file_paths), self.analysis_type.get(), cache,
+                               error_message="Error importing Excel file")
 
     def _import_pasted_data(self):
-        try:
-            data = self.paste_area.get("1.0", tk.END).strip()
-            if not data:
-                messagebox.showwarning("Warning", "Please paste some data first!")
-                return
-            
-            # Try different separators
-            try:
-                # First try tab-separated
-                self.df = pd.read_csv(io.StringIO(data), sep='\t')
-            except:
-                try:
-                    # Then try comma-separated
-                    self.df = pd.read_csv(io.StringIO(data), sep=',')
-                except:
-                    messagebox.showerror("Error", "Could not parse the pasted data. Please check the format.")
-                    return
-            
-            # Rename columns based on analysis type and position
-            if self.analysis_type.get() == "map":
-                if len(self.df.columns) >= 4:
-                    new_columns = {
-                        self.df.columns[0]: 'Customer',
-                        self.df.columns[1]: 'Sales',
-                        self.df.columns[2]: 'Latitude',
-                        self.df.columns[3]: 'Longitude'
-                    }
-                    self.df = self.df.rename(columns=new_columns)
-                    self.df = self.df[['Customer', 'Sales', 'Latitude', 'Longitude']]
-                else:
-                    messagebox.showerror("Error", "Please paste data with at least 4 columns for map analysis")
-                    return
-            elif self.analysis_type.get() == "yoy":
-                if len(self.df.columns) >= 3:
-                    new_columns = {
-                        self.df.columns[0]: 'Customer',
-                        self.df.columns[1]: 'Current Sales',
-                        self.df.columns[2]: 'Previous Sales'
-                    }
-                    self.df = self.df.rename(columns=new_columns)
-                    self.df = self.df[['Customer', 'Current Sales', 'Previous Sales']]
-                else:
-                    messagebox.showerror("Error", "Please paste data with at least 3 columns for YoY analysis")
-                    return
-            else:  # target analysis
-                if len(self.df.columns) >= 3:
-                    new_columns = {
-                        self.df.columns[0]: 'Customer',
-                        self.df.columns[1]: 'Current Sales',
-                        self.df.columns[2]: 'Target'
-                    }
-                    self.df = self.df.rename(columns=new_columns)
-                    self.df = self.df[['Customer', 'Current Sales', 'Target']]
-                else:
-                    messagebox.showerror("Error", "Please paste data with at least 3 columns for target analysis")
-                    return
-            
-            self._process_data()
+        data = self.paste_area.get("1.0", tk.END).strip()
+        if not data:
+            messagebox.showwarning("Warning", "Please paste some data first!")
+            return
+        
+        def on_loaded():
             self.paste_area.delete("1.0", tk.END)
-            
-        except Exception as e:
-            messagebox.showerror("Error", f"Error processing pasted data: {str(e)}")
+        
+        self._start_import(load_pasted_task, data, self.analysis_type.get(),
+                           error_message="Error processing pasted data", on_loaded=on_loaded)
 
-    def _process_data(self):
+    def _import_clipboard(self):
         try:
-            analysis_type = self.analysis_type.get()
-            
-            if analysis_type == "map":
-                # Convert numeric columns for map analysis
-                self.df['Sales'] = pd.to_numeric(self.df['Sales'], errors='coerce')
-                self.df['Latitude'] = pd.to_numeric(self.df['Latitude'], errors='coerce')
-                self.df['Longitude'] = pd.to_numeric(self.df['Longitude'], errors='coerce')
-            elif analysis_type == "yoy":
-                # Convert and calculate for YoY analysis
-                self.df['Current Sales'] = pd.to_numeric(self.df['Current Sales'], errors='coerce')
-                self.df['Previous Sales'] = pd.to_numeric(self.df['Previous Sales'], errors='coerce')
-                self.df['Growth'] = ((self.df['Current Sales'] - self.df['Previous Sales']) / 
-                                   self.df['Previous Sales'] * 100)
-            else:  # target analysis
-                # Convert and calculate for target analysis
-                self.df['Current Sales'] = pd.to_numeric(self.df['Current Sales'], errors='coerce')
-                self.df['Target'] = pd.to_numeric(self.df['Target'], errors='coerce')
-                self.df['Achievement'] = (self.df['Current Sales'] / self.df['Target'] * 100)
-            
-            # Drop any rows with NaN values after conversion
-            self.df = self.df.dropna()
-            
-            # Update displays
+            data = self.root.clipboard_get()
+        except tk.TclError:
+            data = ""
+        if not data.strip():
+            messagebox.showwarning("Warning", "The clipboard does not contain any text!")
+            return
+        self._start_import(load_pasted_task, data, self.analysis_type.get(),
+                           error_message="Error processing clipboard data")
+
+    def _start_import(self, loader, *args, error_message, on_loaded=None):
+        self._stop_watching()
+        if self.use_database.get():
+            self._start_database_import(loader, args[0], error_message=error_message, on_loaded=on_loaded)
+            return
+        analysis_type = self.analysis_type.get()
+        mode = IMPORT_MODES[self.import_mode.get()]
+        # Only merge into a dataset of the same analysis type
+        base = None
+        if mode != 'replace' and len(self.df) and self.graph.inputs['analysis_type'][0] == analysis_type:
+            base = self.df
+        
+        def run(task):
+            df, summary_state = loader(task, *args)
+            rejected = (summary_state.rejected, summary_state.rejected_rows)
+            if base is None:
+                return {'df': df, 'summary_state': summary_state, 'rejected': rejected}
+            # Only the imported rows went through coercion; merge them by key
+            task.report(0.97, "Merging into current dataset...")
+            merged, added, removed = merge_datasets(base, df, analysis_type, mode)
+            return {'df': merged, 'added': added, 'removed': removed, 'rejected': rejected}
+        
+        def on_done(result):
+            if on_loaded:
+                on_loaded()
+            self._on_data_loaded(result)
+        
+        self._run_task('import', run, on_done=on_done, error_message=error_message)
+
+    def _on_data_loaded(self, result):
+        message = self._apply_loaded(result)
+        
+        # Update displays; tabs not built yet show the data when first opened
+        self._update_tree()
+        self._check_quality()
+        self._build_spatial_index()
+        if self._tab_built(self.analysis_tab):
+            self._refresh_analysis_tab()
+        if self._tab_built(self.visualization_tab):
+            self._refresh_visualization_tab()
+        
+        messagebox.showinfo("Success", message)
+        if result['rejected'][0]:
+            self._report_rejected_rows(*result['rejected'])
+
+    def _apply_loaded(self, result):
+        # Make a loaded or merged frame the current dataset; returns a
+        # description of the change
+        if self.dataset is not None:
+            # Back from a database dataset to in-memory analysis
+            self.dataset = None
+            self.graph = build_analysis_graph()
+        self.df = result['df']
+        if 'added' in result:
+            # Patch memoized aggregates with just the touched rows
+            added, removed = result['added'], result['removed']
+            self.graph.apply_delta('data', self.df, added, removed)
+            message = (f"Merged {len(added)} records ({len(added) - len(removed)} new, "
+                       f"{len(removed)} updated); {len(self.df)} records in total")
+        else:
+            self.graph.set_input('data', self.df)
+            self.graph.set_input('analysis_type', self.analysis_type.get())
+            # Summary statistics were accumulated during import
+            self.graph.seed('summary_state', result['summary_state'])
+            message = f"Imported {len(self.df)} records successfully!"
+        self._on_task_progress(None, 1.0, f"Loaded {len(self.df):,} records")
+        return message
+
+    def _toggle_watch(self):
+        if self.watch_path is not None:
+            self._stop_watching()
+            self._on_task_progress(None, 1.0, "Stopped watching")
+            return
+        path = filedialog.askopenfilename(
+            filetypes=[("Excel files", "*.xlsx *.xls"), ("CSV files", "*.csv *.txt"),
+                       ("All files", "*.*")])
+        if not path:
+            return
+        self.tasks.cancel('import')
+        self.watch_path = path
+        self.watch_type = self.analysis_type.get()
+        self.watch_hashes = None
+        self.watch_seen = None
+        self.watch_button.config(text="Stop Watching")
+        self._reload_watched(self._watch_fingerprint())
+        self.watch_job = self.root.after(WATCH_POLL_MS, self._poll_watched_file)
+
+    def _stop_watching(self):
+        for job in (self.watch_job, self.redraw_job):
+            if job is not None:
+                self.root.after_cancel(job)
+        self.watch_job = self.redraw_job = None
+        if self.watch_path is None:
+            return
+        self.tasks.cancel('watch')
+        self.watch_path = None
+        self.watch_hashes = None
+        self.watch_button.config(text="Watch File...")
+
+    def _watch_fingerprint(self):
+        try:
+            stat = os.stat(self.watch_path)
+        except OSError:
+            return None   # being replaced; check again on the next poll
+        return stat.st_mtime_ns, stat.st_size
+
+    def _poll_watched_file(self):
+        self.watch_job = self.root.after(WATCH_POLL_MS, self._poll_watched_file)
+        fingerprint = self._watch_fingerprint()
+        # Reload once the file has stayed the same for a whole poll, so a
+        # half-written export is never read
+        if (fingerprint is not None and fingerprint != self.watch_loaded and
+                fingerprint == self.watch_seen and not self.tasks.running('watch')):
+            self._reload_watched(fingerprint)
+        self.watch_seen = fingerprint
+
+    def _reload_watched(self, fingerprint):
+        # The first load replaces the dataset; later ones are diffed against it
+        base = self.df if self.watch_hashes is not None else None
+        name = os.path.basename(self.watch_path)
+        
+        def on_done(result):
+            self.watch_loaded = fingerprint
+            self._on_watch_loaded(name, result)
+        
+        def on_error(e):
+            # Not worth a dialog every few minutes; retried on the next change
+            self.watch_loaded = fingerprint
+            self._on_task_progress(None, 0, f"Could not read {name} ({str(e)}); waiting for the next change")
+        
+        self.tasks.submit('watch', watch_reload_task, self.watch_path, self.watch_type, base,
+                          self.watch_hashes, on_done=on_done, on_error=on_error,
+                          on_progress=self._on_task_progress)
+
+    def _on_watch_loaded(self, name, result):
+        stamp = time.strftime('%H:%M:%S')
+        rejected = f", {result['rejected'][0]:,} rows rejected" if result['rejected'][0] else ""
+        if result.get('unchanged'):
+            self._on_task_progress(None, 1.0, f"{name}: no changed rows at {stamp}{rejected}")
+            return
+        if self.analysis_type.get() != self.watch_type:
+            self.analysis_type.set(self.watch_type)
+            self._update_help_text()
+        self.watch_hashes = result['hashes']
+        message = self._apply_loaded(result)
+        if 'added' in result:
+            self._update_tree(result['added'].index.to_numpy())
+        else:
             self._update_tree()
-            if analysis_type != "map":
+            self.redraw_full = True
+        self._check_quality()
+        self._build_spatial_index()
+        self._schedule_redraw()
+        self._on_task_progress(None, 1.0, f"{name}: {message} at {stamp}{rejected}")
+
+    def _schedule_redraw(self):
+        # Charts follow the watched file at most once per WATCH_REDRAW_MS;
+        # changes in between are drawn together
+        if self.redraw_job is not None:
+            return
+        wait = max(0.0, self.last_redraw + WATCH_REDRAW_MS / 1000 - time.perf_counter())
+        self.redraw_job = self.root.after(int(wait * 1000), self._redraw_watched)
+
+    def _redraw_watched(self):
+        self.redraw_job = None
+        self.last_redraw = time.perf_counter()
+        full, self.redraw_full = self.redraw_full, False
+        # A replaced dataset may have other dimensions; merges keep them
+        if self._tab_built(self.analysis_tab):
+            if full:
+                self._refresh_analysis_tab()
+            else:
                 self._update_analysis()
+        if self._tab_built(self.visualization_tab):
+            if full:
+                self._refresh_visualization_tab()
+            else:
                 self._update_visualization()
-            
-            messagebox.showinfo("Success", f"Imported {len(self.df)} records successfully!")
-            
-        except Exception as e:
-            messagebox.showerror("Error", f"Error processing data: {str(e)}")
-
-    def _update_tree(self):
-        # Clear existing items
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-        
-        # Add new items based on analysis type
-        if self.analysis_type.get() == "map":
-            for _, row in self.df.iterrows():
-                self.tree.insert('', tk.END, values=(
-                    row['Customer'],
-                    f"{row['Sales']:,.0f}",
-                    f"{row['Latitude']:.4f}",
-                    f"{row['Longitude']:.4f}"
-                ))
-        elif self.analysis_type.get() == "yoy":
-            for _, row in self.df.iterrows():
-                self.tree.insert('', tk.END, values=(
-                    row['Customer'],
-                    f"{row['Current Sales']:,.0f}",
-                    f"{row['Previous Sales']:,.0f}",
-                    f"{row['Growth']:,.1f}%"
-                ))
-        else:  # target analysis
-            for _, row in self.df.iterrows():
-                self.tree.insert('', tk.END, values=(
-                    row['Customer'],
-                    f"{row['Current Sales']:,.0f}",
-                    f"{row['Target']:,.0f}",
-                    f"{row['Achievement']:,.1f}%"
-                ))
+
+    def _browse_database(self):
+        path = filedialog.asksaveasfilename(defaultextension=".db", confirmoverwrite=False,
+                                            filetypes=[("SQLite databases", "*.db *.sqlite"),
+                                                       ("All files", "*.*")])
+        if path:
+            self.database_path_var.set(path)
+
+    def _open_database(self):
+        path = os.path.abspath(self.database_path_var.get().strip() or "sales.db")
+        if self.database is None or self.database.path != path:
+            try:
+                self.database = SalesDatabase(path)
+            except sqlite3.Error as e:
+                messagebox.showerror("Error", f"Error opening database: {str(e)}")
+                return None
+        return self.database
+
+    def _update_dataset_names(self):
+        # Only list datasets of a file that exists; opening would create it
+        path = self.database_path_var.get().strip()
+        if not path or not os.path.exists(path):
+            self.dataset_combo.config(values=[])
+            return
+        database = self._open_database()
+        self.dataset_combo.config(values=database.datasets() if database else [])
+
+    def _database_unsupported(self, feature):
+        if self.dataset is None:
+            return False
+        messagebox.showwarning("Warning", f"{feature} are not available for database datasets; "
+                                          f"import the data into memory instead")
+        return True
+
+    def _start_database_import(self, loader, source, error_message, on_loaded=None):
+        # Streams the import into the database; nothing is kept in memory
+        name = self.dataset_name_var.get().strip()
+        if not name:
+            messagebox.showwarning("Warning", "Please enter a dataset name first!")
+            return
+        database = self._open_database()
+        if database is None:
+            return
+        task_fn = database_files_task if loader is load_files_task else database_pasted_task
+        
+        def on_done(result):
+            if on_loaded:
+                on_loaded()
+            self._on_dataset_opened(result)
+        
+        self._run_task('import', task_fn, database, name, source, self.analysis_type.get(),
+                       IMPORT_MODES[self.import_mode.get()], on_done=on_done, error_message=error_message)
+
+    def _open_dataset(self):
+        self._stop_watching()
+        name = self.dataset_name_var.get().strip()
+        database = self._open_database() if name else None
+        if database is None:
+            return
+        
+        def run(task):
+            task.report(0.5, f"Opening {name}...")
+            return {'dataset': database.dataset(name), 'rejected': (0, [])}
+        
+        self._run_task('import', run, on_done=self._on_dataset_opened, error_message="Error opening dataset")
+
+    def _on_dataset_opened(self, result):
+        # Analyses of a database dataset run as queries through their own graph
+        dataset = self.dataset = result['dataset']
+        self.df = pd.DataFrame()
+        self.analysis_type.set(dataset.analysis_type)
+        self._update_help_text()
+        self.graph = build_database_graph()
+        self.graph.set_input('dataset', dataset)
+        self.graph.set_input('analysis_type', dataset.analysis_type)
+        self._on_task_progress(None, 1.0, f"Loaded {dataset.rows:,} records")
+        
+        # The preview pages rows in from the table as they scroll into view
+        formats = PREVIEW_FORMATS[dataset.analysis_type]
+        with DIAGNOSTICS.operation('import'), DIAGNOSTICS.stage('tree.populate', dataset.rows):
+            self.tree_view.set_source(
+                dataset.rows,
+                lambda start, stop: format_preview_rows(dataset.preview(start, stop), formats, 0, stop - start))
+        self.footprint_label.config(text=dataset.footprint_text())
+        self._check_quality()
+        self._build_spatial_index()
+        if self._tab_built(self.analysis_tab):
+            self._refresh_analysis_tab()
+        if self._tab_built(self.visualization_tab):
+            self._refresh_visualization_tab()
+        
+        if 'imported' in result:
+            messagebox.showinfo("Success", f"Stored {result['imported']:,} records in '{dataset.name}'; "
+                                           f"{dataset.rows:,} records in total")
+        if result['rejected'][0]:
+            self._report_rejected_rows(*result['rejected'])
+
+    def _check_quality(self):
+        self.quality_label.config(text="")
+        if self.dataset is not None or self.analysis_type.get() == "timeseries":
+            return
+        
+        def on_done(quality):
+            self.quality_label.config(text=quality_text(quality))
+            self._on_task_progress(None, 1.0, "Ready")
+        
+        self._run_task('quality', lambda task: self.graph.get('quality'), on_done=on_done,
+                       error_message="Error checking data quality")
+
+    def _refresh_analysis_tab(self):
+        self._update_drill_controls()
+        self._update_analysis()
+
+    def _refresh_visualization_tab(self):
+        splits = ["(none)"] + drill_dimensions(self.df, self.analysis_type.get())
+        self.export_split_combo.config(values=splits)
+        if self.export_split_var.get() not in splits:
+            self.export_split_var.set("(none)")
+        self._update_visualization()
+
+    def _report_rejected_rows(self, count, rows):
+        # Rows dropped during conversion are listed instead of vanishing
+        preview = "\n".join(f"Row {row['Row']}: {row['Reason']}" for row in rows[:5])
+        if count > 5:
+            preview += f"\n... and {count - 5:,} more"
+        saved = "" if len(rows) == count else f" (the first {len(rows):,})"
+        if not messagebox.askyesno(
+                "Rejected Rows", f"{count:,} rows could not be imported:\n\n{preview}\n\n"
+                                 f"Save the rejected rows{saved} to a CSV file?"):
+            return
+        path = filedialog.asksaveasfilename(defaultextension=".csv",
+                                            filetypes=[("CSV files", "*.csv")])
+        if path:
+            try:
+                pd.DataFrame(rows).to_csv(path, index=False)
+            except OSError as e:
+                messagebox.showerror("Error", f"Error saving rejected rows: {str(e)}")
+
+    def _update_tree(self, changed=None):
+        # Rows are formatted lazily as they scroll into view; after a merge
+        # only the changed rows (positions) in view are formatted again
+        formats = PREVIEW_FORMATS[self.analysis_type.get()]
+        df = self.df
+        fetch = lambda start, stop: format_preview_rows(df, formats, start, stop)
+        with DIAGNOSTICS.operation('import'), DIAGNOSTICS.stage('tree.populate', len(df)):
+            if changed is None:
+                self.tree_view.set_source(len(df), fetch)
+            else:
+                self.tree_view.update_source(len(df), fetch, changed)
+        self.footprint_label.config(text=footprint_text(df))
 
     def _update_analysis(self):
+        analysis_type = self.analysis_type.get()
+        if analysis_type == "map":
+            return  # No summary stats for map view
+        
+        try:
+            top_n = int(self.top_n_var.get())
+        except ValueError:
+            top_n = 10
+        
+        # Only the Top N comparison depends on this value; the summary
+        # statistics stay memoized
+        self.graph.set_input('top_n', top_n)
+        self.graph.set_input('rank_side', self.rank_side_var.get())
+        self.graph.set_input('granularity', self.granularity_var.get())
+        node = graph_node(analysis_type, 'analysis_data')
+        
+        # Slices come from the pre-built dimension cube
+        drill = self._drill_selection()
+        self.graph.set_input('drill', drill)
+        if drill != ((), None):
+            node = 'drill_data'
+        
+        # Quality filtering needs the rows in memory
+        quality_filter = QUALITY_FILTERS[self.quality_filter_var.get()]
+        if quality_filter and self.dataset is None and analysis_type in DERIVED_METRICS:
+            self.graph.set_input('quality_filter', quality_filter)
+            node = 'quality_data'
+        
+        def compute(task):
+            task.report(0.2, "Computing summary statistics...")
+            return self.graph.get(node)
+        
+        self._run_task('analysis', compute, on_done=self._draw_analysis,
+                       error_message="Error updating analysis")
+
+    def _on_top_n_slider(self, value):
+        top_n = str(int(float(value)))
+        if top_n == self.top_n_var.get():
+            return
+        self.top_n_var.set(top_n)
+        # Redraw once the slider rests; each update is a slice of the rank index
+        if self.top_n_job is not None:
+            self.root.after_cancel(self.top_n_job)
+        self.top_n_job = self.root.after(TOP_N_SLIDER_DELAY_MS, self._update_analysis)
+
+    def _find_customer_rank(self):
+        customer = self.rank_customer_var.get().strip()
+        if not customer or not self._has_data():
+            return
+        if self.analysis_type.get() == "timeseries":
+            self.rank_result_label.config(text="Not available for time series data")
+            return
+        
+        def compute(task):
+            return self.graph.get('rank_index').customer_ranks(customer)
+        
+        def on_done(ranks):
+            self._on_task_progress(None, 1.0, "Ready")
+            if ranks is None:
+                self.rank_result_label.config(text=f"{customer} not found")
+                return
+            total = self._row_count()
+            self.rank_result_label.config(text="; ".join(
+                f"#{rank:,} of {total:,} by {column} ({percentile:.1f}th percentile)"
+                for column, rank, percentile, _ in ranks))
+        
+        self._run_task('rank', compute, on_done=on_done, error_message="Error finding customer")
+
+    def _draw_analysis(self, data):
         try:
             # Clear previous summary
             for widget in self.summary_frame.winfo_children():
                 widget.destroy()
             
-            analysis_type = self.analysis_type.get()
-            
-            if analysis_type == "yoy":
-                # Year over Year Analysis
-                summary_stats = {
-                    'Total Customers': len(self.df),
-                    'Total Current Cases': self.df['Current Sales'].sum(),
-                    'Total Previous Cases': self.df['Previous Sales'].sum(),
-                    'Average Growth': self.df['Growth'].mean(),
-                    'Median Growth': self.df['Growth'].median(),
-                    'Customers with Positive Growth': (self.df['Growth'] > 0).sum(),
-                    'Customers with Negative Growth': (self.df['Growth'] < 0).sum()
-                }
-            elif analysis_type == "target":
-                # Target Analysis
-                summary_stats = {
-                    'Total Customers': len(self.df),
-                    'Total Current Cases': self.df['Current Sales'].sum(),
-                    'Total Target': self.df['Target'].sum(),
-                    'Overall Achievement': (self.df['Current Sales'].sum() / self.df['Target'].sum() * 100),
-                    'Average Achievement': self.df['Achievement'].mean(),
-                    'Customers Above Target': (self.df['Achievement'] >= 100).sum(),
-                    'Customers Below Target': (self.df['Achievement'] < 100).sum()
-                }
-            else:  # map analysis
-                return  # No summary stats for map view
-            
             # Display summary statistics
-            for i, (key, value) in enumerate(summary_stats.items()):
-                if 'Cases' in key or 'Target' in key:
-                    value_str = f"{value:,.0f}"
-                elif 'Growth' in key or 'Achievement' in key:
-                    value_str = f"{value:.1f}%"
-                else:
-                    value_str = str(value)
-                    
+            for i, (key, value) in enumerate(data['summary'].items()):
+                value_str = format_summary_value(key, value)
                 ttk.Label(self.summary_frame, text=f"{key}:").grid(row=i//3, column=(i%3)*2, padx=5, pady=2)
                 ttk.Label(self.summary_frame, text=value_str).grid(row=i//3, column=(i%3)*2+1, padx=5, pady=2)
             
             # Update plot
-            self.analysis_fig.clear()
-            ax = self.analysis_fig.add_subplot(111)
-            
-            try:
-                top_n = int(self.top_n_var.get())
-            except:
-                top_n = 10
-            
-            if analysis_type == "yoy":
-                # Year over Year comparison
-                top_customers = self.df.nlargest(top_n, 'Current Sales')
-                
-                x = np.arange(len(top_customers))
-                width = 0.35
-                
-                ax.bar(x - width/2, top_customers['Current Sales'], width, label='Current Year')
-                ax.bar(x + width/2, top_customers['Previous Sales'], width, label='Previous Year')
-                
-                ax.set_ylabel('Number of Cases')
-                ax.set_title(f'Top {top_n} Customers - Year over Year Comparison')
-                
-            elif analysis_type == "target":
-                # Target comparison - showing Actual vs Target
-                top_customers = self.df.nlargest(top_n, 'Current Sales')
-                
-                x = np.arange(len(top_customers))
-                width = 0.35
-                
-                ax.bar(x - width/2, top_customers['Current Sales'], width, label='Actual')
-                ax.bar(x + width/2, top_customers['Target'], width, label='Target')
-                
-                ax.set_ylabel('Number of Cases')
-                ax.set_title(f'Top {top_n} Customers - Actual vs Target')
-            
-            if analysis_type in ["yoy", "target"]:
-                ax.set_xticks(x)
-                ax.set_xticklabels(top_customers['Customer'], rotation=45, ha='right')
-                ax.legend()
-                
-                # Format y-axis to show whole numbers with commas
-                ax.yaxis.set_major_formatter(lambda x, p: f'{int(x):,}')
-                
-                self.analysis_fig.tight_layout()
-                self.analysis_canvas.draw()
+            with DIAGNOSTICS.operation('analysis'):
+                with DIAGNOSTICS.stage('chart.rebuild'):
+                    self.analysis_fig.clear()
+                    ax = self.analysis_fig.add_subplot(111)
+                    draw_analysis_chart(ax, data)
+                with DIAGNOSTICS.stage('chart.tight_layout'):
+                    self.analysis_fig.tight_layout()
+                with DIAGNOSTICS.stage('chart.canvas_draw'):
+                    self.analysis_canvas.draw()
+            self._on_task_progress(None, 1.0, "Analysis updated")
             
         except Exception as e:
             messagebox.showerror("Error", f"Error updating analysis: {str(e)}")
 
+    def _update_drill_controls(self):
+        # One member selector per dimension plus the breakdown dimension
+        for widget in self.drill_frame.winfo_children():
+            widget.destroy()
+        self.drill_vars = []
+        self.breakdown_var.set("(none)")
+        dimensions = drill_dimensions(self.df, self.analysis_type.get())
+        if not dimensions:
+            self.drill_frame.pack_forget()
+            return
+        
+        for dimension in dimensions:
+            ttk.Label(self.drill_frame, text=f"{dimension}:").pack(side=tk.LEFT, padx=5)
+            var = tk.StringVar(value="All")
+            combo = ttk.Combobox(self.drill_frame, textvariable=var, state='readonly', width=14,
+                                 values=["All"] + [str(m) for m in self.df[dimension].cat.categories])
+            combo.pack(side=tk.LEFT, padx=5)
+            combo.bind('<<ComboboxSelected>>', lambda e: self._update_analysis())
+            self.drill_vars.append((dimension, var))
+        
+        ttk.Label(self.drill_frame, text="Break down by:").pack(side=tk.LEFT, padx=5)
+        combo = ttk.Combobox(self.drill_frame, textvariable=self.breakdown_var, state='readonly',
+                             values=["(none)"] + dimensions, width=14)
+        combo.pack(side=tk.LEFT, padx=5)
+        combo.bind('<<ComboboxSelected>>', lambda e: self._update_analysis())
+        self.drill_frame.pack(fill=tk.X, padx=5, pady=5, after=self.analysis_control_frame)
+
+    def _drill_selection(self):
+        selection = tuple((dimension, var.get()) for dimension, var in self.drill_vars
+                          if var.get() != "All")
+        breakdown = self.breakdown_var.get()
+        return selection, (None if breakdown == "(none)" else breakdown)
+
+    def _on_granularity_changed(self, event=None):
+        # Views are derived from the memoized cube, not the raw rows
+        if self.analysis_type.get() == "timeseries" and self._has_data():
+            self._update_analysis()
+            if self._tab_built(self.visualization_tab):
+                self._update_visualization()
+
     def _update_visualization(self):
+        analysis_type = self.analysis_type.get()
+        if analysis_type == "map":
+            return  # No additional visualizations for map view
+        
+        chart_type = self.chart_type.get()
+        self.graph.set_input('granularity', self.granularity_var.get())
+        node = graph_node(analysis_type, 'chart_' + chart_type)
+        
+        def compute(task):
+            task.report(0.2, "Preparing chart data...")
+            if chart_type not in CHART_TYPES:
+                return {'kind': None}
+            # Sort orders and bin counts are memoized per dataset
+            return self.graph.get(node)
+        
+        self._run_task('visualization', compute, on_done=self._draw_visualization,
+                       error_message="Error updating visualization")
+
+    def _export_report(self):
+        if self._database_unsupported("Report export"):
+            return
+        if len(self.df) == 0:
+            messagebox.showwarning("Warning", "Please import data first!")
+            return
+        path = filedialog.asksaveasfilename(defaultextension=".pdf",
+                                            filetypes=[("PDF report", "*.pdf"), ("HTML report", "*.html")])
+        if not path:
+            return
         try:
-            self.viz_fig.clear()
-            ax = self.viz_fig.add_subplot(111)
-            
-            chart_type = self.chart_type.get()
-            analysis_type = self.analysis_type.get()
-            
-            if analysis_type == "map":
-                return  # No additional visualizations for map view
-            
-            if chart_type == "bar":
-                if analysis_type == "yoy":
-                    # Sort by growth
-                    sorted_df = self.df.sort_values('Growth', ascending=False)
-                    ax.bar(range(len(sorted_df)), sorted_df['Growth'])
-                    ax.set_title('Customer Growth Distribution')
-                    ax.set_xlabel('Customers (sorted by growth)')
-                    ax.set_ylabel('Growth (%)')
-                else:
-                    # Sort by achievement
-                    sorted_df = self.df.sort_values('Achievement', ascending=False)
-                    ax.bar(range(len(sorted_df)), sorted_df['Achievement'])
-                    ax.set_title('Customer Achievement Distribution')
-                    ax.set_xlabel('Customers (sorted by achievement)')
-                    ax.set_ylabel('Achievement (%)')
-                
-            elif chart_type == "line":
-                if analysis_type == "yoy":
-                    # Growth trend
-                    sorted_df = self.df.sort_values('Growth')
-                    ax.plot(range(len(sorted_df)), sorted_df['Growth'])
-                    ax.set_title('Growth Trend')
-                    ax.set_xlabel('Customers (sorted by growth)')
-                    ax.set_ylabel('Growth (%)')
-                else:
-                    # Achievement trend
-                    sorted_df = self.df.sort_values('Achievement')
-                    ax.plot(range(len(sorted_df)), sorted_df['Achievement'])
-                    ax.set_title('Achievement Trend')
-                    ax.set_xlabel('Customers (sorted by achievement)')
-                    ax.set_ylabel('Achievement (%)')
-                
-            elif chart_type == "scatter":
-                if analysis_type == "yoy":
-                    ax.scatter(self.df['Previous Sales'], self.df['Current Sales'])
-                    ax.set_title('Current vs Previous Cases')
-                    ax.set_xlabel('Previous Cases')
-                    ax.set_ylabel('Current Cases')
-                else:
-                    ax.scatter(self.df['Target'], self.df['Current Sales'])
-                    ax.set_title('Actual vs Target Cases')
-                    ax.set_xlabel('Target Cases')
-                    ax.set_ylabel('Actual Cases')
-                
-                # Add diagonal line for reference
-                max_val = max(
-                    self.df['Current Sales'].max(),
-                    self.df['Previous Sales' if analysis_type == "yoy" else 'Target'].max()
-                )
-                ax.plot([0, max_val], [0, max_val], 'r--', alpha=0.5)
-                
-            elif chart_type == "pie":
-                if analysis_type == "yoy":
-                    # Group by growth ranges
-                    bins = [-float('inf'), -10, 0, 10, float('inf')]
-                    labels = ['High Decline (<-10%)', 'Slight Decline (-10-0%)', 
-                             'Slight Growth (0-10%)', 'High Growth (>10%)']
-                    growth_cats = pd.cut(self.df['Growth'], bins=bins, labels=labels)
-                    growth_dist = growth_cats.value_counts()
-                    
-                    ax.pie(growth_dist, labels=growth_dist.index, autopct='%1.1f%%')
-                    ax.set_title('Distribution of Customer Growth')
-                else:
-                    # Group by achievement ranges
-                    bins = [-float('inf'), 80, 90, 100, 110, float('inf')]
-                    labels = ['Below 80%', '80-90%', '90-100%', '100-110%', 'Above 110%']
-                    achievement_cats = pd.cut(self.df['Achievement'], bins=bins, labels=labels)
-                    achievement_dist = achievement_cats.value_counts()
-                    
-                    ax.pie(achievement_dist, labels=achievement_dist.index, autopct='%1.1f%%')
-                    ax.set_title('Distribution of Target Achievement')
-            
-            self.viz_fig.tight_layout()
-            self.viz_canvas.draw()
+            top_n = int(self.top_n_var.get())
+        except ValueError:
+            top_n = 10
+        split_by = self.export_split_var.get()
+        self.export_queue.append((self.df, self.analysis_type.get(), path,
+                                  None if split_by == "(none)" else split_by,
+                                  top_n, self.granularity_var.get()))
+        if len(self.export_queue) == 1:
+            self._start_next_export()
+        self._update_export_status()
+
+    def _start_next_export(self):
+        def on_done(result):
+            path, pages = result
+            self._on_task_progress(None, 1.0, f"Report saved to {path} ({pages} pages)")
+            self._finish_export()
+        
+        self._run_task('export', export_report_task, *self.export_queue[0], on_done=on_done,
+                       on_failed=lambda e: self._finish_export(),
+                       error_message="Error exporting report")
+
+    def _finish_export(self):
+        if self.export_queue:
+            self.export_queue.popleft()
+        if self.export_queue:
+            self._start_next_export()
+        self._update_export_status()
+
+    def _update_export_status(self):
+        if not self._tab_built(self.visualization_tab):
+            return
+        waiting = len(self.export_queue) - 1
+        self.export_status_label.config(text=f"{waiting} more queued" if waiting > 0 else "")
+
+    def _draw_visualization(self, chart):
+        try:
+            # Reuses the existing artists when the chart keeps its shape
+            with DIAGNOSTICS.operation('visualization'):
+                self.viz_renderer.draw(chart)
+                with DIAGNOSTICS.stage('chart.canvas_draw'):
+                    self.viz_canvas.draw()
+            self._on_task_progress(None, 1.0, "Visualization updated")
             
         except Exception as e:
             messagebox.showerror("Error", f"Error updating visualization: {str(e)}")
 
+
+BATCH_INPUT_EXTENSIONS = ('.xlsx', '.xls', '.csv', '.txt')
+
+
+def plain_summary(summary):
+    # Summary values as plain Python numbers (for JSON)
+    return {k: (v.item() if hasattr(v, 'item') else v) for k, v in summary.items()}
+
+
+def save_figure(draw, path, figsize=(10, 6)):
+    # Render with a bare Figure (Agg for raster formats), no GUI backend needed
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=figsize)
+    draw(fig.add_subplot(111))
+    fig.tight_layout()
+    fig.savefig(path)
+    return path
+
+
+def write_report(file_path, analysis_type, out_dir, formats=('png',), top_n=10, use_cache=True,
+                 granularity="Monthly", regions=None):
+    # Import one source file and write its summary, charts and (for map
+    # analysis) map; returns the written paths
+    task = BackgroundTask('batch', None)
+    cache = DatasetCache() if use_cache else None
+    # Files are already spread over the worker processes; read sheets in turn
+    df, summary_state = load_file_task(task, file_path, analysis_type, cache, jobs=1)
+
+    graph = build_analysis_graph()
+    graph.set_input('data', df)
+    graph.set_input('analysis_type', analysis_type)
+    graph.set_input('top_n', top_n)
+    graph.set_input('granularity', granularity)
+    graph.seed('summary_state', summary_state)
+    quality = graph.get('quality')
+    if analysis_type == "map":
+        summary = summary_state.finalize(df)
+    else:
+        analysis = graph.get(graph_node(analysis_type, 'analysis_data'))
+        summary = analysis['summary']
+
+    stem = os.path.splitext(os.path.basename(file_path))[0]
+    os.makedirs(out_dir, exist_ok=True)
+    written = []
+
+    summary_path = os.path.join(out_dir, f"{stem}_summary.json")
+    with open(summary_path, 'w') as f:
+        json.dump({'source': os.path.abspath(file_path), 'analysis_type': analysis_type,
+                   'records': len(df), 'rejected_rows': summary_state.rejected,
+                   'memory_bytes': memory_footprint(df),
+                   'data_quality': {'flagged': quality['flagged'], **quality['counts']},
+                   'summary': plain_summary(summary)}, f, indent=2)
+    written.append(summary_path)
+    if quality['flagged']:
+        flagged_path = os.path.join(out_dir, f"{stem}_flagged.csv")
+        flagged = quality['flags'] != 0
+        rows = df[flagged].assign(**{label: (quality['flags'][flagged] & flag) != 0
+                                     for flag, label in QUALITY_LABELS.items()})
+        rows.to_csv(flagged_path, index=False)
+        written.append(flagged_path)
+    if summary_state.rejected:
+        rejected_path = os.path.join(out_dir, f"{stem}_rejected.csv")
+        pd.DataFrame(summary_state.rejected_rows).to_csv(rejected_path, index=False)
+        written.append(rejected_path)
+
+    if analysis_type == "map":
+        map_path, _ = save_map_task(task, df, os.path.join(out_dir, f"{stem}_map.html"))
+        written.append(map_path)
+        if regions:
+            region_map, _, table = save_region_map_task(
+                task, df, regions, os.path.join(out_dir, f"{stem}_regions.html"), cache)
+            table_path = os.path.join(out_dir, f"{stem}_regions.csv")
+            table.to_csv(table_path, index=False)
+            written.extend([region_map, table_path])
+        return written
+
+    for fmt in formats:
+        written.append(save_figure(lambda ax: draw_analysis_chart(ax, analysis),
+                                   os.path.join(out_dir, f"{stem}_top{top_n}.{fmt}")))
+    for chart_type in CHART_TYPES:
+        chart = graph.get(graph_node(analysis_type, 'chart_' + chart_type))
+        for fmt in formats:
+            written.append(save_figure(lambda ax: draw_chart(ax, chart),
+                                       os.path.join(out_dir, f"{stem}_{chart_type}.{fmt}")))
+    return written
+
+
+def find_batch_inputs(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(os.path.join(path, name) for name in sorted(os.listdir(path))
+                         if name.lower().endswith(BATCH_INPUT_EXTENSIONS) and not name.startswith('~$'))
+        else:
+            files.append(path)
+    return files
+
+
+def run_batch(paths, analysis_type, out_dir, formats=('png',), top_n=10, jobs=None, use_cache=True,
+              granularity="Monthly", regions=None):
+    # Process every input file in parallel worker processes
+    files = find_batch_inputs(paths)
+    if not files:
+        print("No input files found", file=sys.stderr)
+        return 1
+
+    failures = 0
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {executor.submit(write_report, path, analysis_type, out_dir, formats,
+                                   top_n, use_cache, granularity, regions): path for path in files}
+        for done, future in enumerate(as_completed(futures), 1):
+            path = futures[future]
+            try:
+                written = future.result()
+                print(f"[{done}/{len(files)}] {path}: {len(written)} files written")
+            except Exception as e:
+                failures += 1
+                print(f"[{done}/{len(files)}] {path}: FAILED - {e}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+REPORT_PAGE_SIZE = (11.69, 8.27)   # A4 landscape, inches
+REPORT_DPI = 100
+REPORT_ALL = "All customers"
+
+
+def report_slices(df, analysis_type, split_by=None):
+    # (title, frame) of every report section: the whole dataset, then one
+    # per member of the split dimension
+    slices = [(REPORT_ALL, df)]
+    if split_by:
+        codes = df[split_by].cat.codes.to_numpy()
+        for code, member in enumerate(df[split_by].cat.categories):
+            rows = np.flatnonzero(codes == code)
+            if len(rows):
+                slices.append((f"{split_by}: {member}", df.iloc[rows].reset_index(drop=True)))
+    return slices
+
+
+def render_report_section(title, df, analysis_type, top_n=10, granularity="Monthly", image=True):
+    # Draw the pages of one report section; also the entry point of export
+    # worker processes. Returns the title, formatted summary and the pages as
+    # PNGs (image=True, for HTML) or as figures for a vector PDF.
+    if analysis_type == "map":
+        sales = df['Sales'].to_numpy(dtype=np.float64)
+        summary = {'Total Customers': len(df), 'Total Sales': float(sales.sum())}
+
+        def draw_map(fig):
+            ax = fig.add_subplot(fig.add_gridspec(3, 1)[1:, 0])
+            keep = thin_points(df['Longitude'].to_numpy(), df['Latitude'].to_numpy(), SCATTER_GRID)
+            ax.scatter(df['Longitude'].to_numpy()[keep], df['Latitude'].to_numpy()[keep],
+                       s=np.sqrt(np.clip(sales[keep], 0, None)) / 10, alpha=0.5)
+            ax.set_title('Customer Locations')
+            ax.set_xlabel('Longitude')
+            ax.set_ylabel('Latitude')
+        pages = [report_page(title, summary, draw_map, image)]
+    else:
+        graph = build_analysis_graph()
+        graph.set_input('data', df)
+        graph.set_input('analysis_type', analysis_type)
+        graph.set_input('top_n', top_n)
+        graph.set_input('granularity', granularity)
+        analysis = graph.get(graph_node(analysis_type, 'analysis_data'))
+        summary = analysis['summary']
+        charts = [graph.get(graph_node(analysis_type, 'chart_' + c)) for c in CHART_TYPES]
+
+        def draw_top(fig):
+            draw_analysis_chart(fig.add_subplot(fig.add_gridspec(3, 1)[1:, 0]), analysis)
+
+        def draw_charts(fig):
+            for i, chart in enumerate(charts):
+                draw_chart(fig.add_subplot(2, 2, i + 1), chart)
+        pages = [report_page(title, summary, draw_top, image), report_page(title, None, draw_charts, image)]
+    return {'title': title, 'pages': pages,
+            'summary': {key: format_summary_value(key, value) for key, value in summary.items()}}
+
+
+def report_page(title, summary, draw, image=True):
+    # One report page (title, optional summary table, content) as PNG bytes,
+    # or the laid-out figure itself when image is False
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=REPORT_PAGE_SIZE)
+    fig.suptitle(title, fontsize=14)
+    if summary:
+        ax = fig.add_subplot(fig.add_gridspec(3, 1)[0, 0])
+        ax.axis('off')
+        cells = [[key, format_summary_value(key, value)] for key, value in summary.items()]
+        ax.table(cellText=cells, loc='center', cellLoc='left', colWidths=[0.35, 0.2])
+    draw(fig)
+    fig.tight_layout()
+    if not image:
+        return fig
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', dpi=REPORT_DPI)
+    return buffer.getvalue()
+
+
+class ReportWriter:
+    # Writes sections, in order, to a multi-page PDF or to an HTML page with
+    # its images in a "<name>_files" folder next to it. PDF sections carry
+    # figures (rendered as vectors), HTML sections PNGs.
+    def __init__(self, path, title):
+        self.path = path
+        self.pages = 0
+        self.image = not path.lower().endswith('.pdf')
+        if not self.image:
+            from matplotlib.backends.backend_pdf import PdfPages
+            self.pdf = PdfPages(path)
+        else:
+            self.pdf = None
+            self.assets = os.path.splitext(path)[0] + '_files'
+            os.makedirs(self.assets, exist_ok=True)
+            self.html = open(path, 'w', encoding='utf-8')
+            self.html.write(f"<!DOCTYPE html>\n<html><head><meta charset='utf-8'>"
+                            f"<title>{html.escape(title)}</title></head><body>\n"
+                            f"<h1>{html.escape(title)}</h1>\n")
+
+    def add(self, section):
+        if self.pdf is None:
+            self.html.write(f"<h2>{html.escape(section['title'])}</h2>\n<table>\n")
+            for key, value in section['summary'].items():
+                self.html.write(f"<tr><td>{html.escape(key)}</td><td>{html.escape(value)}</td></tr>\n")
+            self.html.write("</table>\n")
+        for page in section['pages']:
+            self.pages += 1
+            if self.pdf is not None:
+                self.pdf.savefig(page)
+            else:
+                name = f"page_{self.pages:04d}.png"
+                with open(os.path.join(self.assets, name), 'wb') as f:
+                    f.write(page)
+                self.html.write(f"<p><img src='{html.escape(os.path.basename(self.assets))}/{name}' "
+                                f"style='max-width:100%'></p>\n")
+
+    def add_link(self, text, target):
+        # Links only exist in HTML reports
+        if self.pdf is None:
+            href = os.path.relpath(target, os.path.dirname(os.path.abspath(self.path)))
+            self.html.write(f"<p><a href='{html.escape(href)}'>{html.escape(text)}</a></p>\n")
+
+    def close(self):
+        if self.pdf is not None:
+            self.pdf.close()
+        else:
+            self.html.write("</body></html>\n")
+            self.html.close()
+
+
+def export_report_task(task, df, analysis_type, path, split_by=None, top_n=10,
+                       granularity="Monthly", jobs=None):
+    # Render the report sections in worker processes and write them in order
+    # as they arrive
+    slices = report_slices(df, analysis_type, split_by)
+    title = f"Sales Report - {ANALYSIS_LABELS[analysis_type]} analysis"
+    writer = ReportWriter(path, title)
+    # PDF pages come back from the workers as pickled figures
+    calls = [(i, (name, frame, analysis_type, top_n, granularity, writer.image))
+             for i, (name, frame) in enumerate(slices)]
+    workers = min(len(calls), jobs or os.cpu_count() or 1)
+    try:
+        if analysis_type == "map":
+            task.report(0.0, "Writing interactive map...")
+            map_path, _ = save_map_task(task, df, os.path.splitext(path)[0] + '_map.html')
+            writer.add_link("Interactive map", map_path)
+        if workers > 1:
+            results = ((i, future.result())
+                       for i, future in iter_process_results(task, render_report_section, calls, workers))
+        else:
+            results = ((i, render_report_section(*args)) for i, args in calls)
+        ready = {}
+        written = 0
+        for i, section in results:
+            ready[i] = section
+            while written in ready:
+                writer.add(ready.pop(written))
+                written += 1
+            task.report(written / len(calls), f"Rendered {written} of {len(calls)} sections...")
+    finally:
+        writer.close()
+    task.report(1.0, f"Report saved to {path}")
+    return path, writer.pages
+
+
+# Rough centres of sales regions used for synthetic customer coordinates
+SYNTHETIC_REGIONS = [
+    (40.71, -74.01), (34.05, -118.24), (41.88, -87.63), (29.76, -95.37),
+    (51.51, -0.13), (48.86, 2.35), (52.52, 13.40), (24.86, 67.01),
+    (31.55, 74.34), (25.20, 55.27), (35.68, 139.69), (-33.87, 151.21),
+]
+
+BENCHMARK_SIZES = (1000, 10000, 100000, 1000000)
+BENCHMARK_EXCEL_MAX_ROWS = 100000   # writing larger workbooks takes minutes
+BENCHMARK_TREE_WINDOWS = 20         # preview pages formatted per tree stage
+BENCHMARK_TOLERANCE = 0.25          # allowed slowdown before a stage is a regression
+BENCHMARK_SHEETS = 4                # sheets of the multi-sheet workbook stage
+BENCHMARK_MAP_TILE_POINTS = 20      # customers whose tiles are requested per zoom
+
+
+def generate_sales_data(analysis_type, rows, seed=0):
+    # Deterministic synthetic dataset in the import column layout of the
+    # analysis type: skewed sales, previous-year values and targets around
+    # the current sales, and coordinates clustered around sales regions
+    rng = np.random.default_rng(seed)
+    customers = np.char.add('Customer ', np.arange(1, rows + 1).astype(str))
+    sales = np.round(rng.lognormal(mean=9.5, sigma=1.1, size=rows), 2)
+
+    if analysis_type == "yoy":
+        growth = rng.normal(0.05, 0.25, rows).clip(-0.9, 3.0)
+        previous = np.round(sales / (1 + growth), 2)
+        return pd.DataFrame({'Customer': customers, 'Current Sales': sales,
+                             'Previous Sales': previous, **synthetic_dimensions(rng, rows)})
+    if analysis_type == "target":
+        target = np.round(sales * rng.normal(1.0, 0.2, rows).clip(0.3, 2.0), -2)
+        return pd.DataFrame({'Customer': customers, 'Current Sales': sales,
+                             'Target': np.maximum(target, 100), **synthetic_dimensions(rng, rows)})
+    if analysis_type == "timeseries":
+        # About two sales per customer and month over three years, with a
+        # seasonal swing and 5% yearly growth
+        n_customers = max(1, rows // 72)
+        month = rng.integers(0, 36, rows)
+        dates = (np.datetime64('2022-01', 'M') + month).astype('datetime64[D]') + rng.integers(0, 28, rows)
+        season = 1 + 0.25 * np.sin(2 * np.pi * (month % 12) / 12)
+        sales = np.round(sales / 10 * season * 1.05 ** (month / 12), 2)
+        return pd.DataFrame({'Customer': customers[rng.integers(0, n_customers, rows)],
+                             'Date': dates, 'Sales': sales})
+
+    centres = np.array(SYNTHETIC_REGIONS)[rng.integers(0, len(SYNTHETIC_REGIONS), rows)]
+    lat = (centres[:, 0] + rng.normal(0, 0.6, rows)).clip(-85, 85)
+    lon = (centres[:, 1] + rng.normal(0, 0.8, rows) + 180) % 360 - 180
+    return pd.DataFrame({'Customer': customers, 'Sales': sales,
+                         'Latitude': np.round(lat, 5), 'Longitude': np.round(lon, 5)})
+
+
+def synthetic_regions_geojson(path, cells=4, vertices=50):
+    # A grid of cells x cells one-degree regions around every synthetic
+    # sales region. Borders wiggle between the grid corners as a function
+    # of their position, so neighbouring regions share the same points.
+    def border(fixed, start, vertical, reverse=False):
+        t = np.linspace(0, 1, vertices + 1)
+        t = t[::-1][:-1] if reverse else t[:-1]
+        across = fixed + 0.02 * np.sin(5 * np.pi * t) * np.cos(fixed + start)
+        return np.column_stack([across, start + t] if vertical else [start + t, across])
+
+    features = []
+    for lat, lon in SYNTHETIC_REGIONS:
+        for row in range(cells):
+            for col in range(cells):
+                south, west = np.floor(lat) - cells // 2 + row, np.floor(lon) - cells // 2 + col
+                ring = np.concatenate([border(south, west, False), border(west + 1, south, True),
+                                       border(south + 1, west, False, True),
+                                       border(west, south, True, True)])
+                ring = np.vstack([ring, ring[:1]]).round(6)
+                features.append({'type': 'Feature',
+                                 'properties': {'name': f"Region {len(features) + 1}"},
+                                 'geometry': {'type': 'Polygon', 'coordinates': [ring.tolist()]}})
+    with open(path, 'w') as f:
+        json.dump({'type': 'FeatureCollection', 'features': features}, f)
+
+
+def synthetic_dimensions(rng, rows):
+    # Region / channel / product / rep columns for drill-down
+    regions = np.array(['North', 'South', 'East', 'West', 'Central', 'Export', 'Online', 'Key Accounts'])
+    channels = np.array(['Retail', 'Wholesale', 'Distributor', 'Direct'])
+    products = np.char.add('Product ', np.arange(1, 31).astype(str))
+    reps = np.char.add('Rep ', np.arange(1, 121).astype(str))
+    return {'Region': regions[rng.integers(0, len(regions), rows)],
+            'Channel': channels[rng.integers(0, len(channels), rows)],
+            'Product': products[rng.integers(0, len(products), rows)],
+            'Rep': reps[rng.integers(0, len(reps), rows)]}
+
+
+def measure(fn, repeat=1):
+    # Best untraced wall time over repeat runs, then one extra run under
+    # tracemalloc for the peak (MB); tracing would inflate the timings
+    best, result = None, None
+    for _ in range(repeat):
+        result = None
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    result = None
+    tracemalloc.start()
+    try:
+        result = fn()
+        peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    finally:
+        tracemalloc.stop()
+    return best, peak, result
+
+
+def benchmark_dataset(analysis_type, rows, work_dir, repeat=1, seed=0):
+    # Time every stage of the import -> preview -> analysis -> charts (or
+    # map) path on one synthetic dataset; returns {stage: (seconds, peak MB)}
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    task = BackgroundTask('benchmark', None)
+    raw = generate_sales_data(analysis_type, rows, seed)
+    stem = os.path.join(work_dir, f"{analysis_type}_{rows}")
+    raw.to_csv(stem + '.csv', index=False)
+    pasted = raw.to_csv(sep='\t', index=False)
+    if rows <= BENCHMARK_EXCEL_MAX_ROWS:
+        raw.to_excel(stem + '.xlsx', index=False)
+        # The same rows spread over several sheets, read in parallel
+        with pd.ExcelWriter(stem + '_sheets.xlsx') as writer:
+            for i, sheet in enumerate(np.array_split(np.arange(len(raw)), BENCHMARK_SHEETS)):
+                raw.iloc[sheet].to_excel(writer, sheet_name=f"Sheet{i + 1}", index=False)
+    del raw
+
+    results = {}
+
+    def run(stage, fn):
+        seconds, peak, value = measure(fn, repeat)
+        results[stage] = (seconds, peak)
+        return value
+
+    df, _ = run('import_csv', lambda: load_file_task(task, stem + '.csv', analysis_type))
+    if rows <= BENCHMARK_EXCEL_MAX_ROWS:
+        run('import_excel', lambda: load_file_task(task, stem + '.xlsx', analysis_type))
+        run(f'import_excel_{BENCHMARK_SHEETS}_sheets',
+            lambda: load_file_task(task, stem + '_sheets.xlsx', analysis_type))
+    run('import_paste', lambda: load_pasted_task(task, pasted, analysis_type))
+    del pasted
+
+    formats = PREVIEW_FORMATS[analysis_type]
+    page = 50
+    starts = np.linspace(0, max(0, len(df) - page), BENCHMARK_TREE_WINDOWS).astype(int)
+    run('tree', lambda: [format_preview_rows(df, formats, s, s + page) for s in starts])
+    run('quality', lambda: quality_flags(df, analysis_type))
+
+    if analysis_type == "map":
+        run('map', lambda: save_map_task(task, df, stem + '.html'))
+        pyramid, _, _ = run('map_pyramid', lambda: build_tiled_map_task(task, df))
+        # The tiles around a few customers at every zoom level
+        lat, lon = df['Latitude'].to_numpy(), df['Longitude'].to_numpy()
+        sample = np.linspace(0, len(df) - 1, BENCHMARK_MAP_TILE_POINTS).astype(int)
+        tiles = [(zoom, int(x), int(y)) for zoom in range(TILE_MAX_ZOOM + 1)
+                 for x, y in zip(*mercator_tiles(lat[sample], lon[sample], zoom))]
+        run(f'map_tiles_x{len(tiles)}',
+            lambda: [json.dumps(pyramid.tile(*tile)) for tile in tiles])
+        # Region map over synthetic boundaries, without the cache
+        regions_path = stem + '_regions.geojson'
+        synthetic_regions_geojson(regions_path)
+        index = run('regions_index', lambda: RegionIndex.from_geojson(regions_path))
+        assignment = run('regions_assign', lambda: index.assign(lat, lon))
+        run('region_map', lambda: build_region_map(
+            index, region_table(index, assignment, df['Sales'].to_numpy(dtype=np.float64))
+        ).save(stem + '_regions.html'))
+        return results
+
+    def fresh_graph():
+        graph = build_analysis_graph()
+        graph.set_input('data', df)
+        graph.set_input('analysis_type', analysis_type)
+        graph.set_input('top_n', 10)
+        return graph
+
+    run('analysis', lambda: fresh_graph().get(graph_node(analysis_type, 'analysis_data')))
+    if analysis_type in DERIVED_METRICS:
+        # Dragging the Top N slider over its whole range
+        graph = fresh_graph()
+        graph.get('analysis_data')
+
+        def sweep_top_n():
+            for top_n in range(1, TOP_N_SLIDER_MAX + 1):
+                graph.set_input('top_n', top_n)
+                graph.get('analysis_data')
+        run(f'top_n_sweep_x{TOP_N_SLIDER_MAX}', sweep_top_n)
+    if analysis_type in DIMENSION_TYPES:
+        cube = run('cube', lambda: fresh_graph().get('dimension_cube'))
+        graph = fresh_graph()
+        graph.get('dimension_cube')
+        # Every single-member slice, broken down by each other dimension
+        drills = [(((d, str(m)),), b) for d, members in zip(cube.dimensions, cube.members)
+                  for m in members for b in cube.dimensions if b != d]
+
+        def drill_down():
+            for drill in drills:
+                graph.set_input('drill', drill)
+                graph.get('drill_data')
+        run(f'drill_x{len(drills)}', drill_down)
+    if analysis_type == "timeseries":
+        # Changing granularity reuses the cube built from the raw rows
+        graph = fresh_graph()
+        graph.get('ts_cube')
+
+        def switch_granularity():
+            for granularity in GRANULARITIES:
+                graph.set_input('granularity', granularity)
+                graph.get('ts_analysis_data')
+        run('granularity_switch', switch_granularity)
+    figure = Figure(figsize=(10, 6))
+    canvas = FigureCanvasAgg(figure)
+    for chart_type in CHART_TYPES:
+        chart = run(f'chart_{chart_type}',
+                    lambda: fresh_graph().get(graph_node(analysis_type, 'chart_' + chart_type)))
+        renderer = ChartRenderer(figure)
+        run(f'render_{chart_type}', lambda: (renderer.draw(chart), canvas.draw()))
+    # Individually drawn bars at the reduction cap, the largest such chart
+    bars = sorted_chart(np.linspace(-50, 50, MAX_CHART_BARS), "yoy", "bar")
+    renderer = ChartRenderer(figure)
+    run(f'render_bar_x{MAX_CHART_BARS}', lambda: (renderer.draw(bars), canvas.draw()))
+    run(f'update_bar_x{MAX_CHART_BARS}', lambda: (renderer.draw(dict(bars, y=bars['y'][::-1])), canvas.draw()))
+    return results
+
+
+def run_benchmark(sizes=BENCHMARK_SIZES, analysis_types=None, repeat=1, baseline=None,
+                  save_baseline=None, tolerance=BENCHMARK_TOLERANCE):
+    # Benchmark every analysis type at each size, print a table and compare
+    # with a stored baseline; returns 1 when any stage regressed
+    analysis_types = analysis_types or list(ANALYSIS_COLUMNS)
+    previous = {}
+    if baseline:
+        with open(baseline) as f:
+            previous = json.load(f)['results']
+
+    results = {}
+    regressions = []
+    print(f"{'stage':<40}{'seconds':>10}{'peak MB':>10}{'baseline':>10}{'change':>9}")
+    with tempfile.TemporaryDirectory(prefix='sales_bench_') as work_dir:
+        for analysis_type in analysis_types:
+            for rows in sizes:
+                stages = benchmark_dataset(analysis_type, rows, work_dir, repeat)
+                for stage, (seconds, peak) in stages.items():
+                    name = f"{analysis_type}/{rows}/{stage}"
+                    results[name] = {'seconds': round(seconds, 5), 'peak_mb': round(peak, 2)}
+                    line = f"{name:<40}{seconds:>10.4f}{peak:>10.1f}"
+                    if name in previous:
+                        before = previous[name]['seconds']
+                        change = seconds / before - 1 if before else 0.0
+                        line += f"{before:>10.4f}{change:>+9.0%}"
+                        # Sub-10ms stages are dominated by timer noise
+                        if change > tolerance and seconds - before > 0.01:
+                            regressions.append(name)
+                            line += "  REGRESSION"
+                        elif previous[name]['peak_mb'] * (1 + tolerance) + 1 < peak:
+                            regressions.append(name)
+                            line += "  MEMORY"
+                    print(line, flush=True)
+
+    if save_baseline:
+        with open(save_baseline, 'w') as f:
+            json.dump({'python': sys.version.split()[0], 'pandas': pd.__version__,
+                       'numpy': np.__version__, 'repeat': repeat, 'results': results}, f, indent=2)
+        print(f"Baseline written to {save_baseline}")
+    if regressions:
+        print(f"{len(regressions)} stage(s) regressed beyond {tolerance:.0%}: "
+              + ", ".join(regressions), file=sys.stderr)
+        return 1
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Sales Analysis Tool. Without --batch the desktop application is started.")
+    parser.add_argument('--batch', nargs='+', metavar='PATH',
+                        help="files or directories to process without the GUI")
+    parser.add_argument('--type', dest='analysis_type', choices=sorted(ANALYSIS_COLUMNS),
+                        help="analysis type (default: yoy; all types for --benchmark)")
+    parser.add_argument('--out', default='reports', help="output directory (default: reports)")
+    parser.add_argument('--formats', default='png',
+                        help="comma separated chart formats, e.g. png,svg (default: png)")
+    parser.add_argument('--top-n', type=int, default=10, help="customers in the Top N chart")
+    parser.add_argument('--jobs', type=int, default=None,
+                        help="worker processes (default: number of CPUs)")
+    parser.add_argument('--no-cache', action='store_true', help="do not use the import cache")
+    parser.add_argument('--granularity', choices=list(GRANULARITIES), default="Monthly",
+                        help="period length of time series analysis (default: Monthly)")
+    parser.add_argument('--regions', metavar='GEOJSON',
+                        help="region boundaries for a choropleth map and per-region totals (--type map)")
+    parser.add_argument('--startup-time', action='store_true',
+                        help="open the window, print the startup time and exit")
+
+    bench = parser.add_argument_group("benchmarking")
+    bench.add_argument('--benchmark', action='store_true',
+                       help="time every processing stage on synthetic data")
+    bench.add_argument('--sizes', default=','.join(map(str, BENCHMARK_SIZES)),
+                       help="comma separated row counts (default: 1000,10000,100000,1000000)")
+    bench.add_argument('--repeat', type=int, default=1, help="runs per stage, best time is kept")
+    bench.add_argument('--baseline', metavar='JSON', help="compare with a saved benchmark")
+    bench.add_argument('--save-baseline', metavar='JSON', help="save the results as a baseline")
+    bench.add_argument('--tolerance', type=float, default=BENCHMARK_TOLERANCE,
+                       help="allowed slowdown against the baseline (default: 0.25)")
+    bench.add_argument('--generate', metavar='CSV',
+                       help="write one synthetic dataset of --rows rows and exit")
+    bench.add_argument('--rows', type=int, default=10000, help="rows for --generate")
+    bench.add_argument('--seed', type=int, default=0, help="random seed for --generate")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.generate:
+        generate_sales_data(args.analysis_type or 'yoy', args.rows, args.seed).to_csv(
+            args.generate, index=False)
+        return 0
+    if args.benchmark:
+        sizes = [int(size) for size in args.sizes.split(',') if size.strip()]
+        types = [args.analysis_type] if args.analysis_type else None
+        return run_benchmark(sizes, types, args.repeat, args.baseline,
+                             args.save_baseline, args.tolerance)
+    if args.batch:
+        formats = tuple(fmt.strip() for fmt in args.formats.split(',') if fmt.strip())
+        return run_batch(args.batch, args.analysis_type or 'yoy', args.out, formats,
+                         args.top_n, args.jobs, not args.no_cache, args.granularity, args.regions)
+
+    if tk is None:
+        print("Tkinter is not available; use --batch to run without the GUI", file=sys.stderr)
+        return 1
+    with DIAGNOSTICS.operation('startup'):
+        DIAGNOSTICS.record('module_load', time.perf_counter() - STARTUP_START)
+        with DIAGNOSTICS.stage('window'):
+            root = tk.Tk()
+            app = SalesVisualizationTool(root)
+            root.update()
+        startup = time.perf_counter() - STARTUP_START
+        DIAGNOSTICS.record('total', startup)
+    app.status_var.set(f"Ready (started in {startup:.2f} s)")
+    if args.startup_time:
+        for record in DIAGNOSTICS.records:
+            print(f"{record['stage']}: {record['seconds'] * 1000:.0f} ms")
+        root.destroy()
+        return 0
+    root.mainloop()
+    return 0
+
+
 if __name__ == "__main__":
-    root = tk.Tk()
-    app = SalesVisualizationTool(root)
-    root.mainloop()
\ No newline at end of file
+    sys.exit(main())
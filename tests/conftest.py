@@ -0,0 +1,30 @@
+import importlib.util
+import os
+import sys
+
+import pytest
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                      "analysis tool with map visualization.py")
+
+
+@pytest.fixture(scope="session")
+def tool():
+    # The tool is a single script with spaces in its name; load it as a module
+    spec = importlib.util.spec_from_file_location("sales_tool", SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["sales_tool"] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def task(tool):
+    return tool.BackgroundTask('test', None)
+
+
+@pytest.fixture
+def load_text(tool, task):
+    def load(text, analysis_type):
+        return tool.load_pasted_task(task, text, analysis_type)
+    return load
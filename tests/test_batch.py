@@ -0,0 +1,60 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+
+def test_find_batch_inputs(tool, tmp_path):
+    for name in ["b.csv", "a.XLSX", "c.txt", "old.xls", "~$a.xlsx", "notes.json", "chart.png"]:
+        (tmp_path / name).write_text("")
+    single = tmp_path / "elsewhere.dat"
+    found = tool.find_batch_inputs([str(tmp_path), str(single)])
+    # Directories contribute their spreadsheets and text files in name
+    # order (without Excel lock files); named files are taken as given
+    assert [os.path.basename(path) for path in found] == ["a.XLSX", "b.csv", "c.txt", "old.xls", "elsewhere.dat"]
+
+
+@pytest.fixture
+def export(tmp_path):
+    rows = [f"c{i},{100 + i},{80 + i % 7},{'North' if i % 2 else 'South'}" for i in range(30)]
+    rows[4] = "c4,abc,80,South"   # rejected
+    rows[5] = "c5,0,0,North"      # no growth: flagged by the quality checks
+    path = tmp_path / "sales.csv"
+    path.write_text("Customer,Current Sales,Previous Sales,Region\n" + "\n".join(rows) + "\n")
+    return path
+
+
+def test_write_report(tool, export, tmp_path):
+    out = tmp_path / "out"
+    written = tool.write_report(str(export), "yoy", str(out), formats=('png', 'svg'), top_n=5, use_cache=False)
+    names = sorted(os.path.basename(path) for path in written)
+    charts = [f"sales_{chart}.{fmt}" for chart in tool.CHART_TYPES for fmt in ('png', 'svg')]
+    assert names == sorted(["sales_summary.json", "sales_flagged.csv", "sales_rejected.csv",
+                            "sales_top5.png", "sales_top5.svg"] + charts)
+    assert all(os.path.getsize(path) > 0 for path in written)
+
+    with open(out / "sales_summary.json") as f:
+        report = json.load(f)
+    df, _ = tool.load_file_task(tool.BackgroundTask('test', None), str(export), "yoy")
+    assert report['records'] == len(df) == 29 and report['rejected_rows'] == 1
+    assert report['source'] == os.path.abspath(export) and report['analysis_type'] == "yoy"
+    assert report['memory_bytes'] == tool.memory_footprint(df)
+    assert report['data_quality']['flagged'] >= 1
+    summary = report['summary']
+    assert summary['Total Customers'] == 29
+    assert np.isclose(summary['Total Current Cases'], df['Current Sales'].sum())
+    rejected = pd.read_csv(out / "sales_rejected.csv")
+    assert rejected['Customer'].tolist() == ['c4'] and rejected['Row'].tolist() == [6]
+    flagged = pd.read_csv(out / "sales_flagged.csv")
+    assert 'c5' in flagged['Customer'].tolist()
+
+
+def test_write_report_for_a_map(tool, tmp_path):
+    path = tmp_path / "stores.csv"
+    path.write_text("Customer,Sales,Latitude,Longitude\na,100,52.5,13.4\nb,50,48.1,11.6\n")
+    written = tool.write_report(str(path), "map", str(tmp_path / "out"), use_cache=False)
+    assert sorted(os.path.basename(p) for p in written) == ["stores_map.html", "stores_summary.json"]
+    with open(tmp_path / "out" / "stores_summary.json") as f:
+        assert json.load(f)['records'] == 2
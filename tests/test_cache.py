@@ -0,0 +1,79 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+TEXT = ("Customer,Current Sales,Previous Sales,Region\n"
+        "a,100,90,North\nb,x,60,South\nc,70.25,70,North\nd,123456789.37,5,East\n")
+
+
+@pytest.fixture
+def cache(tool, tmp_path):
+    return tool.DatasetCache(str(tmp_path / "cache"), budget_mb=64)
+
+
+@pytest.fixture
+def export(tmp_path):
+    path = tmp_path / "export.csv"
+    path.write_text(TEXT, encoding='utf-8')
+    return str(path)
+
+
+def test_round_trip_restores_types_and_rejected_rows(tool, task, cache, export):
+    fresh, summary = tool.load_file_task(task, export, "yoy", cache)
+    loaded, cached_summary = cache.load(cache.key(export, "yoy"))
+    # The cache keeps only the categories in use (b was rejected)
+    fresh = fresh.apply(lambda c: c.cat.remove_unused_categories() if c.dtype == 'category' else c)
+    assert list(loaded.dtypes) == list(fresh.dtypes)
+    assert loaded['Current Sales'].dtype == np.float64 and loaded['Previous Sales'].dtype == np.float32
+    pd.testing.assert_frame_equal(loaded, fresh)
+    assert list(loaded['Region'].cat.categories) == ['East', 'North']
+    assert cached_summary.state() == summary.state()
+    assert cached_summary.rejected == 1
+    assert cached_summary.rejected_rows == summary.rejected_rows
+    # A second open is served from the cache
+    again, again_summary = tool.load_file_task(task, export, "yoy", cache)
+    pd.testing.assert_frame_equal(again, loaded)
+    assert not again['Current Sales'].to_numpy().flags.writeable
+    assert again_summary.rejected_rows == summary.rejected_rows
+
+
+def test_cached_columns_are_read_only_maps(tool, task, cache, export):
+    tool.load_file_task(task, export, "yoy", cache)
+    key = cache.key(export, "yoy")
+    entry = os.path.join(cache.directory, key)
+    before = {name: open(os.path.join(entry, name), 'rb').read() for name in os.listdir(entry)}
+    df, _ = cache.load(key)
+    values = df['Current Sales'].to_numpy()
+    assert isinstance(values.base, np.memmap) or isinstance(values, np.memmap)
+    assert not values.flags.writeable
+    # Analyses and merges work on the mapped frame without writing to it
+    graph = tool.build_analysis_graph()
+    for name, value in (('data', df), ('analysis_type', "yoy"), ('top_n', 2)):
+        graph.set_input(name, value)
+    graph.get('analysis_data')
+    graph.get('chart_bar')
+    delta, _ = tool.load_pasted_task(task, "Customer\tCurrent Sales\tPrevious Sales\na\t1\t1\n", "yoy")
+    tool.merge_datasets(df, delta, "yoy", 'sum')
+    after = {name: open(os.path.join(entry, name), 'rb').read() for name in os.listdir(entry)}
+    assert after == before
+
+
+def test_eviction_drops_least_recently_used(tool, task, tmp_path):
+    cache = tool.DatasetCache(str(tmp_path / "cache"))
+    df, summary = tool.load_pasted_task(task, TEXT.replace(",", "\t"), "yoy")
+    for i, key in enumerate(['first', 'second', 'third']):
+        cache.store(key, df, summary)
+        # Distinct, increasing use times
+        manifest = os.path.join(cache.directory, key, 'manifest.json')
+        os.utime(manifest, (1000 + i, 1000 + i))
+    entry_size = sum(e.stat().st_size for e in os.scandir(os.path.join(cache.directory, 'first')))
+    assert cache.load('first') is not None   # now the most recently used
+    cache.budget_bytes = 2 * entry_size
+    cache.evict()
+    assert sorted(os.listdir(cache.directory)) == ['first', 'third']
+    assert cache.load('second') is None
+    cache.budget_bytes = 0
+    cache.evict()
+    assert os.listdir(cache.directory) == []
@@ -0,0 +1,68 @@
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+
+def test_bars_up_to_the_cap_are_kept(tool):
+    chart = tool.sorted_chart(np.arange(tool.MAX_CHART_BARS, dtype=float), "yoy", "bar")
+    reduced = tool.reduce_chart(chart)
+    assert 'edges' not in reduced
+    assert len(reduced['y']) == tool.MAX_CHART_BARS
+
+
+def test_bars_above_the_cap_become_bucket_extremes(tool):
+    values = np.zeros(tool.MAX_CHART_BARS * 10)
+    values[5] = -7.0
+    values[-3] = 9.0
+    reduced = tool.reduce_chart(tool.sorted_chart(values, "yoy", "bar"))
+    assert len(reduced['y']) == tool.MAX_CHART_BARS
+    assert len(reduced['edges']) == tool.MAX_CHART_BARS + 1
+    assert reduced['edges'][0] == 0 and reduced['edges'][-1] == len(values)
+    # The furthest-from-zero value of each bucket survives
+    assert reduced['y'].min() == -7.0 and reduced['y'].max() == 9.0
+
+
+def test_lines_keep_both_extremes(tool):
+    values = np.sin(np.linspace(0, 50, tool.MAX_LINE_POINTS * 10))
+    reduced = tool.reduce_chart(tool.sorted_chart(values, "target", "line"))
+    assert len(reduced['y']) <= tool.MAX_LINE_POINTS + 2
+    assert reduced['y'].max() == values.max() and reduced['y'].min() == values.min()
+
+
+def bar_artists(ax):
+    from matplotlib.collections import PolyCollection
+    from matplotlib.patches import Rectangle, StepPatch
+    bars = [c for c in ax.collections if isinstance(c, PolyCollection)]
+    steps = [p for p in ax.patches if isinstance(p, StepPatch)]
+    rectangles = [p for p in ax.patches if type(p) is Rectangle]
+    return bars, steps, rectangles
+
+
+def test_bar_chart_at_the_cap_is_one_reused_collection(tool):
+    figure = Figure(figsize=(10, 6))
+    canvas = FigureCanvasAgg(figure)
+    chart = tool.sorted_chart(np.linspace(-50, 50, tool.MAX_CHART_BARS), "yoy", "bar")
+    renderer = tool.ChartRenderer(figure)
+    renderer.draw(chart)
+    canvas.draw()
+    bars, steps, rectangles = bar_artists(renderer.ax)
+    assert len(bars) == 1 and not steps and not rectangles
+    assert len(bars[0].get_paths()) == tool.MAX_CHART_BARS
+    ax = renderer.ax
+    renderer.draw(dict(chart, y=chart['y'] * 2))
+    canvas.draw()
+    # Updated in place: same axes and artist, new heights and limits
+    assert renderer.ax is ax and bar_artists(ax)[0] == bars
+    assert bars[0].get_paths()[0].vertices[:, 1].max() == 100
+    assert ax.get_ylim()[1] >= 100
+
+
+def test_bars_above_the_cap_are_one_step_patch(tool):
+    figure = Figure(figsize=(10, 6))
+    chart = tool.reduce_chart(tool.sorted_chart(np.arange(tool.MAX_CHART_BARS * 3.0), "yoy", "bar"))
+    renderer = tool.ChartRenderer(figure)
+    renderer.draw(chart)
+    bars, steps, rectangles = bar_artists(renderer.ax)
+    assert len(steps) == 1 and not bars and not rectangles
+    renderer.draw(dict(chart, y=chart['y'] / 2))
+    assert bar_artists(renderer.ax)[1] == steps
@@ -0,0 +1,82 @@
+import itertools
+
+import numpy as np
+import pytest
+
+REGIONS = ['North', 'South', 'East']
+CHANNELS = ['Retail', 'Online']
+PRODUCTS = ['A', 'B', 'C', 'D']
+
+
+@pytest.fixture(scope="module")
+def sales(tool):
+    rng = np.random.default_rng(11)
+    rows = [f"c{i}\t{rng.integers(0, 500)}\t{rng.integers(1, 500)}\t{rng.choice(REGIONS)}\t"
+            f"{rng.choice(CHANNELS)}\t{rng.choice(PRODUCTS)}" for i in range(400)]
+    text = "Customer\tCurrent Sales\tPrevious Sales\tRegion\tChannel\tProduct\n" + "\n".join(rows)
+    df, _ = tool.load_pasted_task(tool.BackgroundTask('test', None), text, "yoy")
+    return df
+
+
+def expected_totals(df, mask):
+    rows = df[mask]
+    growth = (rows['Current Sales'] - rows['Previous Sales']) / rows['Previous Sales']
+    return [rows['Current Sales'].sum(), rows['Previous Sales'].sum(), len(rows), (growth > 0).sum()]
+
+
+SELECTIONS = [(), (('Region', 'North'),), (('Region', 'South'), ('Product', 'C')),
+              (('Region', 'East'), ('Channel', 'Online'), ('Product', 'A'))]
+
+
+@pytest.fixture(params=['dense', 'sparse'])
+def cube(request, tool, sales, monkeypatch):
+    if request.param == 'sparse':
+        monkeypatch.setattr(tool, 'MAX_DENSE_CUBE_VALUES', 10)
+    cube = tool.DimensionCube(sales, "yoy")
+    assert (cube.dense is None) == (request.param == 'sparse')
+    return cube
+
+
+@pytest.mark.parametrize("selection", SELECTIONS)
+def test_total_matches_groupby(sales, cube, selection):
+    mask = np.ones(len(sales), dtype=bool)
+    for dimension, member in selection:
+        mask &= (sales[dimension] == member).to_numpy()
+    assert np.allclose(cube.total(selection), expected_totals(sales, mask))
+
+
+@pytest.mark.parametrize("selection, dimension",
+                         [((), 'Region'), ((('Channel', 'Retail'),), 'Product'),
+                          ((('Region', 'North'), ('Product', 'B')), 'Channel'),
+                          ((('Region', 'North'),), 'Region')])
+def test_breakdown_matches_groupby(sales, cube, selection, dimension):
+    members, sums = cube.breakdown(selection, dimension)
+    grouped = sales[np.logical_and.reduce(
+        [(sales[d] == m).to_numpy() for d, m in selection if d != dimension] + [np.ones(len(sales), bool)])]
+    totals = grouped.groupby(dimension, observed=False)[['Current Sales', 'Previous Sales']].sum()
+    counts = grouped.groupby(dimension, observed=False).size()
+    assert list(members) == list(totals.index)
+    assert np.allclose(sums[:, 0], totals['Current Sales'])
+    assert np.allclose(sums[:, 1], totals['Previous Sales'])
+    assert np.allclose(sums[:, 2], counts)
+
+
+def test_drill_analysis_data(sales, cube, tool):
+    data = tool.drill_analysis_data(cube, ((('Channel', 'Online'),), 'Region'), 2)
+    online = sales[sales['Channel'] == 'Online']
+    by_region = online.groupby('Region', observed=False)['Current Sales'].sum().sort_values(ascending=False)
+    assert data['labels'] == by_region.index[:2].tolist()
+    assert np.allclose(data['series'][0][1], by_region.iloc[:2])
+    assert data['summary']['Total Customers'] == len(online)
+    assert np.isclose(data['summary']['Slice Growth'],
+                      (online['Current Sales'].sum() / online['Previous Sales'].sum() - 1) * 100)
+    assert data['title'] == "Current Year vs Previous Year by Region (Channel=Online)"
+
+
+def test_every_dense_cell_matches_the_sparse_one(tool, sales, monkeypatch):
+    dense = tool.DimensionCube(sales, "yoy")
+    monkeypatch.setattr(tool, 'MAX_DENSE_CUBE_VALUES', 10)
+    sparse = tool.DimensionCube(sales, "yoy")
+    for region, channel in itertools.product(REGIONS + [None], CHANNELS + [None]):
+        selection = tuple((d, m) for d, m in (('Region', region), ('Channel', channel)) if m)
+        assert np.allclose(dense.total(selection), sparse.total(selection))
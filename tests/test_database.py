@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def history(tool, load_text, tmp_path):
+    # A time series dataset whose upsert deleted rows, leaving rowid gaps
+    rng = np.random.default_rng(2)
+    rows = [f"c{i % 40}\t2024-{1 + i // 40:02d}-01\t{rng.integers(1, 100)}" for i in range(400)]
+    base, _ = load_text("Customer\tDate\tSales\n" + "\n".join(rows), "timeseries")
+    changed, _ = load_text("Customer\tDate\tSales\n" + "\n".join(
+        f"c{i}\t2024-0{1 + i % 9}-01\t{i + 1000}" for i in range(0, 40, 3)), "timeseries")
+    database = tool.SalesDatabase(str(tmp_path / "sales.db"))
+    for frame, mode in ((base, 'replace'), (changed, 'upsert')):
+        writer = tool.DatabaseWriter(database, "history", "timeseries", mode)
+        writer.write(frame)
+        dataset = writer.finish()
+    return dataset
+
+
+def test_preview_windows_match_rowid_order(history):
+    assert not history._contiguous and history.rows == 400
+    everything = history._frame(f"SELECT {history._select()} FROM {history.table} ORDER BY rowid")
+    rng = np.random.default_rng(4)
+    for start in [0, 380, 395, 120, 60, 61, 250, 0, 399] + rng.integers(0, 400, 30).tolist():
+        stop = start + 25
+        window = history.preview(start, stop)
+        assert window.equals(everything.iloc[start:stop].reset_index(drop=True))
+    assert history._anchors == sorted(set(history._anchors))
+
+
+def test_preview_of_a_table_without_gaps(tool, load_text, tmp_path):
+    df, _ = load_text("Customer\tCurrent Sales\tPrevious Sales\n" +
+                      "\n".join(f"c{i}\t{i}\t{i + 1}" for i in range(100)), "yoy")
+    writer = tool.DatabaseWriter(tool.SalesDatabase(str(tmp_path / "sales.db")), "test", "yoy", 'replace')
+    writer.write(df)
+    dataset = writer.finish()
+    assert dataset._contiguous
+    assert dataset.preview(90, 120)['Customer'].tolist() == [f"c{i}" for i in range(90, 100)]
+    assert dataset.preview(5, 7)['Current Sales'].tolist() == [5, 6]
+    assert dataset._anchors == []
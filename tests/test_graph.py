@@ -0,0 +1,80 @@
+import threading
+
+import numpy as np
+
+
+def counting_graph(tool, on_delta=None):
+    graph = tool.ComputationGraph()
+    graph.set_input('values', np.array([1.0, 2.0]))
+    graph.set_input('scale', 2)
+    graph.define('total', lambda v, s: float(v.sum()) * s, ['values', 'scale'], on_delta=on_delta)
+    return graph
+
+
+def test_unchanged_inputs_do_not_recompute(tool):
+    graph = counting_graph(tool)
+    assert graph.get('total') == 6
+    graph.set_input('scale', 2)
+    graph.set_input('values', graph.inputs['values'][0])
+    assert graph.get('total') == 6
+    assert graph.recomputed['total'] == 1
+    graph.set_input('scale', 3)
+    assert graph.get('total') == 9
+    assert graph.recomputed['total'] == 2
+
+
+def test_apply_delta_patches_instead_of_recomputing(tool):
+    graph = counting_graph(tool, on_delta=lambda old, added, removed, v, s: old + added.sum() * s)
+    graph.get('total')
+    graph.apply_delta('values', np.array([1.0, 2.0, 4.0]), np.array([4.0]))
+    assert graph.get('total') == 14
+    assert graph.recomputed['total'] == 1
+
+
+def test_apply_delta_falls_back_to_recomputing(tool):
+    graph = counting_graph(tool, on_delta=lambda old, added, removed, v, s: None)
+    graph.get('total')
+    graph.apply_delta('values', np.array([5.0]), np.array([5.0]))
+    assert graph.get('total') == 10
+    assert graph.recomputed['total'] == 2
+
+
+def test_versions_stay_unique_across_threads(tool):
+    graph = tool.ComputationGraph()
+
+    def set_inputs(prefix):
+        for i in range(500):
+            graph.set_input(f'{prefix}{i}', i)
+
+    threads = [threading.Thread(target=set_inputs, args=(p,)) for p in 'abcd']
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    versions = [version for _, version in graph.inputs.values()]
+    assert len(set(versions)) == len(versions) == 2000
+
+
+def test_merged_analysis_matches_a_fresh_graph(tool, load_text):
+    base, _ = load_text("Customer\tCurrent Sales\tPrevious Sales\n"
+                        "a\t100\t90\nb\t50\t60\nc\t70\t70\n", "yoy")
+    delta, _ = load_text("Customer\tCurrent Sales\tPrevious Sales\n"
+                         "b\t80\t60\nd\t200\t100\n", "yoy")
+    merged, added, removed = tool.merge_datasets(base, delta, "yoy", 'upsert')
+
+    graph = tool.build_analysis_graph()
+    for name, value in (('data', base), ('analysis_type', "yoy"), ('top_n', 3)):
+        graph.set_input(name, value)
+    graph.get('analysis_data')
+    graph.get('chart_pie')
+    graph.apply_delta('data', merged, added, removed)
+
+    fresh = tool.build_analysis_graph()
+    for name, value in (('data', merged), ('analysis_type', "yoy"), ('top_n', 3)):
+        fresh.set_input(name, value)
+    assert graph.recomputed['summary_state'] == 1
+    assert graph.recomputed['rank_index'] == 1
+    assert graph.get('summary') == fresh.get('summary')
+    assert np.array_equal(graph.get('bin_counts'), fresh.get('bin_counts'))
+    assert (graph.get('top_customers')['Customer'].tolist()
+            == fresh.get('top_customers')['Customer'].tolist() == ['d', 'a', 'b'])
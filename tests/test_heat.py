@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+
+@pytest.fixture(scope="module")
+def customers():
+    rng = np.random.default_rng(9)
+    lat = rng.uniform(40, 50, 2000)
+    lon = rng.uniform(-5, 15, 2000)
+    sales = rng.uniform(-50, 500, 2000)   # negative sales add no heat
+    sales[:100] = 0
+    return lat, lon, sales
+
+
+def expected_cells(lat, lon, sales, cell_size):
+    weight = np.clip(sales, 0, None)
+    cells = pd.DataFrame({'r': np.floor((lat - lat.min()) / cell_size), 'c': np.floor((lon - lon.min()) / cell_size),
+                          'w': weight, 'lat_w': lat * weight, 'lon_w': lon * weight, 'lat': lat, 'lon': lon})
+    sums = cells.groupby(['r', 'c']).sum()
+    counts = cells.groupby(['r', 'c']).size()
+    weighted = sums['w'] > 0
+    # Cells of customers without sales sit at their plain centre
+    centre_lat = np.where(weighted, sums['lat_w'] / sums['w'], sums['lat'] / counts)
+    centre_lon = np.where(weighted, sums['lon_w'] / sums['w'], sums['lon'] / counts)
+    return sorted(zip(centre_lat.round(5), centre_lon.round(5), (sums['w'] / sums['w'].max()).round(4)))
+
+
+@pytest.mark.parametrize("cell_size", [None, 0.5, 3.0, 100.0])
+def test_heat_cells_match_groupby(tool, customers, cell_size):
+    lat, lon, sales = customers
+    points = tool.bin_heat_data(lat, lon, sales, cell_size)
+    extent = max(np.ptp(lat), np.ptp(lon))
+    expected = expected_cells(lat, lon, sales, cell_size or extent / tool.HEAT_GRID_CELLS)
+    assert np.allclose(sorted(map(tuple, points)), expected)
+    assert max(p[2] for p in points) == 1.0
+
+
+def test_heat_edge_cases(tool):
+    assert tool.bin_heat_data(np.array([]), np.array([]), np.array([])) == []
+    # One location (zero extent) and no sales: one cell at full intensity
+    points = tool.bin_heat_data(np.array([1.0, 1.0]), np.array([2.0, 2.0]), np.array([0.0, np.nan]))
+    assert points == [[1.0, 2.0, 1.0]]
+
+
+def test_database_heat_matches_memory(tool, load_text, customers, tmp_path):
+    lat, lon, sales = customers
+    text = "Customer\tSales\tLatitude\tLongitude\n" + "\n".join(
+        f"c{i}\t{s!r}\t{la!r}\t{lo!r}" for i, (s, la, lo) in enumerate(zip(sales, lat, lon)))
+    df, _ = load_text(text, "map")
+    writer = tool.DatabaseWriter(tool.SalesDatabase(str(tmp_path / "sales.db")), "test", "map", 'replace')
+    writer.write(df)
+    dataset = writer.finish()
+    memory = tool.bin_heat_data(df['Latitude'].to_numpy(), df['Longitude'].to_numpy(), df['Sales'].to_numpy(), 0.5)
+    assert np.allclose(sorted(map(tuple, dataset.heat_data(0.5))), sorted(map(tuple, memory)))
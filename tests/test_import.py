@@ -0,0 +1,108 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+
+def test_metric_named_column_does_not_shadow_the_metric(tool, load_text):
+    df, _ = load_text("Customer\tCurrent Sales\tPrevious Sales\tGrowth\tRegion\n"
+                      "a\t100\t90\t11.1%\tNorth\nb\t50\t60\t-16.7%\tSouth\n", "yoy")
+    assert 'Growth' not in df.columns
+    assert df['Dimension 1'].astype(str).tolist() == ['11.1%', '-16.7%']
+    assert df['Region'].astype(str).tolist() == ['North', 'South']
+    assert np.allclose(tool.RankIndex(df, "yoy").sorted_values('Growth'), [-100 / 6, 100 / 9])
+    assert np.allclose(tool.preview_values(df, 'Growth'), [100 / 9, -100 / 6])
+
+
+@pytest.mark.parametrize("text, thousands, decimal, expected", [
+    ("1,234", ',', '.', 1234),
+    ("1,234.50", ',', '.', 1234.5),
+    ("(500)", ',', '.', -500),
+    ("2.5-", ',', '.', -2.5),
+    ("$ 1,200", ',', '.', 1200),
+    ("12%", ',', '.', 12),
+    ("−5", ',', '.', -5),
+    ("1.234,50", '.', ',', 1234.5),
+    ("(1.000,5)", '.', ',', -1000.5),
+    ("7,5-", '.', ',', -7.5),
+])
+def test_parse_numbers(tool, text, thousands, decimal, expected):
+    values = tool.parse_numbers(pd.Series([text, None]), thousands, decimal)
+    assert values[0] == expected and np.isnan(values[1])
+
+
+def test_unparseable_numbers_are_nan(tool):
+    assert np.isnan(tool.parse_numbers(pd.Series(["abc", "1..2"]))).all()
+
+
+@pytest.mark.parametrize("fields, expected", [
+    (["1,234.50", "17"], (',', '.')),
+    (["1.234,50"], ('.', ',')),
+    (["1.234.567"], ('.', ',')),
+    (["12,5", "1,234"], ('.', ',')),
+    # "1,234" on its own is ambiguous and keeps the default
+    (["1,234", "(500)"], (',', '.')),
+])
+def test_sniff_number_format(tool, fields, expected):
+    assert tool.sniff_number_format(fields) == expected
+
+
+@pytest.mark.parametrize("sample, expected", [
+    ("Customer\tCurrent Sales\tTarget\na\t1,234\t1,000\n", ('\t', ',', '.')),
+    ('Customer,Current Sales,Target\na,"1,234.50","1,000"\nb,"(500)",20\n', (',', ',', '.')),
+    ("Customer;Current Sales;Target\na;1.234,50;1000\nb;2,5-;3\n", (';', '.', ',')),
+    ("Customer|Current Sales|Target\na|12.5|10\n", ('|', ',', '.')),
+])
+def test_sniff_text_format(tool, sample, expected):
+    assert tool.sniff_text_format(sample) == expected
+
+
+@pytest.mark.parametrize("text", [
+    'Customer,Current Sales,Target\na,"1,234.50","1,000"\nb,(500),2.5-\n',
+    "Customer;Current Sales;Target\na;1.234,50;1.000\nb;(500);2,5-\n",
+])
+def test_pasted_number_formats(load_text, text):
+    df, summary = load_text(text, "target")
+    assert summary.rejected == 0
+    assert df['Current Sales'].tolist() == [1234.5, -500]
+    assert df['Target'].tolist() == [1000, -2.5]
+
+
+def chunk_source():
+    # Rows with unparseable numbers (rejected) and zero denominators (no growth)
+    rng = np.random.default_rng(3)
+    rows = []
+    for i in range(200):
+        current, previous = rng.integers(0, 1000), rng.integers(0, 1000) * (i % 9 != 0)
+        rows.append([f"c{i}", "n/a" if i % 17 == 0 else f"{current}.25", previous, rng.choice(["N", "S"])])
+    return pd.DataFrame(rows, columns=["Customer", "Current Sales", "Previous Sales", "Region"])
+
+
+@pytest.mark.parametrize("source", ["paste", "xlsx"])
+@pytest.mark.parametrize("analysis_type", ["yoy", "target"])
+def test_chunked_summary_matches_a_single_pass(tool, task, tmp_path, monkeypatch, source, analysis_type):
+    frame = chunk_source()
+    if analysis_type == "target":
+        frame = frame.rename(columns={"Previous Sales": "Target"})
+    path = tmp_path / "export.xlsx"
+    frame.to_excel(path, index=False)
+
+    def load():
+        if source == "paste":
+            return tool.load_pasted_task(task, frame.to_csv(sep="\t", index=False), analysis_type)
+        return tool.load_file_task(task, str(path), analysis_type)
+
+    whole, whole_summary = load()
+    monkeypatch.setattr(tool, 'CHUNK_ROWS', 7)
+    chunked, summary = load()
+    # Category order follows the chunks the names first appear in
+    pd.testing.assert_frame_equal(chunked, whole, check_categorical=False)
+    state, whole_state = summary.state(), whole_summary.state()
+    assert state.pop('sums') == pytest.approx(whole_state.pop('sums'))
+    assert state == whole_state
+    # And both match the loaded rows
+    assert summary.count == len(whole) == 200 - 12 and summary.rejected == 12
+    assert [r['Row'] for r in summary.rejected_rows] == list(range(2, 202, 17))
+    direct = tool.RunningSummary(analysis_type)
+    direct.update(whole)
+    assert summary.sums == pytest.approx(direct.sums)
+    assert (summary.valid, summary.above, summary.below) == (direct.valid, direct.above, direct.below)
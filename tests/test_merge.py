@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+HEADER = "Customer\tCurrent Sales\tPrevious Sales\tRegion\n"
+
+
+def frame(load_text, rows):
+    return load_text(HEADER + "\n".join(rows), "yoy")[0]
+
+
+def by_customer(df):
+    return {str(c): (float(cur), float(prev), str(region)) for c, cur, prev, region
+            in zip(df['Customer'], df['Current Sales'], df['Previous Sales'], df['Region'])}
+
+
+def test_upsert_replaces_existing_and_appends_new(tool, load_text):
+    base = frame(load_text, ["a\t100\t90\tNorth", "b\t50\t60\tSouth"])
+    delta = frame(load_text, ["b\t70\t65\tEast", "c\t10\t5\tWest", "b\t80\t60\tEast"])
+    merged, added, removed = tool.merge_datasets(base, delta, "yoy", 'upsert')
+    # The last row of a repeated customer wins
+    assert by_customer(merged) == {'a': (100, 90, 'North'), 'b': (80, 60, 'East'),
+                                   'c': (10, 5, 'West')}
+    assert added['Customer'].astype(str).tolist() == ['b', 'c']
+    assert removed['Customer'].astype(str).tolist() == ['b']
+    assert float(removed['Current Sales'].iloc[0]) == 50
+
+
+def test_sum_adds_to_existing_customers(tool, load_text):
+    base = frame(load_text, ["a\t100\t90\tNorth", "b\t50\t60\tSouth"])
+    delta = frame(load_text, ["b\t10\t5\tEast", "b\t20\t5\tEast", "c\t1\t1\tWest"])
+    merged, added, removed = tool.merge_datasets(base, delta, "yoy", 'sum')
+    # Existing customers keep their dimensions
+    assert by_customer(merged) == {'a': (100, 90, 'North'), 'b': (80, 70, 'South'),
+                                   'c': (1, 1, 'West')}
+    assert np.isclose(merged['Current Sales'].sum(), base['Current Sales'].sum() + 31)
+    assert removed['Customer'].astype(str).tolist() == ['b']
+
+
+def test_missing_dimension_is_blank_for_new_customers(tool, load_text):
+    base = frame(load_text, ["a\t100\t90\tNorth"])
+    delta, _ = load_text("Customer\tCurrent Sales\tPrevious Sales\na\t110\t90\nz\t5\t5", "yoy")
+    merged, _, _ = tool.merge_datasets(base, delta, "yoy", 'upsert')
+    assert by_customer(merged) == {'a': (110, 90, 'North'), 'z': (5, 5, tool.DIMENSION_MISSING)}
+
+
+def test_time_series_upsert_replaces_same_date(tool, load_text):
+    header = "Customer\tDate\tSales\n"
+    base, _ = load_text(header + "a\t2024-01-05\t10\na\t2024-02-05\t20", "timeseries")
+    delta, _ = load_text(header + "a\t2024-02-05\t25\nb\t2024-02-06\t5", "timeseries")
+    merged, added, removed = tool.merge_datasets(base, delta, "timeseries", 'upsert')
+    assert sorted(merged['Sales'].tolist()) == [5, 10, 25]
+    assert len(added) == 2 and removed['Sales'].tolist() == [20]
+    summed, _, removed = tool.merge_datasets(base, delta, "timeseries", 'sum')
+    assert len(summed) == 4 and len(removed) == 0
+
+
+@pytest.mark.parametrize("update_from", [True, False])
+@pytest.mark.parametrize("mode", ['sum', 'upsert'])
+def test_database_merge_matches_memory(tool, load_text, tmp_path, monkeypatch, update_from, mode):
+    # Older SQLite libraries (< 3.33) merge without UPDATE ... FROM
+    monkeypatch.setattr(tool, 'SQLITE_UPDATE_FROM', update_from)
+    base = frame(load_text, ["a\t100\t90\tNorth", "b\t50\t60\tSouth", "d\t7\t0\tEast"])
+    delta = frame(load_text, ["b\t10\t5\tEast", "b\t20\t5\tEast", "c\t1\t1\tWest", "d\t3\t2\tEast"])
+    database = tool.SalesDatabase(str(tmp_path / "sales.db"))
+    for rows, write_mode in ((base, 'replace'), (delta, mode)):
+        writer = tool.DatabaseWriter(database, "test", "yoy", write_mode)
+        writer.write(rows)
+        dataset = writer.finish()
+    merged, _, _ = tool.merge_datasets(base, delta, "yoy", mode)
+    assert by_customer(dataset.preview(0, dataset.rows)) == by_customer(merged)
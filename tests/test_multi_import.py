@@ -0,0 +1,49 @@
+import pandas as pd
+import pytest
+
+
+def sheet(rows, region=True):
+    columns = ["Customer", "Current Sales", "Previous Sales"] + (["Region"] if region else [])
+    return pd.DataFrame([row[:len(columns)] for row in rows], columns=columns)
+
+
+@pytest.fixture
+def workbook(tmp_path):
+    path = tmp_path / "regions.xlsx"
+    with pd.ExcelWriter(path) as writer:
+        sheet([["a", 100, 90, "North"], ["b", 50, 60, "North"]]).to_excel(writer, sheet_name="North", index=False)
+        pd.DataFrame().to_excel(writer, sheet_name="Notes", index=False)   # blank tab
+        sheet([["c", 70, 70, "South"], ["d", "n/a", 5, "South"]]).to_excel(writer, sheet_name="South", index=False)
+    return path
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_sheets_and_files_are_concatenated_in_order(tool, task, workbook, tmp_path, jobs):
+    csv = tmp_path / "east.csv"
+    csv.write_text("Customer,Current Sales,Previous Sales,Region\ne,10,5,East\n")
+    df, summary = tool.load_files_task(task, [str(workbook), str(csv)], "yoy", jobs=jobs)
+    assert df['Customer'].astype(str).tolist() == ['a', 'b', 'c', 'e']
+    assert df['Current Sales'].tolist() == [100, 50, 70, 10]
+    assert df['Region'].astype(str).tolist() == ['North', 'North', 'South', 'East']
+    assert summary.count == 4 and summary.rejected == 1
+    assert summary.sums['Current Sales'] == 230
+    # Rejected rows name the sheet they came from
+    assert summary.rejected_rows[0]['Source'] == "regions.xlsx [South]"
+    assert summary.rejected_rows[0]['Row'] == 3
+
+
+def test_sheets_with_different_columns_are_rejected(tool, task, tmp_path):
+    path = tmp_path / "mixed.xlsx"
+    with pd.ExcelWriter(path) as writer:
+        sheet([["a", 100, 90, "North"]]).to_excel(writer, sheet_name="One", index=False)
+        sheet([["b", 50, 60]], region=False).to_excel(writer, sheet_name="Two", index=False)
+    with pytest.raises(tool.DataFormatError, match=r"mixed.xlsx \[Two\] does not have the same columns "
+                                                   r"as mixed.xlsx \[One\]"):
+        tool.load_files_task(task, [str(path)], "yoy", jobs=1)
+
+
+def test_a_single_csv_file_keeps_its_labels(tool, task, tmp_path):
+    csv = tmp_path / "one.csv"
+    csv.write_text("Customer,Current Sales,Previous Sales\na,1,1\nb,x,1\n")
+    df, summary = tool.load_files_task(task, [str(csv)], "yoy")
+    assert len(df) == 1 and 'Source' not in summary.rejected_rows[0]
@@ -0,0 +1,128 @@
+import types
+
+import pytest
+
+
+class FakeTree:
+    # The parts of ttk.Treeview the virtual view uses, as an ordered list
+    def __init__(self):
+        self.rows = []
+        self.values = {}
+        self.position = None
+
+    def get_children(self):
+        return tuple(self.rows)
+
+    def insert(self, parent, index, iid, values):
+        self.rows.insert(len(self.rows) if index == 'end' else index, iid)
+        self.values[iid] = values
+
+    def delete(self, *iids):
+        for iid in iids:
+            self.rows.remove(iid)
+            del self.values[iid]
+
+    def item(self, iid, values):
+        self.values[iid] = values
+
+    def yview_moveto(self, fraction):
+        self.position = fraction
+
+    def after_idle(self, callback):
+        callback()
+
+
+class FakeScrollbar:
+    def set(self, lo, hi):
+        self.range = (lo, hi)
+
+
+@pytest.fixture
+def view(tool, monkeypatch):
+    # Built without Tk: no display is needed for the window arithmetic
+    monkeypatch.setattr(tool, 'tk', types.SimpleNamespace(END='end'))
+    view = object.__new__(tool.VirtualTreeview)
+    view.tree, view.scrollbar = FakeTree(), FakeScrollbar()
+    view.row_count, view.fetch_rows, view.first = 0, None, 0
+    view.visible_rows, view.window, view._rendering = 20, (0, 0), False
+    return view
+
+
+def source(fetched):
+    def fetch(start, stop):
+        fetched.append((start, stop))
+        return [(f"row {i}",) for i in range(start, stop)]
+    return fetch
+
+
+def assert_window(view, start, stop):
+    assert view.window == (start, stop)
+    assert view.tree.rows == [str(i) for i in range(start, stop)]
+    assert all(view.tree.values[str(i)] == (f"row {i}",) for i in range(start, stop))
+
+
+def test_only_the_window_is_fetched_as_it_scrolls(view):
+    fetched = []
+    view.set_source(10000, source(fetched))
+    assert_window(view, 0, 70)
+    view.scroll_to(5000)   # no overlap: the window is replaced
+    assert_window(view, 4950, 5070)
+    view.scroll_to(5010)   # down: only the new rows at the bottom
+    assert_window(view, 4960, 5080)
+    view.scroll_to(4990)   # up: only the new rows at the top
+    assert_window(view, 4940, 5060)
+    assert fetched == [(0, 70), (4950, 5070), (5070, 5080), (4940, 4960)]
+    # The tree is scrolled to the top visible row within its window
+    assert view.tree.position == pytest.approx(50 / 120)
+    assert view.scrollbar.range == pytest.approx((0.499, 0.501))
+
+
+def test_scrollbar_commands_and_clamping(view):
+    view.set_source(1000, source([]))
+    view._on_scrollbar('moveto', '0.5')
+    assert view.first == 500
+    view._on_scrollbar('scroll', '1', 'pages')
+    assert view.first == 520
+    view._on_scrollbar('scroll', '-3', 'units')
+    assert view.first == 517
+    view.scroll_to(10 ** 6)
+    assert view.first == 980 and view.window == (930, 1000)
+    assert view.scrollbar.range == (0.98, 1.0)
+    view.scroll_to(-5)
+    assert view.first == 0 and view.window == (0, 70)
+
+
+def test_wheel_scrolling_moves_the_window_near_its_edge(view):
+    fetched = []
+    view.set_source(1000, source(fetched))
+    view.scroll_to(500)
+    # Tree scrolled to 10 rows above the end of the window
+    view._on_tree_scrolled(str((560 - 450) / 120), "1")
+    assert view.first == 560
+    assert_window(view, 510, 630)
+
+
+def test_update_source_reformats_changed_rows_in_the_window(view):
+    view.set_source(100, source([]))
+    view.update_source(110, lambda start, stop: [(f"new {i}",) for i in range(start, stop)],
+                       changed=[3, 60, 95])
+    assert view.tree.values['3'] == ("new 3",) and view.tree.values['60'] == ("new 60",)
+    assert view.tree.values['4'] == ("row 4",) and '95' not in view.tree.values
+    assert view.first == 0 and view.window == (0, 70)
+
+
+def test_format_preview_rows(tool, load_text):
+    df, _ = load_text("Customer\tCurrent Sales\tPrevious Sales\n"
+                      "a\t1234.4\t1000\nb\t50\t0\nc\t7\t14\n", "yoy")
+    formats = tool.PREVIEW_FORMATS["yoy"]
+    # Growth is calculated for the block only; rows past the end are left out
+    assert tool.format_preview_rows(df, formats, 0, 1) == [('a', '1,234', '1,000', '23.4%')]
+    assert tool.format_preview_rows(df, formats, 1, 5) == [('b', '50', '0', 'nan%'), ('c', '7', '14', '-50.0%')]
+    assert tool.format_preview_rows(df, formats, 3, 5) == []
+
+
+def test_tree_columns_match_the_preview_formats(tool):
+    # Every formatted preview value lands in a Treeview column
+    assert set(tool.TREE_COLUMNS) == set(tool.PREVIEW_FORMATS) == set(tool.ANALYSIS_COLUMNS)
+    for analysis_type, columns in tool.TREE_COLUMNS.items():
+        assert len(columns) == len(tool.PREVIEW_FORMATS[analysis_type])
@@ -0,0 +1,38 @@
+import numpy as np
+
+
+def test_zero_target_is_kept_and_flagged(tool, load_text):
+    df, summary = load_text("Customer\tCurrent Sales\tTarget\n"
+                            "a\t100\t0\n"
+                            "b\t80\t100\n"
+                            "c\tx\t100\n", "target")
+    assert df['Customer'].tolist() == ['a', 'b']
+    assert summary.rejected == 1
+    quality = tool.quality_flags(df, "target")
+    assert quality['flags'].tolist() == [tool.QUALITY_INVALID, 0]
+    assert quality['counts']['no Growth/Achievement'] == 1
+    # Left out of the average instead of making it infinite
+    assert summary.finalize(df)['Average Achievement'] == 80
+
+
+def test_zero_previous_sales_has_no_growth(tool, load_text):
+    df, _ = load_text("Customer\tCurrent Sales\tPrevious Sales\na\t100\t0\nb\t110\t100\n", "yoy")
+    values = tool.metric_values(df, "yoy")
+    assert np.isnan(values[0]) and np.isclose(values[1], 10)
+
+
+def test_outliers_and_duplicates(tool, load_text):
+    rows = [f"c{i}\t{100 + i % 7}\t100" for i in range(50)]
+    rows += ["big\t5000\t100", "C1 \t100\t100"]
+    df, _ = load_text("Customer\tCurrent Sales\tTarget\n" + "\n".join(rows), "target")
+    flags = tool.quality_flags(df, "target")['flags']
+    customers = df['Customer'].astype(str).tolist()
+    assert flags[customers.index('big')] & tool.QUALITY_OUTLIER
+    assert flags[customers.index('c1')] & tool.QUALITY_DUPLICATE
+    assert flags[customers.index('C1 ')] & tool.QUALITY_DUPLICATE
+    assert not flags[customers.index('c2')]
+
+
+def test_robust_outliers_fall_back_to_iqr(tool):
+    values = [1.0] * 6 + [2.0, 100.0, np.nan]
+    assert tool.robust_outliers(values).tolist() == [False] * 6 + [True, True, False]
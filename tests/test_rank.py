@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+ROWS = ("Customer\tCurrent Sales\tPrevious Sales\n"
+        "a\t100\t90\nb\t50\t60\nc\t70\t70\nd\t70\t0\n")
+
+
+@pytest.fixture
+def yoy(load_text):
+    return load_text(ROWS, "yoy")[0]
+
+
+def test_top_bottom_and_sorted_values(tool, yoy):
+    index = tool.RankIndex(yoy, "yoy")
+    customers = yoy['Customer'].astype(str).to_numpy()
+    assert customers[index.top('Current Sales', 3)].tolist() == ['a', 'c', 'd']
+    assert customers[index.bottom('Current Sales', 2)].tolist() == ['b', 'c']
+    assert index.top('Current Sales', -1).tolist() == []
+    # d has no Growth and is left out
+    assert np.allclose(index.sorted_values('Growth'), [-100 / 6, 0, 100 / 9])
+
+
+@pytest.mark.parametrize("column", ['Current Sales', 'Previous Sales', 'Growth'])
+@pytest.mark.parametrize("n", [0, 1, 2, 3, 5, 8])
+def test_bottom_matches_nsmallest(tool, load_text, column, n):
+    # Many ties, and Growth is NaN where Previous Sales is 0
+    rng = np.random.default_rng(n)
+    rows = [f"c{i}\t{rng.integers(0, 4)}\t{rng.integers(0, 3)}" for i in range(12)]
+    df, _ = load_text("Customer\tCurrent Sales\tPrevious Sales\n" + "\n".join(rows), "yoy")
+    values = pd.Series(tool.rank_values(df, column, "yoy"))
+    index = tool.RankIndex(df, "yoy")
+    assert index.bottom(column, n).tolist() == values.nsmallest(n).index.tolist()
+    assert index.top(column, n).tolist() == values.nlargest(n).index.tolist()
+
+
+def test_customer_ranks(tool, yoy):
+    index = tool.RankIndex(yoy, "yoy")
+    ranks = {column: (rank, value) for column, rank, _, value in index.customer_ranks('c')}
+    assert ranks['Current Sales'] == (2, 70)
+    assert ranks['Growth'] == (2, 0)
+    assert index.customer_ranks('zz') is None
+
+
+def test_unused_category_is_unknown(tool, yoy):
+    # Filtering keeps the categories of the dropped rows
+    kept = yoy[yoy['Customer'] != 'b'].reset_index(drop=True)
+    assert 'b' in kept['Customer'].cat.categories
+    assert tool.RankIndex(kept, "yoy").customer_ranks('b') is None
+
+
+def test_merged_index_matches_a_rebuilt_one(tool, yoy, load_text):
+    delta = load_text("Customer\tCurrent Sales\tPrevious Sales\nb\t120\t60\ne\t60\t30\n", "yoy")[0]
+    merged, added, removed = tool.merge_datasets(yoy, delta, "yoy", 'upsert')
+    index = tool.RankIndex(yoy, "yoy")
+    for column in tool.ranked_columns("yoy"):
+        index.top(column, 1)
+    patched = index.merged(merged, added, removed)
+    rebuilt = tool.RankIndex(merged, "yoy")
+    for column in tool.ranked_columns("yoy"):
+        assert patched.top(column, len(merged)).tolist() == rebuilt.top(column, len(merged)).tolist()
+        assert np.array_equal(patched.sorted_values(column), rebuilt.sorted_values(column))
+
+
+def test_database_ranks_match_memory(tool, yoy, tmp_path):
+    writer = tool.DatabaseWriter(tool.SalesDatabase(str(tmp_path / "sales.db")), "test", "yoy", 'replace')
+    writer.write(yoy)
+    dataset = writer.finish()
+    index = tool.RankIndex(yoy, "yoy")
+    for customer in ('a', 'b', 'c'):
+        memory, stored = index.customer_ranks(customer), dataset.customer_ranks(customer)
+        assert [r[:2] for r in memory] == [r[:2] for r in stored]
+        assert np.allclose([r[3] for r in memory], [r[3] for r in stored])
+    assert dataset.customer_ranks('zz') is None
+
+
+@pytest.mark.parametrize("side", ["Top", "Bottom"])
+def test_database_ranked_rows_match_memory(tool, load_text, tmp_path, side):
+    rows = [f"c{i}\t{i % 3}\t{i % 4}" for i in range(12)]
+    df, _ = load_text("Customer\tCurrent Sales\tPrevious Sales\n" + "\n".join(rows), "yoy")
+    writer = tool.DatabaseWriter(tool.SalesDatabase(str(tmp_path / "sales.db")), "test", "yoy", 'replace')
+    writer.write(df)
+    dataset = writer.finish()
+    index = tool.RankIndex(df, "yoy")
+    for column in ('Current Sales', 'Growth'):
+        positions = index.top(column, 10) if side == "Top" else index.bottom(column, 10)
+        stored = dataset.ranked(column, 10, side)['Customer'].tolist()
+        assert stored == df['Customer'].astype(str).to_numpy()[positions].tolist()
@@ -0,0 +1,94 @@
+import json
+
+import numpy as np
+import pytest
+
+
+def square(x0, y0, x1, y1):
+    return [[x0, y0], [x1, y0], [x1, y1], [x0, y1], [x0, y0]]
+
+
+def wiggly_ring(cx, cy, radius, n=400):
+    # Closed star-like ring with many edges, so regions get several bands
+    angle = np.linspace(0, 2 * np.pi, n, endpoint=False)
+    r = radius * (1 + 0.3 * np.sin(7 * angle))
+    ring = np.column_stack([cx + r * np.cos(angle), cy + r * np.sin(angle)])
+    return np.vstack([ring, ring[:1]]).tolist()
+
+
+FEATURES = [
+    {'type': 'Feature', 'properties': {'name': 'Holed'},
+     'geometry': {'type': 'Polygon', 'coordinates': [square(0, 0, 10, 10), square(3, 3, 7, 7)]}},
+    {'type': 'Feature', 'properties': {'NAME': 'Islands'},
+     'geometry': {'type': 'MultiPolygon', 'coordinates': [[square(20, 0, 25, 5)],
+                                                          [square(30, 0, 35, 5)]]}},
+    {'type': 'Feature', 'properties': {}, 'geometry': None},
+    {'type': 'Feature', 'properties': {'region': 'Star'},
+     'geometry': {'type': 'Polygon', 'coordinates': [wiggly_ring(50, 50, 8)]}},
+]
+
+
+@pytest.fixture
+def geojson(tmp_path):
+    path = tmp_path / "regions.geojson"
+    path.write_text(json.dumps({'type': 'FeatureCollection', 'features': FEATURES}), encoding='utf-8')
+    return str(path)
+
+
+def ray_cast(rings, x, y):
+    # Even-odd rule over all rings, one point at a time
+    inside = False
+    for ring in rings:
+        for (x1, y1), (x2, y2) in zip(ring[:-1], ring[1:]):
+            if (y1 > y) != (y2 > y) and x < x1 + (y - y1) * (x2 - x1) / (y2 - y1):
+                inside = not inside
+    return inside
+
+
+def test_read_geojson_regions(tool, geojson):
+    names, regions = tool.read_geojson_regions(geojson)
+    assert names == ['Holed', 'Islands', 'Star']
+    assert [len(rings) for rings in regions] == [2, 2, 1]
+
+
+def test_invalid_geojson_is_a_format_error(tool, tmp_path):
+    path = tmp_path / "broken.geojson"
+    path.write_text("{not json", encoding='utf-8')
+    with pytest.raises(tool.DataFormatError):
+        tool.read_geojson_regions(str(path))
+    path.write_text(json.dumps({'type': 'FeatureCollection', 'features': FEATURES[2:3]}), encoding='utf-8')
+    with pytest.raises(tool.DataFormatError):
+        tool.read_geojson_regions(str(path))
+
+
+def test_assign_matches_ray_casting(tool, geojson):
+    names, regions = tool.read_geojson_regions(geojson)
+    index = tool.RegionIndex.from_geojson(geojson)
+    rng = np.random.default_rng(5)
+    lon = np.concatenate([rng.uniform(-2, 62, 1500), [5, 1, 22, 32, 27]])
+    lat = np.concatenate([rng.uniform(-2, 62, 1500), [5, 1, 2, 2, 2]])
+    expected = np.array([next((i for i, rings in enumerate(regions) if ray_cast(rings, x, y)), -1)
+                         for x, y in zip(lon, lat)])
+    result = index.assign(lat, lon)
+    assert np.array_equal(result, expected)
+    # Hole, ring, both islands, the gap between them
+    assert result[-5:].tolist() == [-1, 0, 1, 1, -1]
+    assert index.bands[2] > 1
+
+
+def test_simplified_rings_stay_closed(tool):
+    ring = np.asarray(wiggly_ring(0, 0, 10, n=1000))
+    simple = tool.simplify_ring(ring, 0.2)
+    assert 4 <= len(simple) < len(ring)
+    assert np.array_equal(simple[0], simple[-1])
+    # Only original vertices are kept
+    assert {tuple(p) for p in simple} <= {tuple(p) for p in ring}
+    tiny = np.asarray(square(0, 0, 1, 1), dtype=float)
+    assert np.array_equal(tool.simplify_ring(tiny, 5), tiny)
+
+
+def test_region_geometry_is_the_simplified_rings(tool, geojson):
+    index = tool.RegionIndex.from_geojson(geojson)
+    holed = index.geometry(0)
+    assert holed['type'] == 'Polygon' and len(holed['coordinates']) == 2
+    assert all(ring[0] == ring[-1] for ring in index.geometry(2)['coordinates'])
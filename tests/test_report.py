@@ -0,0 +1,29 @@
+import os
+
+import pytest
+
+ROWS = ("Customer\tCurrent Sales\tPrevious Sales\tRegion\n"
+        + "\n".join(f"c{i}\t{100 + i}\t{90 + i % 13}\t{'North' if i % 2 else 'South'}" for i in range(40)))
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_pdf_pages_are_vector(tool, task, load_text, tmp_path, jobs):
+    df, _ = load_text(ROWS, "yoy")
+    path = str(tmp_path / "report.pdf")
+    _, pages = tool.export_report_task(task, df, "yoy", path, split_by='Region', jobs=jobs)
+    assert pages == 6
+    with open(path, 'rb') as f:
+        pdf = f.read()
+    assert pdf.count(b'/Type /Page\n') + pdf.count(b'/Type /Page ') + pdf.count(b'/Type /Page>') >= 6
+    # Charts are drawn as paths and text, not pasted in as page images
+    assert b'/Subtype /Image' not in pdf
+
+
+def test_html_pages_are_images(tool, task, load_text, tmp_path):
+    df, _ = load_text(ROWS, "yoy")
+    path = str(tmp_path / "report.html")
+    _, pages = tool.export_report_task(task, df, "yoy", path, jobs=1)
+    assets = sorted(os.listdir(tmp_path / "report_files"))
+    assert pages == 2 and assets == ['page_0001.png', 'page_0002.png']
+    with open(path, encoding='utf-8') as f:
+        assert "report_files/page_0002.png" in f.read()
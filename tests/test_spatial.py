@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+
+@pytest.fixture(scope="module")
+def points():
+    rng = np.random.default_rng(3)
+    n = 3000
+    lat = rng.uniform(-70, 70, n)
+    lon = rng.uniform(-180, 180, n)
+    # A cluster on both sides of the antimeridian
+    lon[:300] = rng.uniform(177, 180, 300) * rng.choice([-1, 1], 300)
+    lat[:300] = rng.uniform(-5, 5, 300)
+    return lat, lon, rng.uniform(0, 100, n)
+
+
+BOXES = [(-10, -20, 10, 20), (-5, 170, 5, -170), (-5, 175, 5, 185), (-5, -185, 5, -175),
+         (-90, -180, 90, 180), (-5, -400, 5, 400)]
+CIRCLES = [(0, 0, 2000), (0, 179.5, 300), (0, -179.9, 150), (60, 10, 5000)]
+
+
+def brute_box(lat, lon, south, west, north, east):
+    if east - west >= 360:
+        in_lon = np.ones(len(lon), dtype=bool)
+    else:
+        offset = (lon - west) % 360
+        in_lon = offset <= (east - west) % 360
+    return np.flatnonzero((lat >= south) & (lat <= north) & in_lon)
+
+
+@pytest.mark.parametrize("west, east, expected", [
+    (-20, 20, [(-20, 20)]),
+    (170, -170, [(170, 180), (-180, -170)]),
+    (175, 185, [(175, 180), (-180, -175)]),
+    (-185, -175, [(175, 180), (-180, -175)]),
+    (-400, 400, [(-180, 180)]),
+])
+def test_longitude_ranges(tool, west, east, expected):
+    assert tool.longitude_ranges(west, east) == expected
+
+
+@pytest.mark.parametrize("box", BOXES)
+def test_bbox_matches_brute_force(tool, points, box):
+    lat, lon, sales = points
+    result = tool.SpatialIndex(lat, lon, sales).bbox(*box)
+    assert sorted(result['positions'].tolist()) == brute_box(lat, lon, *box).tolist()
+
+
+@pytest.mark.parametrize("circle", CIRCLES)
+def test_radius_and_nearest_match_brute_force(tool, points, circle):
+    lat, lon, sales = points
+    index = tool.SpatialIndex(lat, lon, sales)
+    distances = tool.haversine_km(circle[0], circle[1], lat, lon)
+    result = index.radius(*circle)
+    assert sorted(result['positions'].tolist()) == np.flatnonzero(distances <= circle[2]).tolist()
+    assert np.all(np.diff(result['distances_km']) >= 0)
+    nearest = index.nearest(circle[0], circle[1], 25)
+    assert np.allclose(nearest['distances_km'], np.sort(distances)[:25])
+
+
+@pytest.fixture(scope="module")
+def stored(tool, points, tmp_path_factory):
+    lat, lon, sales = points
+    df = pd.DataFrame({'Customer': [f"c{i}" for i in range(len(lat))], 'Sales': sales,
+                       'Latitude': lat, 'Longitude': lon})
+    database = tool.SalesDatabase(str(tmp_path_factory.mktemp("db") / "sales.db"))
+    writer = tool.DatabaseWriter(database, "map", "map", 'replace')
+    writer.write(df)
+    return writer.finish()
+
+
+def stored_positions(rows):
+    return sorted(int(customer[1:]) for customer in rows['Customer'])
+
+
+@pytest.mark.parametrize("box", BOXES)
+def test_database_bbox_matches_memory(tool, points, stored, box):
+    lat, lon, sales = points
+    expected = tool.SpatialIndex(lat, lon, sales).bbox(*box)
+    result = stored.bbox(*box)
+    assert stored_positions(result['rows']) == sorted(expected['positions'].tolist())
+    assert result['total_sales'] == pytest.approx(expected['total_sales'])
+
+
+@pytest.mark.parametrize("circle", CIRCLES)
+def test_database_radius_matches_memory(tool, points, stored, circle):
+    lat, lon, sales = points
+    expected = tool.SpatialIndex(lat, lon, sales).radius(*circle)
+    result = stored.radius(*circle)
+    assert stored_positions(result['rows']) == sorted(expected['positions'].tolist())
+    assert np.allclose(result['distances_km'], expected['distances_km'])
@@ -0,0 +1,130 @@
+import threading
+import time
+
+import pytest
+
+
+class StubRoot:
+    # Stands in for the Tk root: after() queues the callback and pump() runs
+    # the queued ones on the test thread, as the main loop would
+    def __init__(self):
+        self.scheduled = []
+
+    def after(self, ms, callback):
+        self.scheduled.append(callback)
+
+    def pump(self, until, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        while not until():
+            assert time.monotonic() < deadline, "timed out waiting for the task runner"
+            callbacks, self.scheduled = self.scheduled, []
+            for callback in callbacks:
+                callback()
+            time.sleep(0.005)
+
+
+@pytest.fixture
+def root():
+    return StubRoot()
+
+
+@pytest.fixture
+def runner(tool, root):
+    runner = tool.TaskRunner(root)
+    yield runner
+    runner.shutdown()
+
+
+def callbacks():
+    seen = {'done': [], 'error': [], 'progress': []}
+    return seen, dict(on_done=seen['done'].append, on_error=seen['error'].append,
+                      on_progress=lambda task, fraction, message: seen['progress'].append((fraction, message)))
+
+
+def test_results_and_errors_reach_the_callbacks(runner, root):
+    seen, handlers = callbacks()
+    runner.submit('load', lambda task, x: x * 2, 21, **handlers)
+    root.pump(lambda: not runner.busy())
+    assert seen['done'] == [42]
+
+    def fail(task):
+        raise ValueError("bad data")
+    seen, handlers = callbacks()
+    runner.submit('load', fail, **handlers)
+    root.pump(lambda: not runner.busy())
+    assert seen['done'] == [] and str(seen['error'][0]) == "bad data"
+    # Polling stops once nothing is running
+    root.pump(lambda: not root.scheduled)
+
+
+def test_resubmit_supersedes_the_running_task(runner, root):
+    release = threading.Event()
+
+    def slow(task):
+        release.wait(5)
+        return "first"
+    first_seen, first = callbacks()
+    second_seen, second = callbacks()
+    old = runner.submit('load', slow, **first)
+    new = runner.submit('load', lambda task: "second", **second)
+    assert old.cancelled and not new.cancelled
+    root.pump(lambda: second_seen['done'])
+    # The superseded task's own outcome arrives later and is dropped
+    release.set()
+    deadline = time.monotonic() + 5
+    while runner.events.empty() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    root.pump(lambda: runner.events.empty())
+    assert second_seen['done'] == ["second"]
+    assert first_seen == {'done': [], 'error': [], 'progress': []}
+
+
+def test_cancel_drops_a_late_result(runner, root):
+    release = threading.Event()
+
+    def ignores_cancel(task):
+        release.wait(5)
+        return "late"
+    seen, handlers = callbacks()
+    runner.submit('load', ignores_cancel, **handlers)
+    runner.cancel('load')
+    release.set()
+    root.pump(lambda: not runner.busy())
+    assert seen['done'] == []
+    assert seen['progress'] == [(0, "Cancelled")]
+
+
+def test_progress_after_cancel_is_dropped(runner, root):
+    reported, release = threading.Event(), threading.Event()
+
+    def work(task):
+        task.report(0.3, "Reading...")
+        reported.set()
+        release.wait(5)
+        task.report(0.6, "Still reading...")   # raises TaskCancelled
+        return "never"
+    seen, handlers = callbacks()
+    runner.submit('load', work, **handlers)
+    assert reported.wait(5)
+    # The 0.3 report is still queued when the task is cancelled
+    runner.cancel('load')
+    release.set()
+    root.pump(lambda: not runner.busy())
+    assert seen['progress'] == [(0, "Cancelled")]
+    assert seen['done'] == []
+
+
+def test_progress_of_a_running_task(runner, root):
+    release = threading.Event()
+
+    def work(task):
+        task.report(0.5, "Halfway")
+        release.wait(5)
+        return "ok"
+    seen, handlers = callbacks()
+    runner.submit('load', work, **handlers)
+    root.pump(lambda: seen['progress'])
+    assert seen['progress'] == [(0.5, "Halfway")] and runner.running('load')
+    release.set()
+    root.pump(lambda: not runner.busy())
+    assert seen['done'] == ["ok"]
@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+
+@pytest.fixture(scope="module")
+def customers():
+    # Dense around Berlin plus a world-wide scatter
+    rng = np.random.default_rng(5)
+    lat = np.r_[rng.normal(52.5, 0.05, 3000), rng.uniform(-80, 80, 1000)]
+    lon = np.r_[rng.normal(13.4, 0.08, 3000), rng.uniform(-180, 180, 1000)]
+    sales = rng.integers(0, 10000, len(lat)).astype(np.float64)
+    return lat, lon, sales, np.array([f"c{i}" for i in range(len(lat))])
+
+
+@pytest.fixture(scope="module")
+def pyramid(tool, customers):
+    return tool.TilePyramid(*customers)
+
+
+def tile_xy(lat, lon, zoom):
+    # Independent Web Mercator tile numbering
+    n = 2 ** zoom
+    x = np.floor((lon + 180) / 360 * n).astype(int)
+    y = np.floor((1 - np.arcsinh(np.tan(np.radians(lat))) / np.pi) / 2 * n).astype(int)
+    return x, y
+
+
+def brute_force(customers, zoom, x, y):
+    lat, lon, _, _ = customers
+    tx, ty = tile_xy(lat, lon, zoom)
+    return np.flatnonzero((tx == x) & (ty == y))
+
+
+def berlin_tiles(customers, zooms):
+    lat, lon, _, _ = customers
+    return [(zoom,) + tuple(int(v[0]) for v in tile_xy(lat[:1], lon[:1], zoom)) for zoom in zooms]
+
+
+@pytest.mark.parametrize("zoom", [0, 4, 9, 13, 16, 18, 20])
+def test_tile_points_match_brute_force(tool, customers, pyramid, monkeypatch, zoom):
+    monkeypatch.setattr(tool, 'TILE_POINT_LIMIT', 10 ** 6)
+    lat, lon, sales, names = customers
+    for zoom, x, y in berlin_tiles(customers, [zoom]):
+        expected = brute_force(customers, zoom, x, y)
+        points = pyramid.tile(zoom, x, y)['points']
+        assert sorted(p[3] for p in points) == sorted(names[expected])
+        assert np.isclose(sum(float(p[4].replace(",", "")) for p in points), sales[expected].sum())
+
+
+@pytest.mark.parametrize("zoom", range(0, 18))
+def test_clusters_match_brute_force(tool, customers, pyramid, monkeypatch, zoom):
+    # Kept cluster levels, levels coarsened on request and the customers
+    # themselves (zoom 17 clusters at level 20)
+    monkeypatch.setattr(tool, 'TILE_POINT_LIMIT', 0)
+    lat, lon, sales, _ = customers
+    for zoom, x, y in berlin_tiles(customers, [zoom]):
+        inside = brute_force(customers, zoom, x, y)
+        code = int(tool.morton_codes(x, y))
+        start, stop = np.searchsorted(pyramid.codes, [code << 2 * (20 - zoom), (code + 1) << 2 * (20 - zoom)])
+        _, count, total, sum_lat, sum_lon = pyramid._cluster_level(code, zoom + 3, start, stop)
+        # Counts and sales add up to the tile's population
+        assert count.sum() == len(inside)
+        assert np.isclose(total.sum(), sales[inside].sum())
+        # One cluster per occupied cell three zoom levels down
+        cx, cy = tile_xy(lat[inside], lon[inside], zoom + 3)
+        cells = {}
+        for i, cell in zip(inside, zip(cx, cy)):
+            cells.setdefault(cell, []).append(i)
+        expected = sorted((len(v), round(lat[v].mean(), 6), round(lon[v].mean(), 6)) for v in cells.values())
+        clusters = pyramid.tile(zoom, x, y)['clusters']
+        assert sorted((n, la, ln) for la, ln, n, _ in clusters) == pytest.approx(expected)
+
+
+def test_only_strided_levels_are_kept(pyramid):
+    assert sorted(pyramid.levels) == [3, 6, 9, 12, 15, 18]
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+RESAMPLE = {"Monthly": "MS", "Quarterly": "QS", "Yearly": "YS"}
+
+
+@pytest.fixture(scope="module")
+def history(tool):
+    # May 2022 to March 2024 with an empty month (August 2023)
+    rng = np.random.default_rng(7)
+    dates = pd.to_datetime("2022-05-01") + pd.to_timedelta(rng.integers(0, 700, 600), unit="D")
+    dates = dates[(dates < "2023-08-01") | (dates >= "2023-09-01")]
+    customers = rng.choice(["a", "b", "c", "d", "e"], len(dates))
+    sales = rng.integers(1, 100, len(dates))
+    text = "Customer\tDate\tSales\n" + "\n".join(
+        f"{c}\t{d:%Y-%m-%d}\t{s}" for c, d, s in zip(customers, dates, sales))
+    df, _ = tool.load_pasted_task(tool.BackgroundTask('test', None), text, "timeseries")
+    return df
+
+
+def resampled(df, granularity):
+    return df.set_index('Date')['Sales'].astype(np.float64).resample(RESAMPLE[granularity]).sum()
+
+
+@pytest.mark.parametrize("granularity", ["Monthly", "Quarterly", "Yearly"])
+def test_period_totals_match_resample(tool, history, granularity):
+    view = tool.TimeSeriesCube(history).view(granularity)
+    expected = resampled(history, granularity)
+    assert np.allclose(view['totals'], expected.to_numpy())
+    assert len(view['labels']) == len(expected)
+    assert view['labels'][0] == {"Monthly": "2022-05", "Quarterly": "2022Q2", "Yearly": "2022"}[granularity]
+
+
+def test_latest_period_per_customer(tool, history):
+    view = tool.TimeSeriesCube(history).view("Monthly")
+    month = history['Date'].dt.to_period('M')
+    latest = history[month == pd.Period("2024-03")].groupby('Customer', observed=False)['Sales'].sum()
+    previous = history[month == pd.Period("2023-03")].groupby('Customer', observed=False)['Sales'].sum()
+    assert view['labels'][-1] == "2024-03" and view['previous_label'] == "2023-03"
+    assert np.allclose(view['latest'], latest.reindex(view['customers'], fill_value=0))
+    assert np.allclose(view['previous'], previous.reindex(view['customers'], fill_value=0))
+
+
+@pytest.mark.parametrize("granularity, per_year", [("Monthly", 12), ("Quarterly", 4)])
+def test_seasonal_and_year_to_date_growth(tool, history, granularity, per_year):
+    view = tool.TimeSeriesCube(history).view(granularity)
+    totals = resampled(history, granularity)
+    seasonal = totals.pct_change(per_year, fill_method=None) * 100
+    # Year-to-date restarts in January and compares with the same point a
+    # year earlier; 2022 was only recorded from May, so 2023 has no YTD growth
+    ytd = totals.groupby(totals.index.year).cumsum()
+    ytd_growth = (ytd / ytd.shift(per_year) - 1) * 100
+    ytd_growth[totals.index.year < 2024] = np.nan
+    metrics = view['metrics']
+    assert np.allclose(metrics['Seasonal YoY Growth'], seasonal, equal_nan=True)
+    assert np.allclose(metrics['YTD Growth'], ytd_growth, equal_nan=True)
+    # The first period of 2024 has a year-to-date of just itself
+    january = list(totals.index.year).index(2024)
+    assert np.isclose(metrics['YTD Growth'][january],
+                      (totals.iloc[january] / totals.iloc[january - per_year] - 1) * 100)
+    rolling = totals.rolling(per_year).sum()
+    assert np.allclose(metrics['Rolling Year Growth'], (rolling / rolling.shift(per_year) - 1) * 100,
+                       equal_nan=True)
+
+
+def test_trailing_sum_and_year_to_date(tool):
+    values = np.arange(1.0, 9.0)
+    assert np.allclose(tool.trailing_sum(values, 3), [np.nan, np.nan, 6, 9, 12, 15, 18, 21], equal_nan=True)
+    assert np.isnan(tool.trailing_sum(values, 9)).all()
+    # Quarters from the start of a year: restarts after four periods
+    assert tool.year_to_date(values, 0, 4).tolist() == [1, 3, 6, 10, 5, 11, 18, 26]
+    assert tool.period_growth(np.array([0.0, 5, 10]), 1)[1:].tolist()[1] == 100
+    assert np.isnan(tool.period_growth(np.array([0.0, 5, 10]), 1)[1])
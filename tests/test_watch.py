@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+YOY = "Customer,Current Sales,Previous Sales\n"
+
+
+@pytest.fixture
+def reload(tool, task, tmp_path):
+    path = tmp_path / "export.csv"
+
+    def reload(text, analysis_type="yoy", base=None):
+        path.write_text(text, encoding='utf-8')
+        if base is None:
+            return tool.watch_reload_task(task, str(path), analysis_type)
+        return tool.watch_reload_task(task, str(path), analysis_type, base['df'], base['hashes'])
+    return reload
+
+
+def customers(df):
+    return df['Customer'].astype(str).tolist()
+
+
+def test_changed_and_new_customers_are_merged(tool, reload):
+    base = reload(YOY + "a,100,90\nb,50,60\nc,70,70\n")
+    result = reload(YOY + "a,100,90\nb,55,60\nc,70,70\nd,10,5\n", base=base)
+    assert customers(result['added']) == ['b', 'd']
+    assert customers(result['removed']) == ['b']
+    assert customers(result['df']) == ['a', 'b', 'c', 'd']
+    assert result['df']['Current Sales'].tolist() == [100, 55, 70, 10]
+    assert np.array_equal(result['hashes'], tool.row_hashes(result['df']))
+
+
+def test_unchanged_file(reload):
+    base = reload(YOY + "a,100,90\nb,50,60\n")
+    result = reload(YOY + "b,50,60\na,100,90\n", base=base)
+    assert result['unchanged'] and result['df'] is base['df']
+
+
+@pytest.mark.parametrize("text", [
+    YOY + "a,100,90\nc,70,70\n",                      # b removed
+    YOY + "a,100,90\nb,50,60\nb,1,1\nc,70,70\n",      # b repeated
+    "Customer,Current Sales,Previous Sales,Region\na,100,90,N\nb,50,60,S\nc,70,70,N\n",
+])
+def test_other_changes_replace_the_dataset(reload, text):
+    base = reload(YOY + "a,100,90\nb,50,60\nc,70,70\n")
+    result = reload(text, base=base)
+    assert 'added' not in result and 'unchanged' not in result
+    assert len(result['df']) == text.count("\n") - 1
+
+
+def test_time_series_appends(reload):
+    header = "Customer,Date,Sales\n"
+    rows = "a,2024-01-05,10\nb,2024-01-06,20\n"
+    base = reload(header + rows, "timeseries")
+    result = reload(header + rows + "a,2024-02-01,5\n", "timeseries", base)
+    assert customers(result['added']) == ['a'] and len(result['removed']) == 0
+    assert result['df']['Sales'].tolist() == [10, 20, 5]
+    # An edited earlier row cannot be appended
+    edited = reload(header + "a,2024-01-05,11\nb,2024-01-06,20\n", "timeseries", base)
+    assert 'added' not in edited and edited['df']['Sales'].tolist() == [11, 20]
+
+
+def test_hashes_ignore_float32_or_float64_storage(tool, reload):
+    base = reload(YOY + "a,12.3,10.1\nb,5.5,4\n")
+    assert base['df']['Current Sales'].dtype == np.float32
+    # One value float32 cannot hold makes the whole column float64 ...
+    result = reload(YOY + "a,12.3,10.1\nb,5.5,4\nc,123456789.37,4\n", base=base)
+    # ... but only the new customer counts as changed
+    assert customers(result['added']) == ['c']
+    assert result['df']['Current Sales'].dtype == np.float64
+    # And changes in the float64 column are still seen to the cent
+    again = reload(YOY + "a,12.3,10.1\nb,5.5,4\nc,123456789.38,4\n", base=result)
+    assert customers(again['added']) == ['c']